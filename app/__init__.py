@@ -1,9 +1,16 @@
 import os
 import signal
-from typing import Tuple
+import sys
+from typing import Tuple, List
 from uuid import UUID
 
-from corvus.shared.endpoint import Endpoint, Task
+from corvus.app.executors import ProcessExecutor
+from corvus.app.workers import WorkerPool
+from corvus.shared.alpha import ActionType
+from corvus.shared.com import unix
+from corvus.shared.com.unix import UnixServer
+from corvus.shared.endpoint import Endpoint, Task, parse_vertex_addrs
+from corvus.shared.logging import log_warning
 from corvus.vertex.main import Vertex
 
 
@@ -12,35 +19,150 @@ class App(Endpoint):
     An endpoint that is designed to run user code. It provides additional tools to make common endpoint actions simpler
     """
 
-    def __init__(self, name: str):
-        super().__init__(name, self.run_task_from_flow)
+    def __init__(self, name: str, local_guard: str="copy", max_pending: int=None, queue_capacity: int=None,
+                 workers: int=None, pipelines: bool=False):
+        """
+        :param queue_capacity: optional, also run calls queued for this App at the vertex, this many at a time
+        :param workers: optional, run the tasks of this App in this many worker processes behind its one address,
+                        see WorkerPool
+        :param pipelines: run pipeline stages and submit pipelines, see Endpoint.serve_pipelines()
+        """
+        super().__init__(name, self.run_task_from_flow, local_guard, max_pending)
+
+        # a node binds the App's Unix domain socket and passes it down, so the process that replaces this one on a
+        # restart takes over the same socket without refusing a connection
+        listener = unix.inherited_listener()
+        if listener is not None:
+            self.server.unix_server = UnixServer(self.server.handle_binary, listener=listener)
+
+        self.queue_capacity = queue_capacity
+        self.workers = WorkerPool(workers) if workers is not None else None
+        self._process_executors = []
         self.add_task(Task(self._options, {}, "options"))
-        self.node_uuid = None
+        self.add_task(Task(self._metrics, {}, "metrics"))
 
-    def task(self, name=None, **resources):
-        """Decorator that adds the given function as a task on this App"""
-        return lambda f: self.add_task(Task(f, resources, name))
+        if pipelines:
+            self.serve_pipelines()
+
+    def task(self, name=None, max_pending=None, coerce=False, executor="thread", workers=None, **resources):
+        """
+        Decorator that adds the given function as a task on this App
+
+        :param executor: "thread" runs the task in the thread that took the call, "process" runs it in a pool of
+                         processes, for CPU-bound tasks, see ProcessExecutor
+        :param workers: the number of processes of a "process" task, the number of cpus by default
+        """
+        if executor not in ("thread", "process"):
+            raise ValueError("executor must be 'thread' or 'process'")
+
+        def add(f):
+            if executor == "process":
+                f = ProcessExecutor(f, workers if workers is not None else os.cpu_count(), self.name)
+                self._process_executors.append(f)
+
+            task = Task(f, resources, name, max_pending, coerce)
+            self.add_task(task)
+            self.server.forwarded.add(task.name)  # only run by the workers, if there are any
+        return add
 
     def start(self):
         vertex_addr, self.node_uuid = self._startup()
 
         """Runs the app locally"""
-        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGTERM, self._terminate)
+
+        if self.workers is not None:
+            # the workers accept on the App's Unix domain socket, this process only passes its TCP calls on to it
+            unix_server = self.server.unix_server
+            unix_server.accept = False
+            self.workers.fork(self, vertex_addr, unix_server.listen())
+            self.server.forward = self.workers.forward
 
         super().setup(vertex_addr)
 
+        if self.workers is not None:
+            self.workers.start(self.address, self.node_uuid, self.server.get_socket_path())
+
         data = {
             "name": self.name,
             "resources": {},
             "host": self.address[0],
             "port": self.address[1],
-            "node": self.node_uuid
+            "node": self.node_uuid,
+            "socket_path": self.server.get_socket_path()
         }
         self.vertex_send("vertex/connect_endpoint", data)
 
         super().start()
 
-    def _startup(self) -> Tuple[Tuple[str, int], UUID]:
+        if self.queue_capacity is not None:
+            self.serve_queue(self.queue_capacity)
+
+        node_addr = os.environ.get("CORVUS_NODE_ADDR", None)
+        if node_addr is not None:
+            # the node waits for this before it stops the process this one replaces
+            host, port = node_addr.rsplit(":", 1)
+            data = {"name": self.name, "token": os.environ.get("CORVUS_APP_TOKEN", None)}
+            self._direct_connection((host, int(port))).send(ActionType("node", "app_ready"), data)
+
+    def drain(self, timeout: float=10.0) -> bool:
+        """
+        Stop the App without failing calls: take it out of the vertex so no new callers find it, answer requests that
+        still arrive with DRAINING so the caller moves to another replica, and wait for the calls in flight to finish
+
+        :param timeout: seconds to wait for the calls in flight
+        :return: False if calls were still in flight when the timeout passed
+        """
+        data = {"name": self.name, "host": self.address[0], "port": self.address[1]}
+
+        try:
+            self.vertex_send("vertex/disconnect_endpoint", data)
+        except (ConnectionError, OSError) as e:
+            log_warning("Could not remove '{}' from the vertex: {}", self.name, e)
+
+        # new connections on a socket passed down by the node go to the process that replaces this one
+        if self.server.unix_server is not None:
+            self.server.unix_server.stop_accepting()
+
+        drained = self.server.drain(timeout)
+        self.stop()
+
+        return drained
+
+    def stop(self):
+        super().stop()
+
+        if self.workers is not None:
+            self.workers.stop()
+
+        for executor in self._process_executors:
+            executor.shutdown()
+
+    def _metrics(self) -> dict:
+        """The App's metrics, with the counters of its workers added in and their own metrics under 'workers'"""
+        metrics = self.get_metrics()
+
+        if self.workers is not None:
+            workers = self.workers.send_all("metrics", {})
+
+            for worker in workers:
+                for key, value in worker.items():
+                    if isinstance(value, (int, float)):
+                        metrics[key] += value
+
+            metrics["workers"] = workers
+
+        return metrics
+
+    def _terminate(self, signum, frame):
+        timeout = float(os.environ.get("CORVUS_DRAIN_TIMEOUT", 10))
+
+        if not self.drain(timeout):
+            log_warning("'{}' stopped with calls still in flight after {}s", self.name, timeout)
+
+        sys.exit(0)
+
+    def _startup(self) -> Tuple[List[Tuple[str, int]], UUID]:
         node_uuid = os.environ.get("CORVUS_NODE_UUID", None)
         vert_str = os.environ.get("CORVUS_VERTEX_ADDR", None)
 
@@ -48,11 +170,10 @@ class App(Endpoint):
             # program ran without a vertex passed in, so the App will make a vertex to connect to
             vertex = Vertex(9000)
             vertex.start()
-            vert_addr = vertex.address
-            os.environ["CORVUS_VERTEX_ADDR"] = "{}:{}".format(*vert_addr)
+            vert_addr = [vertex.address]
+            os.environ["CORVUS_VERTEX_ADDR"] = "{}:{}".format(*vertex.address)
         else:
-            host, port = tuple(vert_str.split(":"))
-            vert_addr = (host, int(port))
+            vert_addr = parse_vertex_addrs(vert_str)
 
         # if node_uuid is None:
             # no parent node, so we're going to have to start up the other apps
@@ -0,0 +1,135 @@
+import functools
+import itertools
+import json
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from corvus.shared.objects import ObjectStore
+
+# arguments and results at least this big, serialized, are passed through the object store instead of the pool's pipes
+SHARED_MIN_SIZE = 64 * 1024
+
+_executors = {}  # type: Dict[int, ProcessExecutor]
+_keys = itertools.count()
+
+
+class ProcessExecutor:
+    """
+        Runs a task in a pool of processes that is kept for the life of the App, so CPU-bound tasks are not run behind
+        the GIL of the App. The processes are forked, so the task does not have to be importable or picklable
+
+        Arguments and results that can be sent as JSON, as they would be in a Flow, are serialized once. Big ones are
+        written to the object store of the node, which is in shared memory, and read back through mmap on the other
+        side. Values that are not JSON, like bytes or objects, are pickled. Values that are sent as JSON come back the
+        way a Flow would deliver them: tuples become lists, and dict keys that are not strings become strings
+
+    :param function: the task
+    :param workers: how many processes run the task
+    :param name: used for the store's directory when the App was not started by a node
+    """
+
+    def __init__(self, function: Callable, workers: int, name: str):
+        if workers <= 0:
+            raise ValueError("workers for a process task must be > 0")
+
+        self.function = function
+        self.workers = workers
+        self.name = name
+
+        self._key = next(_keys)
+        _executors[self._key] = self
+
+        self._store = None  # type: Optional[ObjectStore]
+        self._owns_store = False
+        self._pool = None  # type: Optional[ProcessPoolExecutor]
+        self._pool_pid = None
+        self._lock = threading.Lock()
+
+        # Task reads the signature and doc of the task through this
+        functools.update_wrapper(self, function)
+
+    def __call__(self, **kwargs) -> Any:
+        store = self._get_store()
+        payload = _pack(kwargs, store)
+        pool = self._get_pool()
+
+        try:
+            return _unpack(pool.submit(_run, self._key, payload).result(), store)
+        except BrokenProcessPool:
+            # a process died, the next call starts a new pool, the processes left in this one are let go
+            with self._lock:
+                if self._pool is pool:
+                    self._pool = None
+            pool.shutdown(wait=False)
+            raise
+        finally:
+            if payload[0] == "object":
+                store.delete(payload[1])  # already read by the child, unless it died first
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        # a pool can only be used by the process that made it, App workers make their own
+        with self._lock:
+            if self._pool is None or self._pool_pid != os.getpid():
+                self._pool = ProcessPoolExecutor(self.workers, multiprocessing.get_context("fork"))
+                self._pool_pid = os.getpid()
+
+            return self._pool
+
+    def _get_store(self) -> ObjectStore:
+        with self._lock:
+            if self._store is None:
+                self._store = ObjectStore.from_environ()
+
+                if self._store is None:
+                    self._store = ObjectStore.create("{}-{}".format(self.name, os.getpid()))
+                    self._owns_store = True
+
+            return self._store
+
+    def shutdown(self) -> None:
+        if self._pool is not None and self._pool_pid == os.getpid():
+            self._pool.shutdown()
+            self._pool = None
+
+        if self._owns_store:
+            self._store.destroy()
+            self._store = None
+            self._owns_store = False
+
+
+def _run(key: int, payload: Tuple[str, Any]) -> Tuple[str, Any]:
+    """Runs in a process of the pool"""
+    executor = _executors[key]
+    store = executor._get_store()
+
+    return _pack(executor.function(**_unpack(payload, store)), store)
+
+
+def _pack(value: Any, store: ObjectStore) -> Tuple[str, Any]:
+    try:
+        data = json.dumps(value).encode()
+    except (TypeError, ValueError):
+        return "pickle", value
+
+    if len(data) < SHARED_MIN_SIZE:
+        return "json", data
+
+    return "object", store.put_bytes(data)
+
+
+def _unpack(payload: Tuple[str, Any], store: ObjectStore) -> Any:
+    kind, value = payload
+
+    if kind == "pickle":
+        return value
+
+    if kind == "object":
+        object_id = value
+        value = store.get_bytes(object_id)
+        store.delete(object_id)  # results are deleted here, arguments again by the parent in case the child died
+
+    return json.loads(value.decode())
@@ -0,0 +1,146 @@
+import multiprocessing
+import os
+import signal
+import socket
+import sys
+import threading
+import time
+from typing import Any, List, Tuple
+
+from corvus.shared.alpha.errors import RemoteException
+from corvus.shared.com.unix import UnixServer
+from corvus.shared.endpoint import EndpointClient, EndpointClientConnection, VertexConnection
+
+AVAILABLE = hasattr(os, "fork")
+
+
+class WorkerPool:
+    """
+        Worker processes forked from an App, that all accept on the App's Unix domain socket, so the kernel spreads
+        the connections of callers on the same machine over them. Calls that reach the App over TCP are passed on
+        through the same socket. The App keeps its one address and its one registration with the vertex, so
+        CPU-bound tasks use a core per worker while callers see a single replica
+
+        The workers are forked after the App has bound its Unix domain socket and before it opens any other sockets,
+        and get its address once it is known, so tasks in a worker can make calls and put objects as the App. The
+        App's own tasks, like metrics, are passed back to the App from the workers
+
+    :param count: how many worker processes to run
+    """
+
+    def __init__(self, count: int):
+        if not AVAILABLE:
+            raise ValueError("App workers need os.fork(), which this platform does not have")
+
+        if count <= 0:
+            raise ValueError("App workers must be > 0")
+
+        self.count = count
+
+        self._context = multiprocessing.get_context("fork")
+        self._processes = []  # type: List[multiprocessing.Process]
+        self._pipes = []
+        self._client = None
+        self._connection = None  # type: EndpointClientConnection
+        self._lock = threading.Lock()
+        self._started = threading.Event()
+
+    def fork(self, app, vertex_addr: List[Tuple[str, int]], listener: socket.socket) -> None:
+        """Start the worker processes, they serve the listener once they have the App's address from start()"""
+        for _ in range(self.count):
+            parent_pipe, child_pipe = self._context.Pipe()
+
+            process = self._context.Process(target=_run_worker, args=(app, vertex_addr, listener, child_pipe),
+                                            name="{} worker".format(app.name), daemon=True)
+            process.start()
+
+            self._processes.append(process)
+            self._pipes.append(parent_pipe)
+
+    def start(self, address: Tuple[str, int], node_uuid: str, path: str) -> None:
+        """Give every worker the address of the App, and connect to the socket they serve once they are serving"""
+        for pipe in self._pipes:
+            pipe.send((address, node_uuid))
+
+        for pipe in self._pipes:
+            pipe.recv()  # the worker is serving
+
+        self._client = EndpointClient()
+        self._connection = self._client.connect_unix(path)
+        self._started.set()
+
+    def forward(self, data: bytes) -> bytes:
+        """Pass an encoded request on to whichever worker accepts it, and return its encoded response"""
+        self._started.wait()  # the App is serving before its workers are
+        return self._connection.send_bytes(data)
+
+    def send_all(self, task: str, data: dict) -> List[Any]:
+        """Run a task on every worker, and return their results"""
+        results = []
+
+        with self._lock:
+            for pipe in self._pipes:
+                pipe.send((task, data))
+                results.append(pipe.recv())
+
+        for ok, result in results:
+            if not ok:
+                raise RemoteException.create(**result)
+
+        return [result for _, result in results]
+
+    def stop(self) -> None:
+        """Stop the workers, each finishes the calls it has first, see CORVUS_DRAIN_TIMEOUT"""
+        for process in self._processes:
+            process.terminate()
+
+        timeout = float(os.environ.get("CORVUS_DRAIN_TIMEOUT", 10))
+        for process in self._processes:
+            process.join(timeout + 5)
+
+        if self._client is not None:
+            self._client.close()
+
+        self._processes = []
+        self._pipes = []
+        self._connection = None
+
+
+def _run_worker(app, vertex_addr: List[Tuple[str, int]], listener: socket.socket, pipe) -> None:
+    app.workers = None
+    app.address, app.node_uuid = pipe.recv()
+    app.vertex = VertexConnection(app.client, vertex_addr)
+
+    # the App runs its own tasks, a worker only runs the tasks that were added with App.task()
+    app.server.forwarded = set(app._tasks) - app.server.forwarded
+    app.server.forward = EndpointClient().connect(app.address).send_bytes
+
+    server = UnixServer(app.server.handle_binary, listener=listener)
+    app.server.unix_server = server
+
+    def terminate(signum, frame):
+        # the App's handler deregisters the App, a worker is stopped by the App and only finishes its calls
+        server.stop_accepting()
+        app.server.drain(float(os.environ.get("CORVUS_DRAIN_TIMEOUT", 10)))
+        sys.exit(0)
+
+    signal.signal(signal.SIGTERM, terminate)
+
+    server.open()
+    pipe.send(True)
+
+    try:
+        # exit with the App, also when it was killed and could not stop its workers
+        parent = os.getppid()
+        while os.getppid() == parent:
+            if not pipe.poll(1):
+                continue
+
+            task, data = pipe.recv()
+
+            try:
+                pipe.send((True, app.run_task(task, **data)))
+            except Exception as e:
+                pipe.send((False, RemoteException.from_exception(e).to_dict()))
+    finally:
+        server.close()
@@ -3,16 +3,23 @@ from typing import List
 
 
 class AppData:
-    def __init__(self, name, command, cwd):
+    def __init__(self, name, command, cwd, script=None):
         self.name = name
         self.command = command
         self.cwd = cwd
+        self.script = script  # python file to fork from the ForkServer, when fork_server is enabled
 
 
 # TODO make a config
 class NodeConfig:
-    def __init__(self, app_datas: List[AppData]):
+    def __init__(self, app_datas: List[AppData], fork_server: bool=False, preload: List[str]=None,
+                 object_memory: int=256 * 1024 * 1024, report_interval: float=5.0, drain_timeout: float=10.0):
         self.app_datas = app_datas
+        self.fork_server = fork_server
+        self.preload = preload if preload is not None else []
+        self.object_memory = object_memory  # bytes of objects kept in memory before they are spilled to disk
+        self.report_interval = report_interval  # seconds between load reports to the vertex, 0 to not report
+        self.drain_timeout = drain_timeout  # seconds a stopping app gets to finish the calls it has
 
     @staticmethod
     def from_json_file(path: str):
@@ -22,6 +29,8 @@ class NodeConfig:
             config_data = json.load(file)
 
         for app in config_data["apps"]:
-            app_datas.append(AppData(app["name"], app["command"], app["cwd"]))
+            app_datas.append(AppData(app["name"], app["command"], app["cwd"], app.get("script", None)))
 
-        return NodeConfig(app_datas)
+        return NodeConfig(app_datas, config_data.get("fork_server", False), config_data.get("preload", None),
+                          config_data.get("object_memory", 256 * 1024 * 1024),
+                          config_data.get("report_interval", 5.0), config_data.get("drain_timeout", 10.0))
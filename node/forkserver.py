@@ -0,0 +1,184 @@
+import multiprocessing
+import os
+import runpy
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from multiprocessing import forkserver
+from typing import Callable, Dict, List, Optional
+
+CORVUS_PRELOAD = ["corvus.shared.endpoint", "corvus.app", "parseltongue"]
+
+
+class ForkedProcess:
+    """
+    Wrapper around a forked multiprocessing.Process that exposes the subset of subprocess.Popen used by AppProcess
+    """
+
+    def __init__(self, process: multiprocessing.Process):
+        self.process = process
+
+    @property
+    def pid(self) -> int:
+        return self.process.pid
+
+    @property
+    def returncode(self) -> int:
+        return self.process.exitcode
+
+    def poll(self) -> int:
+        return self.process.exitcode
+
+    def terminate(self) -> None:
+        self.process.terminate()
+
+    def kill(self) -> None:
+        self.process.kill()
+
+    def wait(self, timeout: float=None) -> int:
+        self.process.join(timeout)
+
+        if self.process.exitcode is None:
+            raise subprocess.TimeoutExpired(self.process.name, timeout)
+
+        return self.process.exitcode
+
+
+class ForkServer:
+    """
+    Keeps a template process with Corvus, parseltongue and the user's modules already imported. Apps are forked from
+    the template instead of starting a fresh interpreter, so they skip interpreter startup and most of their imports.
+    """
+
+    def __init__(self, preload: List[str]=None, paths: List[str]=None):
+        self.preload = CORVUS_PRELOAD + (preload if preload is not None else [])
+        self.paths = paths if paths is not None else []
+        self._context = multiprocessing.get_context("forkserver")
+
+    def open(self) -> None:
+        """Start the template process, this imports all preloaded modules once"""
+
+        # the template process copies sys.path from this process, user modules must be importable from it
+        for path in self.paths:
+            path = os.path.abspath(path)
+            if path not in sys.path:
+                sys.path.append(path)
+
+        self._context.set_forkserver_preload(self.preload)
+        forkserver.ensure_running()
+
+    def fork(self, target: Callable, *args) -> ForkedProcess:
+        """Fork a new process from the template that runs target(*args)"""
+        process = self._context.Process(target=target, args=args, daemon=False)
+        process.start()
+        return ForkedProcess(process)
+
+    def spawn(self, script: str, cwd: str, env: Dict[str, str], listener: socket.socket=None) -> ForkedProcess:
+        """
+        Fork a new process from the template that runs script as __main__, as if it was run with python
+
+        :param listener: a socket to pass down to the process, multiprocessing sends it to the template, see
+                         corvus.shared.com.unix.inherited_listener()
+        """
+        return self.fork(_run_script, script, cwd, env, listener)
+
+
+def _run_script(script: str, cwd: str, env: Dict[str, str], listener: Optional[socket.socket]=None) -> None:
+    os.chdir(cwd)
+    os.environ.update(env)
+
+    if listener is not None:
+        # the socket arrives under another fd, it is detached so it stays open for the script to pick up
+        os.environ["CORVUS_LISTEN_FD"] = str(listener.detach())
+
+    path = os.path.abspath(script)
+    sys.argv = [path]
+    sys.path.insert(0, os.path.dirname(path))
+
+    runpy.run_path(path, run_name="__main__")
+
+
+BENCHMARK_APP = """
+import time
+
+from corvus.app import App
+
+app = App("benchmark")
+
+
+@app.task()
+def ping():
+    return "pong"
+
+
+app.start()
+
+while True:
+    time.sleep(1)
+"""
+
+
+def benchmark(runs: int=20) -> None:
+    """
+    Time how long a Node takes to start an App until the App is registered with the vertex and ready for calls, when it
+    is started as a fresh interpreter (exec) and when it is forked from the template (fork)
+    """
+    from corvus.node.config import AppData, NodeConfig
+    from corvus.node.node import Node
+    from corvus.vertex.main import Vertex
+
+    # an App started with exec imports Corvus the way this process did
+    os.environ["PYTHONPATH"] = os.pathsep.join(path for path in sys.path if path)
+
+    with tempfile.TemporaryDirectory() as directory:
+        script = os.path.join(directory, "benchmark_app.py")
+        with open(script, "w") as file:
+            file.write(BENCHMARK_APP)
+
+        vertex = Vertex(0)
+        vertex.start()
+
+        app_data = AppData("benchmark", "{} {}".format(sys.executable, script), directory, script)
+        config = NodeConfig([app_data], fork_server=True, report_interval=0, drain_timeout=1.0)
+        node = Node(config, [vertex.address])
+        node.open()
+
+        fork_server = node.fork_server
+        app = node.apps[0]
+        times = {}
+
+        try:
+            for mode, server in (("exec", None), ("fork", fork_server)):
+                node.fork_server = server
+                times[mode] = []
+
+                for _ in range(runs):
+                    start = time.perf_counter()
+                    app.start()
+
+                    if not app.ready.wait(60):
+                        raise Exception("The benchmark App was not ready after 60s")
+
+                    times[mode].append(time.perf_counter() - start)
+                    app.stop()
+        finally:
+            node.fork_server = fork_server
+            node.stop()
+            vertex.stop()
+
+    def report(name, samples):
+        samples = sorted(samples)
+        print("{:<6} mean {:8.2f}ms   median {:8.2f}ms   min {:8.2f}ms   max {:8.2f}ms".format(
+            name, 1000 * sum(samples) / len(samples), 1000 * samples[len(samples) // 2], 1000 * samples[0],
+            1000 * samples[-1]))
+
+    print("App start until ready over {} runs".format(runs))
+    report("exec", times["exec"])
+    report("fork", times["fork"])
+    print("speedup {:.1f}x".format(sum(times["exec"]) / sum(times["fork"])))
+
+
+if __name__ == '__main__':
+    benchmark(int(sys.argv[1]) if len(sys.argv) > 1 else 20)
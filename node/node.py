@@ -1,13 +1,23 @@
 import atexit
 import os
+import signal
 import subprocess
 import sys
 import socket
+import threading
 import time
 from enum import Enum
+from typing import List
+from uuid import uuid4
 
 from corvus.node.config import NodeConfig
-from corvus.shared.endpoint import Endpoint
+from corvus.node.forkserver import ForkServer
+from corvus.node.resources import ResourceSampler, child_pids, static_resources, changes
+from corvus.shared.com import unix
+from corvus.shared.endpoint import Endpoint, Task, DeadlineExceededError, parse_vertex_addrs, format_vertex_addrs
+from corvus.shared.logging import log_warning
+from corvus.shared.objects import ObjectStore
+from corvus.tools.triggers import TimerScheduler
 
 
 class AppProcess:
@@ -23,34 +33,147 @@ class AppProcess:
         self.app_data = app_data
         self.cwd = app_data.cwd
 
+        # set when the app has registered with the vertex and is taking calls, the token tells the process that was
+        # started last apart from the one it replaces
+        self.ready = threading.Event()
+        self.token = None
+
+        # the app's Unix domain socket, every process of the app inherits it so a restart never refuses a connection
+        self.listener = None
+
     def start(self):
-        env = os.environ
-        env.update({
+        self.token = uuid4().hex
+
+        app_env = {
             "CORVUS_NODE_UUID": self.node.uid,
-            "CORVUS_VERTEX_ADDR": "{}:{}".format(*self.node.vert_addr)
-        })
+            "CORVUS_VERTEX_ADDR": format_vertex_addrs(self.node.vert_addr),
+            "CORVUS_NODE_ADDR": "{}:{}".format(*self.node.address),
+            "CORVUS_DRAIN_TIMEOUT": str(self.node.config.drain_timeout),
+            "CORVUS_APP_TOKEN": self.token
+        }
+        app_env.update(self.node.objects.environ())
+
+        if self.listener is None and unix.AVAILABLE:
+            self.listener = unix.listen()
+
+        start = time.perf_counter()
+        self.ready.clear()
+
+        if self.node.fork_server is not None and self.app_data.script is not None:
+            self.process = self.node.fork_server.spawn(self.app_data.script, self.cwd, app_env, self.listener)
+            mode = "fork"
+        else:
+            env = dict(os.environ)
+            env.update(app_env)
+
+            fds = ()
+            if self.listener is not None:
+                env["CORVUS_LISTEN_FD"] = str(self.listener.fileno())
+                fds = (self.listener.fileno(),)
 
-        self.process = subprocess.Popen([self.app_data.command], shell=True, env=env, cwd=self.cwd)
+            self.process = subprocess.Popen([self.app_data.command], shell=True, env=env, cwd=self.cwd, pass_fds=fds)
+            mode = "exec"
+
+        print("Started '{}' ({}) in {:.2f}ms".format(self.name, mode, 1000 * (time.perf_counter() - start)))
 
     def stop(self) -> int:
-        self.process.terminate()
+        code = self._stop_process(self.process)
+        self.process = None
+
+        return code
+
+    def restart(self, timeout: float=30.0) -> bool:
+        """
+            Replace the process without dropping calls. The new process is started next to the old one, and only once
+            it has registered with the vertex is the old one sent SIGTERM, which makes it leave the vertex and finish
+            the calls it has before it exits
+
+        :param timeout: seconds to wait for the new process to be ready
+        :return: False if the new process did not get ready, it is stopped and the old one keeps running
+        """
+        old = self.process
+        self.start()
+
+        if not self.ready.wait(timeout):
+            log_warning("'{}' was not ready after {}s, keeping the running process", self.name, timeout)
+            self._stop_process(self.process)
+            self.process = old
+            self.ready.set()
+            return False
 
+        if old is not None:
+            self._stop_process(old)
+
+        return True
+
+    def close(self) -> None:
+        """Close and remove the app's Unix domain socket, processes of the app that are still running keep theirs"""
+        if self.listener is not None:
+            path = self.listener.getsockname()
+            self.listener.close()
+            self.listener = None
+
+            if os.path.exists(path):
+                os.unlink(path)
+
+    def _stop_process(self, process) -> int:
+        app_pids = self._app_pids(process)
+
+        if app_pids:
+            for pid in app_pids:
+                self._signal(pid, signal.SIGTERM)
+        else:
+            process.terminate()  # SIGTERM
+
+        # the app drains its calls before exiting, give it that long
         try:
-            self.process.wait(10)
+            process.wait(self.node.config.drain_timeout + 5)
         except subprocess.TimeoutExpired:
-            self.process.kill()
+            for pid in app_pids:
+                self._signal(pid, signal.SIGKILL)
+            process.kill()
+            process.wait()
 
-        code = self.process.returncode
-        self.process = None
+        return process.returncode
 
-        return code
+    @staticmethod
+    def _app_pids(process) -> List[int]:
+        """
+        In exec mode the process is the shell running the app's command, which does not pass signals on to the app.
+        The app is every process the shell started, none if the shell replaced itself with the app
+        """
+        if not isinstance(process, subprocess.Popen):
+            return []
+
+        return child_pids(process.pid)
+
+    @staticmethod
+    def _signal(pid: int, signum: int) -> None:
+        try:
+            os.kill(pid, signum)
+        except ProcessLookupError:
+            pass  # exited already
 
 
 class Node(Endpoint):
+    # every this many reports the whole sample is sent instead of the changes, so a restarted vertex catches up
+    FULL_REPORT_EVERY = 12
+
     def __init__(self, config: NodeConfig, vert_addr):
         self.config = config
         self.vert_addr = vert_addr
         self.uid = None
+        self.fork_server = None
+
+        self.sampler = ResourceSampler()
+        self._reported = {}  # the load as the vertex knows it
+        self._report_timer = None
+
+        # reports wait on the vertex, they get a thread of their own instead of holding up the shared timers
+        self._report_scheduler = TimerScheduler()
+
+        if config.fork_server:
+            self.fork_server = ForkServer(config.preload, [app_data.cwd for app_data in config.app_datas])
 
         self.apps = []
 
@@ -58,36 +181,111 @@ class Node(Endpoint):
             self.apps.append(AppProcess(self, app_data))
 
         hostname = socket.gethostname()
-        super().__init__(hostname, self._handler)
+        super().__init__(hostname, self.run_task_from_flow)
 
-    def _handler(self, flow):
-        pass
+        self.add_task(Task(self.app_ready))
+        self.add_task(Task(self.restart_app))
+        self.add_task(Task(self.restart_apps))
 
     def start(self):
+        self.open()
+
+        for app in self.apps:
+            app.start()
+
+        if self.config.report_interval:
+            interval = self.config.report_interval
+            self._report_timer = self._report_scheduler.schedule(0, self._report_load, interval, "skip")
+
+        while True:
+            time.sleep(1)
+
+    def open(self) -> None:
+        """Register with the vertex and start serving, the apps are not started"""
         super().setup(self.vert_addr)
 
         data = {
-            "resources": {},
+            "resources": static_resources(),
             "host": self.address[0],
             "port": self.address[1],
         }
         self.uid = self.vertex_send("vertex/connect_node", data)
+        self.node_uuid = self.uid
+
+        # the apps of the node put their objects in this store, and the node serves them to other nodes
+        self.serve_objects(ObjectStore.create(self.uid, self.config.object_memory))
 
         super().start()
 
+        if self.fork_server is not None:
+            self.fork_server.open()
+
+    def _report_load(self, index: int) -> None:
+        """Sample the load of the machine and the apps, and send what changed to the vertex"""
+        pids = {app.name: app.process.pid for app in self.apps if app.process is not None}
+        sample = self.sampler.sample(pids)
+
+        load = changes(self._reported, sample)
+        if index % self.FULL_REPORT_EVERY == 0:
+            load.update(sample)
+
+        if not load:
+            return
+
+        # a report that takes longer than the interval is given up, the next one is sent in its place
+        deadline = time.time() + self.config.report_interval
+
+        try:
+            self.vertex.send("vertex/report_load", {"uuid": self.uid, "load": load}, deadline)
+        except (ConnectionError, OSError, DeadlineExceededError) as e:
+            log_warning("Could not report load to the vertex: {}", e)
+            return
+
+        for key, value in load.items():
+            if value is None:
+                self._reported.pop(key, None)
+            else:
+                self._reported[key] = value
+
+    def app_ready(self, name: str, token: str) -> bool:
+        """Sent by an app once it is registered with the vertex, with the token of the start that made it"""
         for app in self.apps:
-            app.start()
+            if app.name == name and app.token is not None and app.token == token:
+                app.ready.set()
+                return True
 
-        while True:
-            time.sleep(1)
+        return False
+
+    def restart_app(self, name: str) -> bool:
+        """Restart one app without dropping its calls, see AppProcess.restart()"""
+        for app in self.apps:
+            if app.name == name:
+                return app.restart()
+
+        raise ValueError("Node has no app named '{}'".format(name))
+
+    def restart_apps(self) -> dict:
+        """Restart every app one after the other, so only one of them is being replaced at any time"""
+        return {app.name: app.restart() for app in self.apps}
+
+    def stop(self):
+        if self._report_timer is not None:
+            self._report_scheduler.cancel(self._report_timer)
+
+        super().stop()
+
+        for app in self.apps:
+            app.close()
+
+        if self.objects is not None:
+            self.objects.destroy()
 
 
 def main():
     path = sys.argv[1]
     c = NodeConfig.from_json_file(path)
 
-    host, port = sys.argv[2].split(":")
-    vert_addr = (host, int(port))
+    vert_addr = parse_vertex_addrs(sys.argv[2])
 
     n = Node(c, vert_addr)
     atexit.register(n.stop)
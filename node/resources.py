@@ -0,0 +1,199 @@
+import os
+import time
+from typing import Dict, List, Optional
+
+PROC = "/proc"
+
+AVAILABLE = os.path.exists(os.path.join(PROC, "stat"))
+
+CLOCK_TICKS = os.sysconf("SC_CLK_TCK") if hasattr(os, "sysconf") else 100
+PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+
+def static_resources() -> dict:
+    """The resources of this machine that do not change, sent when the node registers"""
+    resources = {"cpus": os.cpu_count()}
+
+    if AVAILABLE:
+        resources["memory_total"] = _read_meminfo().get("MemTotal", 0)
+
+    return resources
+
+
+def _read(path: str) -> Optional[str]:
+    try:
+        with open(path) as file:
+            return file.read()
+    except OSError:
+        return None  # the process exited
+
+
+def _stat_fields(stat: str) -> List[str]:
+    """The fields of /proc/<pid>/stat after the command name, which can contain spaces, so the state is fields[0]"""
+    return stat[stat.rindex(")") + 2:].split()
+
+
+def _children() -> Dict[int, List[int]]:
+    """The child process ids of every process, by parent process id"""
+    children = {}
+
+    for entry in os.listdir(PROC):
+        if not entry.isdigit():
+            continue
+
+        stat = _read(os.path.join(PROC, entry, "stat"))
+        if stat is not None:
+            children.setdefault(int(_stat_fields(stat)[1]), []).append(int(entry))
+
+    return children
+
+
+def _tree(pid: int, children: Dict[int, List[int]]) -> List[int]:
+    """The process and all of its descendants"""
+    tree = [pid]
+
+    for parent in tree:
+        tree.extend(children.get(parent, ()))
+
+    return tree
+
+
+def child_pids(pid: int) -> List[int]:
+    """The ids of the processes that pid started and that are still running, empty when there is no /proc"""
+    if not AVAILABLE:
+        return []
+
+    return _children().get(pid, [])
+
+
+def _read_meminfo() -> Dict[str, int]:
+    """Fields of /proc/meminfo in bytes"""
+    fields = {}
+
+    for line in (_read(os.path.join(PROC, "meminfo")) or "").splitlines():
+        name, _, value = line.partition(":")
+        parts = value.split()
+        if parts:
+            fields[name] = int(parts[0]) * 1024
+
+    return fields
+
+
+class ResourceSampler:
+    """
+        Samples the load of the machine and of the node's app processes from /proc. Every sample is a flat dict, so
+        only the keys that changed since the last report need to be sent, see changes()
+
+        Keys: cpu (busy fraction of all cpus since the last sample), memory_available (bytes), load_1, load_5, load_15,
+        and app/<name>/cpu (fraction of one cpu) and app/<name>/rss (bytes) for every running app. An app is counted
+        with all of its descendants, so the shell an app command is run by and the app's worker processes are included
+    """
+
+    def __init__(self) -> None:
+        self._cpu_times = None  # (busy, total) jiffies at the last sample
+        self._cpu = None
+        self._app_times = {}  # pid -> (cpu jiffies, monotonic time) at the last sample
+
+    def sample(self, pids: Dict[str, int]) -> dict:
+        """
+            Take a sample
+
+        :param pids: the process id of every running app, by app name
+        """
+        if not AVAILABLE:
+            return {}
+
+        sample = {}
+
+        cpu = self._sample_cpu()
+        if cpu is not None:
+            sample["cpu"] = cpu
+
+        sample["memory_available"] = _read_meminfo().get("MemAvailable", 0)
+
+        load = (_read(os.path.join(PROC, "loadavg")) or "0 0 0").split()
+        sample["load_1"], sample["load_5"], sample["load_15"] = (float(value) for value in load[:3])
+
+        children = _children() if pids else {}
+
+        for name, pid in pids.items():
+            sample.update(self._sample_app(name, pid, _tree(pid, children)))
+
+        # forget processes that are gone, pids are reused
+        self._app_times = {pid: times for pid, times in self._app_times.items() if pid in pids.values()}
+
+        return sample
+
+    def _sample_cpu(self) -> Optional[float]:
+        line = (_read(os.path.join(PROC, "stat")) or "").split("\n", 1)[0]
+        times = [int(value) for value in line.split()[1:]]
+
+        if not times:
+            return None
+
+        idle = times[3] + (times[4] if len(times) > 4 else 0)  # idle and iowait
+        total = sum(times[:8])  # steal and earlier, guest time is already counted in user
+        busy = total - idle
+
+        previous = self._cpu_times
+        self._cpu_times = (busy, total)
+
+        if previous is not None and total > previous[1]:
+            self._cpu = (busy - previous[0]) / (total - previous[1])
+
+        return self._cpu
+
+    def _sample_app(self, name: str, pid: int, tree: List[int]) -> dict:
+        jiffies = 0
+        rss = 0
+        found = False
+
+        for process in tree:
+            stat = _read(os.path.join(PROC, str(process), "stat"))
+            statm = _read(os.path.join(PROC, str(process), "statm"))
+
+            if stat is None or statm is None:
+                continue  # exited since the tree was read
+
+            fields = _stat_fields(stat)
+            jiffies += int(fields[11]) + int(fields[12])  # utime, stime
+            rss += int(statm.split()[1]) * PAGE_SIZE
+            found = True
+
+        if not found:
+            return {}
+
+        now = time.monotonic()
+        sample = {"app/{}/rss".format(name): rss}
+
+        previous = self._app_times.get(pid, None)
+        self._app_times[pid] = (jiffies, now)
+
+        # a descendant that exited takes its cpu time with it, that interval is counted as idle
+        if previous is not None and now > previous[1]:
+            sample["app/{}/cpu".format(name)] = max(jiffies - previous[0], 0) / CLOCK_TICKS / (now - previous[1])
+
+        return sample
+
+
+def changes(reported: dict, sample: dict, threshold: float=0.05) -> dict:
+    """
+        The keys of a sample that are worth reporting, compared to what was reported before
+
+    :param reported: the values last reported
+    :param sample: the new sample
+    :param threshold: changes smaller than this fraction of the reported value, or than 0.01, are left out
+    :return: the changed values, keys that are no longer in the sample have None
+    """
+    delta = {}
+
+    for key, value in sample.items():
+        old = reported.get(key, None)
+        if old is None or abs(value - old) > max(threshold * abs(old), 0.01):
+            delta[key] = value
+
+    for key in reported:
+        if key not in sample:
+            delta[key] = None
+
+    return delta
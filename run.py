@@ -1,7 +1,6 @@
 import os
 import subprocess
 import sys
-import time
 import atexit
 
 corvus_dir = os.path.dirname(os.path.realpath(__file__))
@@ -33,14 +32,11 @@ def setup_vertex():
 
 
 def run(node_config_path, vert_addr):
-    run_program("node", ['python3.7', corvus_dir + "/node/node.py", node_config_path, vert_addr])
-
-    while True:
-        time.sleep(0.2)
-        for name, program in programs.items():
-            if False:  # program.poll() is None:
-                print(name + " has ended")
-                return
+    node = run_program("node", ['python3.7', corvus_dir + "/node/node.py", node_config_path, vert_addr])
+
+    # the node owns every app, so there is nothing to do until it exits
+    node.wait()
+    print("node has ended")
 
 
 def run_program(name, command, pipe=False):
@@ -1,18 +1,35 @@
-from typing import Union, List, Any
+import time
+from typing import Union, List, Any, Dict
 
 from corvus.shared.com import formatting
 
 
 class ActionType:
+    """
+    The endpoint and task a Flow is for. ActionTypes are immutable, so the ones parsed from strings are interned and
+    every Flow for the same task shares a single instance.
+    """
+
     DELIM = "/"
+    MAX_INTERNED = 10000
+
+    _interned = {}  # type: Dict[str, ActionType]
 
     @staticmethod
     def from_str(string: str) -> 'ActionType':
-        sections = string.split(ActionType.DELIM)
-        endpoint = sections[0]
-        task = sections[1:]
+        action_type = ActionType._interned.get(string, None)
+
+        if action_type is None:
+            sections = string.split(ActionType.DELIM)
+            endpoint = sections[0]
+            task = sections[1:]
+
+            action_type = ActionType(endpoint, *task)
 
-        return ActionType(endpoint, *task)
+            if len(ActionType._interned) < ActionType.MAX_INTERNED:
+                ActionType._interned[string] = action_type
+
+        return action_type
 
     @staticmethod
     def force_cast(action_type: Union['ActionType', str]):
@@ -23,16 +40,19 @@ class ActionType:
 
     def __init__(self, endpoint: str, *task):
         self.endpoint = endpoint.lower()
-        self.task = list(task)
+        self.task = tuple(task)
+
+        self._task_str = ActionType.DELIM.join(self.task)
+        self._str = ActionType.DELIM.join(self.to_list())
 
     def to_list(self) -> List[str]:
         return [self.endpoint, *self.task]
 
     def get_task_str(self):
-        return ActionType.DELIM.join(self.task)
+        return self._task_str
 
     def __str__(self) -> str:
-        return ActionType.DELIM.join(self.to_list())
+        return self._str
 
     def __repr__(self) -> str:
         return self.__str__()
@@ -42,6 +62,10 @@ class Flow:
     """
     A Flow is all the data contained in a single transaction of data over the socket. Alpha's does not distinguish
     between requests and responses, so all data transferred over sockets in the Alpha protocol is considered a Flow.
+
+    The headers are the action type, the status, and optionally an absolute deadline (unix time) after which nobody
+    is waiting for the Flow anymore. The body is only deserialized when get_content() is called, so a Flow can be
+    inspected and dropped without paying for the body.
     """
 
     FORM = "json"
@@ -54,14 +78,9 @@ class Flow:
 
             action_type = ActionType.from_str(headers[0])
             status = headers[1]
+            deadline = float(headers[2]) if len(headers) > 2 else None
 
-            raw = blocks[1]
-
-            content = formatting.deserialize(raw, "json")
-            f = Flow(action_type, status, content)
-
-            f.raw = raw
-            return f
+            return Flow(action_type, status, blocks[1], deadline)
         except Exception as e:
             try:
                 data = data.decode()
@@ -70,16 +89,18 @@ class Flow:
 
             raise Exception("ALPHA: Cannot parse {}".format(data)) from e
 
-    def __init__(self, action_type: ActionType, status: str, content: Any=None):
+    def __init__(self, action_type: ActionType, status: str, content: Any=None, deadline: float=None):
         """
 
         :param action_type:
         :param status:
         :param content: Can be 'bytes' or an object. If bytes are given they will be stored as the message unmodified,
                         objects will be serialized to json, converted to byes, and stored as the message
+        :param deadline: unix time after which the Flow is no longer worth processing, None if there is no deadline
         """
         self.action_type = action_type
         self.status = status
+        self.deadline = deadline
 
         if type(content) is bytes:
             self.raw = content
@@ -91,10 +112,16 @@ class Flow:
     def get_content(self):
         return formatting.deserialize(self.raw, Flow.FORM)
 
+    def expired(self) -> bool:
+        return self.deadline is not None and time.time() > self.deadline
+
     def to_bytes(self) -> bytes:
         msg = "{}\n".format(self.action_type)
         msg += "{}\n".format(self.status)
 
+        if self.deadline is not None:
+            msg += "{!r}\n".format(self.deadline)
+
         msg += "\n"
         msg = msg.encode() + self.raw
 
@@ -124,3 +151,26 @@ class RPC:
 
     def __str__(self) -> str:
         return "{} {}".format(self.path, self.data)
+
+
+def benchmark(runs: int=200000) -> None:
+    """
+        Time parsing the action type and headers of a request, the part of dispatch that runs before the task. Needs
+        nothing but this package: python -c "from corvus.shared.alpha import benchmark; benchmark()"
+    """
+    import timeit
+
+    data = Flow(ActionType.from_str("bench/noop"), "ASK", {"a": 1, "b": 2}).to_bytes()
+
+    cases = [
+        ("ActionType.from_str", lambda: ActionType.from_str("bench/noop")),
+        ("task and full string", lambda: (ActionType.from_str("bench/noop").get_task_str(),
+                                          str(ActionType.from_str("bench/noop")))),
+        ("Flow.from_bytes", lambda: Flow.from_bytes(data)),
+        ("bytes to content", lambda: Flow.from_bytes(data).get_content())
+    ]
+
+    for name, case in cases:
+        seconds = min(timeit.repeat(case, number=runs, repeat=3))
+        print("{:<22}{:8.3f}us".format(name, seconds / runs * 1e6))
+
@@ -1,37 +1,127 @@
-from typing import Tuple
+import builtins
+import reprlib
+import traceback
+from typing import Any, List, Dict
+
+
+# bounds the repr of a payload, containers are cut short rather than formatted in full and then truncated
+_payload_repr = reprlib.Repr()
+_payload_repr.maxstring = _payload_repr.maxother = _payload_repr.maxlong = 200
+_payload_repr.maxlist = _payload_repr.maxtuple = _payload_repr.maxset = _payload_repr.maxdict = 20
 
 
 class RemoteException(Exception):
     """
         Exception that is thrown when the connected server responds with the a status of error
+
+        The error is carried as a structured record: the original type and message, the frames of the remote traceback
+        and the hops the request went through. Nothing is formatted until the exception is displayed. When the original
+        type is a builtin exception, the exception is also an instance of it, so it can be caught as e.g. a ValueError
     """
-    def __init__(self, err_type: str, message: str, network_trace: Tuple[str, str]=None):
+
+    MAX_PAYLOAD = 200  # characters of the request echoed for each hop
+    MAX_FRAMES = 50  # innermost frames kept from the remote traceback
+    MAX_MESSAGE = 2000  # characters kept from the original message
+
+    _typed = {}  # type: Dict[str, type]
+
+    @staticmethod
+    def create(err_type: str, message: str, frames: List[List]=None, hops: List[List[str]]=None) -> 'RemoteException':
+        """
+            Create the exception for a record, typed after err_type when it is a builtin exception
+
+        :param err_type: the name of the original exception's type
+        :param message: the original exception's message
+        :param frames: the remote traceback, as [filename, line number, function name], outermost first
+        :param hops: the network trace, as [location, payload]
+        """
+        if err_type in RemoteException._typed:
+            return RemoteException._typed[err_type](err_type, message, frames, hops)
+
+        base = getattr(builtins, err_type, None)
+
+        if isinstance(base, type) and issubclass(base, Exception) and not issubclass(base, RemoteException):
+            try:
+                typed = type("Remote" + err_type, (RemoteException, base), {})
+                exception = typed(err_type, message, frames, hops)
+            except TypeError:
+                # builtins with their own instance layout, like OSError, can't be mixed in, and builtins whose
+                # constructor takes typed arguments, like UnicodeDecodeError, can't be made from a message
+                pass
+            else:
+                RemoteException._typed[err_type] = typed
+                return exception
+
+        RemoteException._typed[err_type] = RemoteException
+        return RemoteException(err_type, message, frames, hops)
+
+    @staticmethod
+    def from_exception(e: Exception) -> 'RemoteException':
+        """
+            Capture an exception as a record, without formatting it
+
+        :param e: the exception that was raised
+        """
+        if isinstance(e, RemoteException):
+            # raised by a nested call, keep the original error and its hops
+            return RemoteException.create(e.err_type, e.message, list(e.frames), list(e.hops))
+
+        summary = traceback.StackSummary.extract(traceback.walk_tb(e.__traceback__), lookup_lines=False)
+        frames = [[f.filename, f.lineno, f.name] for f in summary[-RemoteException.MAX_FRAMES:]]
+
+        message = str(e)
+        if len(message) > RemoteException.MAX_MESSAGE:
+            message = message[:RemoteException.MAX_MESSAGE] + "..."
+
+        return RemoteException.create(type(e).__name__, message, frames)
+
+    def __init__(self, err_type: str, message: str, frames: List[List]=None, hops: List[List[str]]=None):
         self.err_type = err_type
         self.message = message
-        self.network_trace = network_trace if network_trace is not None else []
+        self.frames = frames if frames is not None else []
+        self.hops = hops if hops is not None else []
 
-        super().__init__(str(self))
+        super().__init__(message)
 
-    def push_network(self, location, data: str) -> None:
+    def push_network(self, location, data: Any) -> None:
         """
         Push to the network stack, the network stack is used to see the series of ports a message went through
 
         :param location: An identifier for current device
-        :param data: the data passed into the current device
+        :param data: the data passed into the current device, only the first MAX_PAYLOAD characters are kept. Bytes and
+            strings are kept as they are, anything else is shown by its repr
         """
-        self.network_trace.insert(0, (str(location), data))
+        limit = RemoteException.MAX_PAYLOAD
+
+        # only render what is kept, a large request body is never decoded or formatted in full
+        if isinstance(data, bytes):
+            text = data[:limit + 1].decode(errors="replace")
+        elif isinstance(data, str):
+            text = data[:limit + 1]
+        else:
+            text = _payload_repr.repr(data)
+
+        payload = text[:limit] + "..." if len(text) > limit else text
+
+        self.hops.insert(0, [str(location), payload])
+
+    def to_dict(self) -> dict:
+        return {"err_type": self.err_type, "message": self.message, "frames": self.frames, "hops": self.hops}
 
     def __str__(self) -> str:
         s = "\n\n"
 
         s += "Network Trace (most recent message last):\n"
-        for nt in self.network_trace:
-            s += "  " + nt[0]
+        for location, payload in self.hops:
+            s += "  " + location
             s += "\n"
-            s += "    " + nt[1].replace("\n", "\n    ")
+            s += "    " + payload.replace("\n", "\n    ")
             s += "\n"
 
-        s += "\nRemote Execption Message:\n"
-        s += self.message
+        s += "\nRemote Traceback (most recent call last):\n"
+        for filename, line, name in self.frames:
+            s += '  File "{}", line {}, in {}\n'.format(filename, line, name)
+
+        s += "{}: {}".format(self.err_type, self.message)
 
         return s
@@ -0,0 +1,250 @@
+import os
+import socket
+import struct
+import tempfile
+import threading
+import traceback
+from threading import Thread
+from typing import Callable, Optional
+from uuid import uuid4
+
+HEADER = struct.Struct("!I")
+
+AVAILABLE = hasattr(socket, "AF_UNIX")
+
+
+def send_frame(sock: socket.socket, data: bytes) -> None:
+    """
+        Send a length prefixed frame over the socket
+
+    :param sock: the connected socket
+    :param data: the payload of the frame
+    """
+    sock.sendall(HEADER.pack(len(data)))
+    sock.sendall(data)
+
+
+def recv_frame(sock: socket.socket) -> bytes:
+    """
+        Receive a length prefixed frame from the socket
+
+    :param sock: the connected socket
+    :return: the payload of the frame
+    """
+    size, = HEADER.unpack(_recv_exact(sock, HEADER.size))
+    return _recv_exact(sock, size)
+
+
+def _recv_exact(sock: socket.socket, size: int) -> bytes:
+    buffer = bytearray(size)
+    view = memoryview(buffer)
+    received = 0
+
+    while received < size:
+        count = sock.recv_into(view[received:])
+        if count == 0:
+            raise ConnectionError("Unix socket closed by peer")
+        received += count
+
+    return bytes(buffer)
+
+
+def listen(path: str=None) -> socket.socket:
+    """
+        Bind a listening Unix domain socket. Child processes that inherit it can serve it with a UnixServer each, the
+        kernel hands every connection to one of the processes that are accepting
+
+    :param path: where to bind the socket, a new path in the temp directory by default
+    """
+    if path is None:
+        path = os.path.join(tempfile.gettempdir(), "corvus-{}.sock".format(uuid4().hex))
+
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.bind(path)
+    sock.listen()
+
+    return sock
+
+
+def inherited_listener() -> Optional[socket.socket]:
+    """
+        The listening socket the parent process passed down in CORVUS_LISTEN_FD, None if there is none. Only the first
+        caller gets it, so other endpoints the process makes do not serve it as well
+    """
+    fd = os.environ.pop("CORVUS_LISTEN_FD", None)
+
+    if fd is None:
+        return None
+
+    return socket.socket(fileno=int(fd))
+
+
+class UnixServer:
+    """
+        Server that listens on a Unix domain socket, used for endpoints that live on the same machine. It has the same
+        interface as parseltongue.Server, the handler takes the request bytes and returns the response bytes
+
+        The server binds its own socket, or serves a listener it was given, which other processes may be serving as
+        well. A given listener is never shut down or unlinked by the server, that is up to whoever bound it
+
+    :param handler: takes the request bytes and returns the response bytes
+    :param path: where to bind the socket, a new path in the temp directory by default
+    :param listener: a listening socket to serve instead of binding one, see listen()
+    :param accept: False only binds the socket for child processes to serve, this process does not accept on it
+    """
+
+    # seconds between checks for close() while waiting for a connection on a given listener, which can't be shut down
+    ACCEPT_POLL = 0.5
+
+    def __init__(self, handler: Callable[[bytes], bytes], path: str=None, listener: socket.socket=None,
+                 accept: bool=True):
+        self.handler = handler
+        self.accept = accept
+
+        self._socket = listener
+        self._owned = listener is None
+
+        if listener is not None:
+            self.address = listener.getsockname()
+        elif path is not None:
+            self.address = path
+        else:
+            self.address = os.path.join(tempfile.gettempdir(), "corvus-{}.sock".format(uuid4().hex))
+
+        self._accepting = threading.Event()
+        self._closing = threading.Event()
+
+    def listen(self) -> socket.socket:
+        """Bind the socket if it is not bound yet, processes forked after this inherit it"""
+        if self._socket is None:
+            self._socket = listen(self.address)
+
+        return self._socket
+
+    def open(self) -> None:
+        listener = self.listen()
+
+        if not self.accept:
+            return
+
+        if not self._owned:
+            listener.settimeout(self.ACCEPT_POLL)
+
+        self._accepting.set()
+        Thread(target=self._accept, args=(listener,), name="UnixServer Accept", daemon=True).start()
+
+    def _accept(self, listener: socket.socket) -> None:
+        while self._accepting.is_set():
+            try:
+                conn, _ = listener.accept()
+            except socket.timeout:
+                continue  # another process took the connection, or there was none
+            except OSError:
+                break
+
+            Thread(target=self._serve, args=(conn,), name="UnixServer Connection", daemon=True).start()
+
+        if not self._owned:
+            listener.close()  # only this process's copy, the others keep serving it
+
+    def _serve(self, conn: socket.socket) -> None:
+        with conn:
+            while not self._closing.is_set():
+                try:
+                    request = recv_frame(conn)
+                except (ConnectionError, OSError):
+                    return
+
+                try:
+                    response = self.handler(request)
+                except Exception:
+                    # the caller would wait forever for a response, closing the connection fails it instead
+                    traceback.print_exc()
+                    return
+
+                send_frame(conn, response)
+
+    def stop_accepting(self) -> None:
+        """Stop taking new connections, the connections that are open are still served"""
+        was_accepting = self._accepting.is_set()
+        self._accepting.clear()
+
+        if not self._owned:
+            if not was_accepting and self._socket is not None:
+                self._socket.close()
+            self._socket = None
+            return
+
+        if self._socket is not None:
+            try:
+                self._socket.shutdown(socket.SHUT_RDWR)  # wakes up the accept thread
+            except OSError:
+                pass
+            self._socket.close()
+            self._socket = None
+
+        if os.path.exists(self.address):
+            os.unlink(self.address)
+
+    def close(self) -> None:
+        self.stop_accepting()
+        self._closing.set()
+
+
+class UnixClientConnection:
+    """
+        A connection to a UnixServer, has the same interface as parseltongue.ClientConnection
+    """
+
+    def __init__(self, path: str, on_close: Callable[['UnixClientConnection'], None]=None):
+        self.address = path
+        self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._socket.connect(path)
+        self._lock = threading.Lock()
+        self._on_close = on_close
+
+    def send(self, data: bytes, timeout: float=None) -> bytes:
+        """
+        Send a request and wait for its response
+
+        :param timeout: seconds to wait, raises socket.timeout when they pass, the socket can not be used after that
+        """
+        with self._lock:
+            self._socket.settimeout(timeout)
+            send_frame(self._socket, data)
+            return recv_frame(self._socket)
+
+    def close(self) -> None:
+        # shutting down wakes a send of another thread that is waiting for its response, close alone does not
+        try:
+            self._socket.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass  # not connected anymore
+
+        self._socket.close()
+
+        if self._on_close is not None:
+            self._on_close(self)
+
+
+class UnixClient:
+    def __init__(self):
+        self.connections = set()  # the open connections, a connection is removed when it is closed
+        self._lock = threading.Lock()
+
+    def connect(self, path: str) -> UnixClientConnection:
+        connection = UnixClientConnection(path, self._forget)
+        with self._lock:
+            self.connections.add(connection)
+        return connection
+
+    def _forget(self, connection: UnixClientConnection) -> None:
+        with self._lock:
+            self.connections.discard(connection)
+
+    def close(self) -> None:
+        with self._lock:
+            connections, self.connections = self.connections, set()
+
+        for connection in connections:
+            connection.close()
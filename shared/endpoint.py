@@ -1,20 +1,60 @@
+import copy
 import inspect
+import os
+import random
+import socket
+import threading
+import time
 import traceback
+from concurrent import futures
+from concurrent.futures import ThreadPoolExecutor, Future
+from threading import Thread
 from abc import ABC
 from inspect import Parameter
-from typing import Callable, Any, Tuple, Union
+from typing import Callable, Any, Tuple, Union, Optional, Dict, List, Iterable
 
 import parseltongue
 from parseltongue import ClientConnection
 from corvus.shared.alpha import Flow, ActionType
 from corvus.shared.alpha.errors import RemoteException
-from corvus.shared.logging import log_debug
+from corvus.shared.com import unix, formatting
+from corvus.shared.com.unix import UnixServer, UnixClient, UnixClientConnection
+from corvus.shared.logging import log_debug, log_warning
+from corvus.shared.objects import ObjectStore, ObjectRef
+from corvus.tools.breaker import CircuitBreaker
+from corvus.tools.futures import gather, submit_bounded
+from corvus.tools.locks import Limiter
 from corvus.tools.printing import signature
+from corvus.tools.ring import HashRing
+from corvus.tools.stats import LatencyWindow
+from corvus.tools.triggers import Trigger
+
+# endpoints that are running in this interpreter, Endpoint.send dispatches to them directly
+local_endpoints = {}  # type: Dict[str, BasicEndpoint]
+
+_context = threading.local()
+
+
+def current_deadline() -> Optional[float]:
+    """The deadline of the task running on this thread, sends made inside a task inherit it"""
+    return getattr(_context, "deadline", None)
+
+
+def _swap_deadline(deadline: Optional[float]) -> Optional[float]:
+    previous = current_deadline()
+    _context.deadline = deadline
+    return previous
+
+
+def _header_action(data: bytes) -> str:
+    """The action type of an encoded Flow, from its first header line only"""
+    return data[:data.find(b"\n")].decode(errors="replace")
 
 
 class EndpointServer:
 
-    def __init__(self, endpoint: 'BasicEndpoint', handler: Callable[[Flow], Any], port: int=0):
+    def __init__(self, endpoint: 'BasicEndpoint', handler: Callable[[Flow], Any], port: int=0,
+                 max_pending: int=None):
         sig = inspect.signature(handler)
         if len(sig.parameters) != 1:
             raise TypeError("EndpointServer Handler '{}' must have 2 arguments. "
@@ -22,89 +62,559 @@ class EndpointServer:
 
         self.handler = handler
         self.endpoint = endpoint
+
+        # requests beyond this many in flight are answered with BUSY instead of queueing
+        self.limiter = Limiter(max_pending)
+
+        # once draining, new requests are answered with DRAINING so the caller moves to another replica
+        self.draining = False
+
+        # when set, requests for the tasks in forwarded are passed on as bytes instead of run by the handler
+        self.forward = None  # type: Optional[Callable[[bytes], bytes]]
+        self.forwarded = set()
         self.server = parseltongue.Server(self.handle_binary, port=port)
 
+        # endpoints on the same machine can skip TCP and talk over a Unix domain socket
+        self.unix_server = UnixServer(self.handle_binary) if unix.AVAILABLE else None
+
     def open(self):
         self.server.open()
 
+        if self.unix_server is not None:
+            self.unix_server.open()
+
     def handle_binary(self, data: bytes):
-        request = Flow.from_bytes(data)
+        # admission is checked before the request is parsed, so a rejected request costs as little as possible
+        if not self.limiter.try_acquire():
+            return self._reply_early(data, "BUSY")
+
+        # checked after the request is counted, so drain() can not miss a request that is about to run
+        if self.draining:
+            self.limiter.release()
+            return self._reply_early(data, "DRAINING")
 
         try:
+            request = Flow.from_bytes(data)
+        except Exception as e:
+            self.limiter.release()
+
+            # nothing can be run without the headers, answer with the error so the connection stays usable
+            se = RemoteException.from_exception(e)
+            se.push_network(self.endpoint.name, data)
+            return Flow(ActionType("unknown"), "ERROR", se.to_dict()).to_bytes()
+
+        # the caller has given up, don't decode or run anything
+        if request.expired():
+            self.limiter.release()
+            return Flow(request.action_type, "EXPIRED").to_bytes()
+
+        task_name = request.action_type.get_task_str()
+        task = self.endpoint.get_task(task_name)
+        task_limiter = task.limiter if task is not None else None
+
+        if task_limiter is not None and not task_limiter.try_acquire():
+            self.limiter.release()
+            return Flow(request.action_type, "BUSY").to_bytes()
+
+        previous_deadline = _swap_deadline(request.deadline)
+
+        try:
+            if self.forward is not None and task_name in self.forwarded:
+                return self.forward(data)
+
             response_data = self.handler(request)
             response = Flow(request.action_type, "OKAY", response_data)
 
         except Exception as e:
-            se = RemoteException(type(e).__name__, traceback.format_exc())
-            se.push_network(self.endpoint.name, str(request.get_content()))
-            response = Flow(request.action_type, "ERROR", se)
+            se = RemoteException.from_exception(e)
+            se.push_network(self.endpoint.name, request.raw)
+            response = Flow(request.action_type, "ERROR", se.to_dict())
+
+        finally:
+            _swap_deadline(previous_deadline)
+
+            if task_limiter is not None:
+                task_limiter.release()
+            self.limiter.release()
 
         return response.to_bytes()
 
+    @staticmethod
+    def _reply_early(data: bytes, status: str) -> bytes:
+        """A response with only a status, only the first header line of the request is decoded for it"""
+        return Flow(ActionType.from_str(_header_action(data)), status).to_bytes()
+
+    def drain(self, timeout: float) -> bool:
+        """
+        Stop taking new requests, and wait for the ones in flight to finish
+
+        :param timeout: seconds to wait
+        :return: False if requests were still in flight when the timeout passed
+        """
+        self.draining = True
+        end = time.monotonic() + timeout
+
+        while self.limiter.count > 0:
+            if time.monotonic() >= end:
+                return False
+            time.sleep(0.01)
+
+        return True
+
     def close(self):
         self.server.close()
 
+        if self.unix_server is not None:
+            self.unix_server.close()
+
     def get_address(self) -> Tuple[str, int]:
         return self.server.address
 
+    def get_socket_path(self) -> Optional[str]:
+        return self.unix_server.address if self.unix_server is not None else None
+
 
 class EndpointClient:
     def __init__(self):
         self.client = parseltongue.Client()
+        self.unix_client = UnixClient()
 
     def connect(self, addr: Tuple[str, int]):
         con = self.client.connect(addr)
-        return EndpointClientConnection(con)
+        return EndpointClientConnection(con, lambda: self.client.connect(addr))
+
+    def connect_unix(self, path: str):
+        con = self.unix_client.connect(path)
+        return EndpointClientConnection(con, lambda: self.unix_client.connect(path))
 
     def close(self):
         self.client.close()
+        self.unix_client.close()
 
 
 class EndpointClientConnection:
     """
         Wrapper around ClientConnection that can send and receive data using the Alpha protocol instead of raw bytes
+
+        A socket carries one request at a time. When a connect function is given, requests sent from several threads
+        at once each get a socket from a pool of up to MAX_CONNECTIONS, which are kept open and reused. Once they are
+        all in use, further requests wait for one to be free
     """
 
-    def __init__(self, connection: ClientConnection):
+    # How many times a request answered with BUSY is retried, and the base of the jittered exponential backoff
+    BUSY_RETRIES = 3
+    BUSY_BACKOFF = 0.01
+
+    MAX_CONNECTIONS = 8
+
+    # shortest socket timeout a request with a deadline is sent with, a timeout of 0 would make the socket non-blocking
+    MIN_TIMEOUT = 0.001
+
+    def __init__(self, connection: Union[ClientConnection, UnixClientConnection],
+                 connect: Callable[[], Union[ClientConnection, UnixClientConnection]]=None):
         self.connection = connection
+        self.breaker = CircuitBreaker()
+
+        self._connect = connect
+        self._idle = [connection]
+        self._opened = 1
+        self._pool = threading.Condition()
+        self._closed = False
 
-    def send(self, action_type: Union[str, ActionType], data):
+    def send(self, action_type: Union[str, ActionType], data, deadline: float=None, abort: 'SendAbort'=None):
+        """
+        Send a request, failing fast with CircuitOpenError while the connection's breaker is open. Errors raised by
+        the task itself mean the replica answered, only requests that got no usable answer count as failures
+
+        :param abort: lets another thread give up waiting for the response, see SendAbort
+        """
         action_type = ActionType.force_cast(action_type)
 
-        request = Flow(action_type, "ASK", data)
-        log_debug("CALL    {}({})".format(action_type.get_task_str(), request.get_content()))
+        if not self.breaker.allow():
+            raise CircuitOpenError(str(action_type))
+
+        start = time.perf_counter()
+
+        try:
+            result = self._send(action_type, data, deadline, abort)
+        except (RemoteException, SendAbortedError):
+            # an aborted send was only slower than another one, the replica took at least this long
+            self.breaker.success(time.perf_counter() - start)
+            raise
+        except Exception:
+            self.breaker.failure()
+            raise
+
+        self.breaker.success(time.perf_counter() - start)
+        return result
+
+    def _send(self, action_type: ActionType, data, deadline: float=None, abort: 'SendAbort'=None):
+        request = Flow(action_type, "ASK", data, deadline)
+        log_debug("CALL    {}({})", action_type.get_task_str(), data)
         request_bytes = request.to_bytes()
 
-        response_bytes = self.connection.send(request_bytes)
+        attempt = 0
+        while True:
+            response_bytes = self.send_bytes(request_bytes, deadline, abort)
+            response = Flow.from_bytes(response_bytes)
+
+            if response.status != "BUSY":
+                break
+
+            if attempt >= self.BUSY_RETRIES:
+                raise EndpointBusyError(str(action_type))
+
+            if request.expired():
+                raise DeadlineExceededError(str(action_type))
+
+            time.sleep(random.uniform(0, self.BUSY_BACKOFF * 2 ** attempt))
+            attempt += 1
+
+        if response.status == "EXPIRED":
+            raise DeadlineExceededError(str(action_type))
+
+        if response.status == "DRAINING":
+            raise EndpointDrainingError(str(action_type))
 
-        response = Flow.from_bytes(response_bytes)
         content = response.get_content()
 
-        log_debug("RECV    {}({}) -> {}".format(action_type.get_task_str(), data, content))
+        log_debug("RECV    {}({}) -> {}", action_type.get_task_str(), data, content)
 
         if response.status == "ERROR":
-            se = RemoteException(**content)
-            print(str(se))
-            raise se
+            raise RemoteException.create(**content)
 
         return content
 
+    def send_bytes(self, request_bytes: bytes, deadline: float=None, abort: 'SendAbort'=None) -> bytes:
+        """
+        Send an encoded request as is and return the encoded response, without retries or the breaker
+
+        :param deadline: unix time after which DeadlineExceededError is raised instead of waiting for the response
+        :param abort: lets another thread give up waiting for the response, SendAbortedError is raised then
+        """
+        connection = self._acquire(deadline)
+
+        if connection is None:
+            raise DeadlineExceededError(_header_action(request_bytes))
+
+        if abort is None:
+            return self._send_on(connection, request_bytes, deadline)
+
+        if not abort.track(connection):
+            self._release(connection)
+            raise SendAbortedError(_header_action(request_bytes))
+
+        try:
+            return self._send_on(connection, request_bytes, deadline)
+        except Exception:
+            if abort.aborted:
+                raise SendAbortedError(_header_action(request_bytes))
+            raise
+        finally:
+            abort.untrack(connection)
+
+    def _send_on(self, connection: Union[ClientConnection, UnixClientConnection], request_bytes: bytes,
+                 deadline: float=None) -> bytes:
+        if deadline is not None and not isinstance(connection, UnixClientConnection):
+            return self._send_in_thread(connection, request_bytes, deadline)
+
+        try:
+            if deadline is None:
+                response_bytes = connection.send(request_bytes)
+            else:
+                response_bytes = connection.send(request_bytes, max(deadline - time.time(), self.MIN_TIMEOUT))
+        except socket.timeout:
+            # the response can still arrive on this socket, it must not be read as the response to another request
+            self._release(connection, broken=True)
+            raise DeadlineExceededError(_header_action(request_bytes))
+        except Exception:
+            # the socket may be in the middle of a frame, only reuse it if there is no way to open another
+            self._release(connection, broken=self._connect is not None)
+            raise
+
+        self._release(connection)
+        return response_bytes
+
+    def _send_in_thread(self, connection: ClientConnection, request_bytes: bytes, deadline: float) -> bytes:
+        """
+        Send on a parseltongue connection, whose socket can not be given a timeout, from a daemon thread and wait for
+        it until the deadline. A send that is given up has its socket closed and released as broken right away, so the
+        pool opens a new one in its place. The thread ends once the closed socket fails the send, and being a daemon it
+        never keeps the process from exiting
+        """
+        future = Future()
+
+        def run():
+            try:
+                future.set_result(connection.send(request_bytes))
+            except BaseException as e:
+                future.set_exception(e)
+
+        Thread(target=run, name="EndpointClientConnection", daemon=True).start()
+
+        try:
+            response_bytes = future.result(max(deadline - time.time(), 0))
+        except futures.TimeoutError:
+            self._release(connection, broken=True)
+            raise DeadlineExceededError(_header_action(request_bytes))
+        except Exception:
+            self._release(connection, broken=self._connect is not None)
+            raise
+
+        self._release(connection)
+        return response_bytes
+
+    def _acquire(self, deadline: float=None) -> Optional[Union[ClientConnection, UnixClientConnection]]:
+        """A socket to send on, None if the deadline passed while every socket was in use"""
+        with self._pool:
+            while not self._idle:
+                if self._closed and self._connect is None:
+                    raise ConnectionError("The connection was closed")
+
+                if self._connect is not None and self._opened < self.MAX_CONNECTIONS:
+                    self._opened += 1
+                    break
+
+                if deadline is None:
+                    self._pool.wait()
+                elif not self._pool.wait(deadline - time.time()):
+                    return None
+            else:
+                return self._idle.pop()
+
+        try:
+            return self._connect()
+        except Exception:
+            self._release(None, broken=True)
+            raise
+
+    def _release(self, connection, broken: bool=False) -> None:
+        """Give a socket back to the pool, a broken one is closed and a new one is opened in its place when needed"""
+        if broken and connection is not None:
+            connection.close()
+
+        with self._pool:
+            if broken:
+                self._opened -= 1
+            elif self._closed:
+                connection.close()  # closed while the request was in flight
+            else:
+                self._idle.append(connection)
+
+            self._pool.notify()
+
+    def close(self) -> None:
+        """Close the idle sockets, and the ones in use once their request is done"""
+        with self._pool:
+            self._closed = True
+            idle, self._idle = self._idle, []
+
+        for connection in idle:
+            connection.close()
+
+
+class SendAbort:
+    """
+        Gives up sends that are waiting for their response, from another thread, by closing the sockets they were sent
+        on. The sockets are released as broken, so the pool opens new ones in their place. Used to drop the slower
+        request of a hedged send, so it does not hold a socket and a thread until its response arrives
+    """
+
+    def __init__(self):
+        self.aborted = False
+
+        self._sending = []
+        self._lock = threading.Lock()
+
+    def track(self, connection) -> bool:
+        """Note a socket a request is about to be sent on, False if the send was aborted already"""
+        with self._lock:
+            if self.aborted:
+                return False
+
+            self._sending.append(connection)
+            return True
+
+    def untrack(self, connection) -> None:
+        with self._lock:
+            if connection in self._sending:
+                self._sending.remove(connection)
+
+    def abort(self) -> None:
+        with self._lock:
+            self.aborted = True
+            sending, self._sending = self._sending, []
+
+        for connection in sending:
+            connection.close()
+
+
+def parse_vertex_addrs(string: str) -> List[Tuple[str, int]]:
+    """Parse a comma separated list of host:port vertex addresses"""
+    addrs = []
+    for addr in string.split(","):
+        host, port = addr.strip().split(":")
+        addrs.append((host, int(port)))
+    return addrs
+
+
+def format_vertex_addrs(addrs: List[Tuple[str, int]]) -> str:
+    return ",".join("{}:{}".format(*addr) for addr in addrs)
+
+
+class VertexConnection:
+    """
+        Connection to every Vertex in the cluster. Requests about a single endpoint go to the vertex whose shard owns
+        the endpoint's name, falling back to the shard's replica when the owner can't be reached
+    """
+
+    # how many vertices hold each endpoint name, the owner plus its replicas
+    REPLICAS = 2
+
+    # tasks that are about a single endpoint, and the argument that holds the endpoint's name
+    ROUTED_TASKS = {"lookup": "endpoint_name", "connect_endpoint": "name", "disconnect_endpoint": "name",
+                    "watch": "endpoint_name",
+                    "enqueue": "endpoint_name", "pull": "endpoint_name", "ack": "endpoint_name",
+                    "result": "endpoint_name"}
+
+    def __init__(self, client: EndpointClient, addrs: List[Tuple[str, int]]):
+        self.client = client
+        self.addrs = list(addrs)
+        self.ring = HashRing(list(range(len(self.addrs))))
+        self.connections = {}
+
+    def _connection(self, shard: int) -> EndpointClientConnection:
+        if shard not in self.connections:
+            self.connections[shard] = self.client.connect(self.addrs[shard])
+        return self.connections[shard]
+
+    def send(self, action_type: Union[str, ActionType], data, deadline: float=None):
+        action_type = ActionType.force_cast(action_type)
+
+        key = self.ROUTED_TASKS.get(action_type.get_task_str())
+        if key is not None:
+            shards = self.ring.get_replicas(data[key], self.REPLICAS)
+        else:
+            shards = list(range(len(self.addrs)))  # any vertex can answer, use the first one that is up
+
+        for shard in shards[:-1]:
+            try:
+                return self._connection(shard).send(action_type, data, deadline)
+            except (ConnectionError, OSError):
+                self.connections.pop(shard, None)
+
+        return self._connection(shards[-1]).send(action_type, data, deadline)
+
+
+class WatchTrigger(Trigger):
+    """
+        Tracks the replicas of a watched endpoint from the events the vertex pushes. Subscribers are invoked with the
+        kind of change ("add" or "remove") and the replica that changed
+
+        Versions count up from 0 in every epoch of the vertex. An event from another epoch means the vertex restarted
+        or failed over, and the watch has to be loaded again from the vertex that sent it
+    """
+
+    def __init__(self, endpoint_name: str):
+        super().__init__()
+        self.endpoint_name = endpoint_name
+        self.epoch = None
+        self.version = -1
+        self.replicas = {}  # (host, port) -> replica
+
+        self._lock = threading.Lock()
+        self._pending = []  # events that arrived before the initial replicas were loaded
+
+    def load(self, version: int, replicas: List[dict], epoch: str=None) -> None:
+        """
+        Set the replicas the vertex returned when the watch started, then apply any events that beat them here. When
+        the watch is loaded again, subscribers are invoked for every replica that changed in between
+        """
+        replicas = {(r["host"], r["port"]): r for r in replicas}
+
+        with self._lock:
+            previous = self.replicas
+            self.epoch = epoch
+            self.version = version
+            self.replicas = replicas
+            pending, self._pending = self._pending or [], None
+
+        if self.primed:
+            for addr, replica in previous.items():
+                if addr not in replicas:
+                    self._invoke("remove", replica)
+
+            for addr, replica in replicas.items():
+                if addr not in previous:
+                    self._invoke("add", replica)
+
+        for event in pending:
+            self.apply(*event)
+
+    def apply(self, kind: str, version: int, replica: dict, epoch: str=None) -> bool:
+        """
+        Apply an event the vertex pushed
+
+        :return: False if the event is from another epoch of the vertex, the watch has to be loaded again
+        """
+        with self._lock:
+            if self._pending is not None:
+                self._pending.append((kind, version, replica, epoch))
+                return True
+
+            if epoch != self.epoch:
+                return False
+
+            # events can be reordered or repeated in flight, only apply ones newer than what has been seen
+            if version <= self.version:
+                return True
+
+            self.version = version
+            addr = (replica["host"], replica["port"])
+
+            if kind == "add":
+                self.replicas[addr] = replica
+            else:
+                self.replicas.pop(addr, None)
+
+        if self.primed:
+            self._invoke(kind, replica)
+
+        return True
+
+    def _prime(self) -> None:
+        pass
+
+    def _close(self) -> None:
+        pass
+
 
 class Task:
     """
     Represents a single task in an endpoint.
     """
 
-    def __init__(self, function: Callable, resources: dict=None, name: str=None):
+    # annotations that arguments can be coerced to when the task is created with coerce=True
+    COERCIBLE = (int, float, str)
+
+    def __init__(self, function: Callable, resources: dict=None, name: str=None, max_pending: int=None,
+                 coerce: bool=False, optional: Iterable[str]=()):
+        """
+        :param optional: names of arguments with a default that callers may leave out, every other argument has to be
+                         given. For tasks that took new arguments, so callers that send the old ones keep working
+        """
         self.name = name if name is not None else function.__name__
 
         self._function = function
         self.resources = resources if resources is not None else {}
+        self.limiter = Limiter(max_pending) if max_pending is not None else None
 
         self._using_kwargs = False
 
         params = inspect.signature(self._function).parameters.values()
-        self._required_args = set()
+        required_args = set()
+        accepted_args = set()
+        self._coercers = {}
 
         for param in params:
             kind = param.kind
@@ -112,21 +622,79 @@ class Task:
             if kind == Parameter.VAR_KEYWORD:
                 self._using_kwargs = True
             elif kind == Parameter.POSITIONAL_OR_KEYWORD:
-                self._required_args.add(param.name)
+                accepted_args.add(param.name)
+
+                if param.name not in optional:
+                    required_args.add(param.name)
+                elif param.default is Parameter.empty:
+                    raise ValueError("Optional argument '{}' of {} has no default".format(param.name, self.name))
+
+                if coerce and param.annotation in Task.COERCIBLE:
+                    self._coercers[param.name] = param.annotation
             else:
                 message = "Corvus only supports standard arguments or **kwargs in {}"
                 raise NotImplementedError(message.format(function.__name__))
 
+        unknown = set(optional) - accepted_args
+        if unknown:
+            raise ValueError("{} has no arguments {}".format(self.name, ", ".join(sorted(unknown))))
+
+        # everything needed to check a call is worked out here, once, instead of on every call
+        self._required_args = frozenset(required_args)
+        self._accepted_args = frozenset(accepted_args)
+
         self.signature = signature(self._function)
         self.full_signature = "{}  # {}".format(self.signature, self._function.__doc__)
 
     def run(self, kwargs):
         if not self.valid_args(kwargs):
-            string = "Invalid arguments for {}\n\nexpected {}\nreceived {}"
-            received_sig = self.name + "({})".format(",".join(list(kwargs.keys())))
-            raise Exception(string.format(self.name, self.signature, received_sig))
+            self._invalid(kwargs)
+
+        if self._coercers:
+            kwargs = self._coerce(kwargs)
+
         return self._function(**kwargs)
 
+    def compile(self) -> Callable[[dict], Any]:
+        """
+        Build a function that runs the task for a dict of arguments, the same as run() but with only the checks this
+        task needs. A task without optional arguments or **kwargs is checked with a single comparison of the keys
+        """
+        function = self._function
+        required = self._required_args
+        accepted = self._accepted_args
+        coerce = self._coerce if self._coercers else None
+        invalid = self._invalid
+
+        if self._using_kwargs:
+            def valid(kwargs):
+                return kwargs.keys() >= required
+        elif required == accepted:
+            def valid(kwargs):
+                return kwargs.keys() == accepted
+        else:
+            def valid(kwargs):
+                return kwargs.keys() >= required and kwargs.keys() <= accepted
+
+        if coerce is None:
+            def run(kwargs):
+                if type(kwargs) is not dict or not valid(kwargs):
+                    invalid(kwargs)
+                return function(**kwargs)
+        else:
+            def run(kwargs):
+                if type(kwargs) is not dict or not valid(kwargs):
+                    invalid(kwargs)
+                return function(**coerce(kwargs))
+
+        return run
+
+    def _invalid(self, kwargs):
+        string = "Invalid arguments for {}\n\nexpected {}\nreceived {}"
+        received = kwargs.keys() if type(kwargs) is dict else [type(kwargs).__name__]
+        received_sig = self.name + "({})".format(",".join(list(received)))
+        raise Exception(string.format(self.name, self.signature, received_sig))
+
     def valid_args(self, kwargs):
 
         # if kwargs is not a dict, it cannot be passed as kwargs
@@ -134,52 +702,83 @@ class Task:
             return False
 
         # if not all required args are met, these kwargs are not valid
-        if self._required_args > set(kwargs):
+        if not kwargs.keys() >= self._required_args:
             return False
 
         # if there are extra args given, and kwargs isn't used, these kwargs are not valid
-        if self._required_args < set(kwargs) and not self._using_kwargs:
+        if not self._using_kwargs and not kwargs.keys() <= self._accepted_args:
             return False
 
         return True
 
+    def _coerce(self, kwargs: dict) -> dict:
+        coerced = None
+
+        for name, annotation in self._coercers.items():
+            value = kwargs[name]
+
+            if type(value) is not annotation:
+                if coerced is None:
+                    coerced = dict(kwargs)  # don't change the caller's arguments
+                coerced[name] = annotation(value)
+
+        return coerced if coerced is not None else kwargs
+
 
 class BasicEndpoint(ABC):
     """
     Simple Endpoint that contains a server, client, and tasks.
     """
-    def __init__(self, name: str, server_handler: Callable, port: int=0):
+    def __init__(self, name: str, server_handler: Callable, port: int=0, max_pending: int=None):
         self.name = name
-        self.server = EndpointServer(self, server_handler, port)
+        self.server = EndpointServer(self, server_handler, port, max_pending)
         self.client = EndpointClient()
         self.address = None
         self._tasks = {}
+        self._dispatch = {}  # task name -> the task's compiled run function, see Task.compile()
 
     def add_task(self, task: Task):
         self._tasks[task.name] = task
+        self._dispatch[task.name] = task.compile()
+
+    def get_task(self, task_name: str) -> Optional[Task]:
+        return self._tasks.get(task_name)
 
     def start(self, **kwargs):
         self.server.open()
         self.address = self.server.get_address()
         print("{}:{}".format(*self.address), flush=True)
 
+        # only endpoints that handle flows as plain task calls can be run without a Flow, and not when their tasks are
+        # forwarded to other processes
+        if self.server.handler == self.run_task_from_flow and self.server.forward is None:
+            local_endpoints[self.name.lower()] = self
+
     def stop(self):
+        if local_endpoints.get(self.name.lower()) is self:
+            del local_endpoints[self.name.lower()]
+
         self.server.close()
         self.client.close()
 
     def run_task_from_flow(self, flow: Flow):
-        return self.run_task(flow.action_type.get_task_str(), **flow.get_content())
+        # the decoded content is a new dict already, it is passed on as is instead of being unpacked and packed again
+        return self._run_task(flow.action_type.get_task_str(), flow.get_content())
 
     def run_task(self, task_name: str, **content):
-        log_debug("INVO    {}({})".format(task_name, content))
+        return self._run_task(task_name, content)
+
+    def _run_task(self, task_name: str, content):
+        log_debug("INVO    {}({})", task_name, content)
 
-        if task_name not in self._tasks:
+        run = self._dispatch.get(task_name, None)
+
+        if run is None:
             raise TaskNotFoundException(type(self), task_name, list(self._tasks.keys()))
 
-        task = self._tasks[task_name]
-        res = task.run(content)
+        res = run(content)
 
-        log_debug("REPL    {}({}) -> {}".format(task_name, content, res))
+        log_debug("REPL    {}({}) -> {}", task_name, content, res)
 
         return res
 
@@ -200,19 +799,106 @@ class Endpoint(BasicEndpoint):
     be inherited by any Endpoint that uses a connection to a Vertex.
     """
 
-    def __init__(self, name: str, server_handler: Callable):
-        super().__init__(name, server_handler)
+    # How arguments and results are guarded when a task is dispatched to an endpoint in this interpreter.
+    # "copy" deep copies them so neither side can see the other's mutations, like a remote call.
+    # "share" passes them as is, which is faster but the task must not mutate its arguments.
+    LOCAL_GUARDS = ("copy", "share")
+
+    # a task needs this many latency samples before its requests are hedged
+    HEDGE_MIN_SAMPLES = 20
+
+    # how many lookups are made to find a replica to hedge to, the vertex can return the replica already in use
+    HEDGE_LOOKUPS = 3
+
+    # Outlier ejection: at most every OUTLIER_INTERVAL seconds the replicas of an endpoint are compared. A replica
+    # whose error rate is above OUTLIER_ERROR_RATE, or whose latency is OUTLIER_LATENCY_FACTOR times the median of the
+    # others, has its breaker tripped for OUTLIER_EJECT_TIME seconds. Replicas need OUTLIER_MIN_CALLS calls to be
+    # compared, and the last replica with a closed breaker is never ejected
+    OUTLIER_INTERVAL = 1.0
+    OUTLIER_ERROR_RATE = 0.5
+    OUTLIER_LATENCY_FACTOR = 3.0
+    OUTLIER_EJECT_TIME = 10.0
+    OUTLIER_MIN_CALLS = 10
+
+    # longest a brokered call or a pull waits at the vertex before asking again, and the pause before asking again when
+    # the vertex answered at once because it was already holding as many waiting polls as it allows
+    BROKER_POLL = 1.0
+    BROKER_BACKOFF = 0.1
+
+    # threads that run the sends made with send_async(), the most sends that are in flight at once
+    ASYNC_WORKERS = 32
+
+    def __init__(self, name: str, server_handler: Callable, local_guard: str="copy", max_pending: int=None):
+        super().__init__(name, server_handler, max_pending=max_pending)
         self.vertex = None
+        self.node_uuid = None
         self.connections = {}
 
+        if local_guard not in Endpoint.LOCAL_GUARDS:
+            raise ValueError("local_guard must be one of {}".format(", ".join(Endpoint.LOCAL_GUARDS)))
+        self.local_guard = local_guard
+
+        self._watches = {}  # type: Dict[str, WatchTrigger]
+        self._targets = {}  # endpoint name -> (host, port) of the replica its connection goes to
+
+        self._latencies = {}  # type: Dict[str, LatencyWindow]
+        self._replicas = {}  # endpoint name -> {(host, port): connection}, every connection opened to its replicas
+        self._replica_info = {}  # (host, port) -> the replica as the vertex described it
+        self._outlier_checks = {}  # endpoint name -> monotonic time of the last outlier check
+        self._executor = None
+        self._async_executor = None
+        self._executor_lock = threading.Lock()  # the executors are made on first use, by whichever thread needs them
+
+        self.metrics = {"hedged": 0, "hedge_wins": 0, "failovers": 0, "ejections": 0, "pulled": 0}
+
+        # brokered calls block at the vertex, so every thread gets its own connections for them
+        self._broker_context = threading.local()
+        self._pulling = False
+
+        self.objects = None  # type: Optional[ObjectStore]
+        self._object_owner = None  # (host, port) of the endpoint that serves the objects this endpoint puts
+        self._owns_objects = False  # the store was made by this endpoint, not its node, and goes away with it
+
+        self._direct_connections = {}  # (host, port) -> connection, to endpoints that are addressed directly
+
+        self.pipelines = None  # type: Optional[PipelineServer]
+
     def connect(self, endpoint_name: str):
         self.connections[endpoint_name] = None
 
-    def send(self, action_type: Union[str, ActionType], data) -> Any:
+    def send(self, action_type: Union[str, ActionType], data, timeout: float=None, hedge: float=None,
+             brokered: bool=False) -> Any:
+        """
+        Run a task on another endpoint and return its result
+
+        :param action_type: the endpoint and task to run
+        :param data: the arguments for the task
+        :param timeout: seconds the caller is willing to wait. Sends made inside a task inherit the task's remaining
+                        time, if a timeout is also given the tighter of the two is used
+        :param hedge: optional percentile (0 to 1) of the task's observed latency. If there is no response by then, the
+                      request is also sent to another replica and whichever response arrives first is used
+        :param brokered: queue the call at the vertex instead of sending it to a replica, it runs on whichever worker
+                         of the endpoint pulls it first, see submit()
+        """
         action_type = ActionType.force_cast(action_type)
 
         endpoint = action_type.endpoint
 
+        deadline = current_deadline()
+        if timeout is not None:
+            deadline = time.time() + timeout if deadline is None else min(deadline, time.time() + timeout)
+
+        if deadline is not None and time.time() > deadline:
+            raise DeadlineExceededError(str(action_type))
+
+        if brokered:
+            timeout = deadline - time.time() if deadline is not None else None
+            return self.collect(endpoint, self.submit(action_type, data), timeout)
+
+        local = local_endpoints.get(endpoint)
+        if local is not None:
+            return self._send_local(local, action_type, data, deadline)
+
         if endpoint not in self.connections:
             raise Exception("Unknown connection to '{}'".format(endpoint))
 
@@ -222,30 +908,650 @@ class Endpoint(BasicEndpoint):
             message = "Connection to '{}' has not been created, have you run start() on {}?"
             raise Exception(message.format(endpoint, self.name))
 
-        return connection.send(action_type, data)
+        try:
+            if hedge is not None:
+                return self._send_hedged(connection, action_type, data, deadline, hedge)
+
+            return self._timed_send(connection, action_type, data, deadline)
+        except EndpointBusyError:
+            # the replica stayed busy through every retry or is draining, redirect to whichever replica the vertex
+            # picks next, and close the connection to the old one unless the vertex picked it again
+            previous = self._targets.get(endpoint, None)
+            connection = self._connect_endpoint(endpoint)
+
+            if previous is not None and previous != self._targets.get(endpoint, None):
+                self._close_replica(endpoint, previous)
+
+            return self._timed_send(connection, action_type, data, deadline)
+        except CircuitOpenError:
+            # the replica is failing or was ejected, move to a healthy one or fail fast if there is none
+            replica = self._pick_replica(endpoint)
+            if replica is None:
+                raise
+
+            self.metrics["failovers"] += 1
+            connection = self._connect_to(endpoint, replica)
+            return self._timed_send(connection, action_type, data, deadline)
+
+    def send_async(self, action_type: Union[str, ActionType], data, timeout: float=None, hedge: float=None,
+                   brokered: bool=False) -> Future:
+        """
+        Start a send without waiting for it, see send() for the arguments. The send inherits the caller's deadline.
+        Use gather() or as_completed() from corvus.tools.futures to wait for several sends at once, so independent
+        calls cost the slowest of them instead of the sum
+
+        :return: a future of the task's result
+        """
+        if self._async_executor is None:
+            with self._executor_lock:
+                if self._async_executor is None:
+                    self._async_executor = ThreadPoolExecutor(self.ASYNC_WORKERS, "{} async".format(self.name))
+
+        return self._async_executor.submit(self._send_with_deadline, current_deadline(), action_type, data, timeout,
+                                           hedge, brokered)
+
+    def _send_with_deadline(self, deadline: Optional[float], *args) -> Any:
+        previous_deadline = _swap_deadline(deadline)
+
+        try:
+            return self.send(*args)
+        finally:
+            _swap_deadline(previous_deadline)
+
+    def send_many(self, action_type: Union[str, ActionType], datas: Iterable, limit: int=None,
+                  timeout: float=None) -> List[Any]:
+        """
+        Run a task once for every set of arguments, with at most limit calls in flight at once
+
+        :param action_type: the endpoint and task to run
+        :param datas: the arguments of each call
+        :param limit: how many calls are in flight at once, ASYNC_WORKERS by default
+        :param timeout: seconds each call is willing to wait
+        :return: the results, in the order of datas
+        """
+        limit = limit if limit is not None else self.ASYNC_WORKERS
+        submitted = submit_bounded(lambda data: self.send_async(action_type, data, timeout), datas, limit)
+        return gather(submitted)
+
+    def _timed_send(self, connection: EndpointClientConnection, action_type: ActionType, data, deadline: float,
+                    abort: SendAbort=None):
+        start = time.perf_counter()
+
+        try:
+            result = connection.send(action_type, data, deadline, abort)
+        finally:
+            self._eject_outliers(action_type.endpoint)
+
+        key = str(action_type)
+        if key not in self._latencies:
+            self._latencies[key] = LatencyWindow()
+        self._latencies[key].add(time.perf_counter() - start)
+
+        return result
+
+    def _eject_outliers(self, endpoint_name: str) -> None:
+        """Trip the breaker of any replica that is failing or much slower than the others, see OUTLIER_INTERVAL"""
+        now = time.monotonic()
+        if now - self._outlier_checks.get(endpoint_name, 0.0) < self.OUTLIER_INTERVAL:
+            return
+        self._outlier_checks[endpoint_name] = now
+
+        breakers = [c.breaker for c in self._replicas.get(endpoint_name, {}).values()]
+        closed = [b for b in breakers if b.state == CircuitBreaker.CLOSED]
+        measured = [b for b in closed if b.calls >= self.OUTLIER_MIN_CALLS]
+
+        for breaker in measured:
+            latencies = sorted(b.latency for b in measured if b is not breaker and b.latency is not None)
+            median = latencies[len(latencies) // 2] if latencies else None
+
+            slow = None not in (median, breaker.latency) and breaker.latency > self.OUTLIER_LATENCY_FACTOR * median
+            if (slow or breaker.error_rate > self.OUTLIER_ERROR_RATE) and len(closed) > 1:
+                breaker.trip(self.OUTLIER_EJECT_TIME)
+                closed.remove(breaker)
+                self.metrics["ejections"] += 1
+
+    def get_metrics(self) -> dict:
+        """The endpoint's counters, and the breaker of every replica it has connected to"""
+        breakers = {}
+        for name, connections in self._replicas.items():
+            breakers[name] = {"{}:{}".format(*addr): c.breaker.stats() for addr, c in connections.items()}
+
+        return dict(self.metrics, breakers=breakers)
+
+    def _send_hedged(self, connection: EndpointClientConnection, action_type: ActionType, data, deadline: float,
+                     hedge: float):
+        window = self._latencies.get(str(action_type), None)
+
+        if window is None or len(window) < self.HEDGE_MIN_SAMPLES:
+            return self._timed_send(connection, action_type, data, deadline)
+
+        if self._executor is None:
+            with self._executor_lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(thread_name_prefix="{} hedge".format(self.name))
+
+        first_abort = SendAbort()
+        first = self._executor.submit(self._timed_send, connection, action_type, data, deadline, first_abort)
+
+        try:
+            return first.result(timeout=window.percentile(hedge))
+        except futures.TimeoutError:
+            pass
+
+        other = self._other_replica(action_type.endpoint)
+
+        if other is None:
+            return first.result()
+
+        self.metrics["hedged"] += 1
+        second_abort = SendAbort()
+        second = self._executor.submit(self._timed_send, other, action_type, data, deadline, second_abort)
+
+        # the first successful response wins, the other is aborted so its socket is not held until it answers
+        aborts = {first: first_abort, second: second_abort}
+        pending = {first, second}
+        error = None
+
+        while pending:
+            done, pending = futures.wait(pending, return_when=futures.FIRST_COMPLETED)
+
+            for future in done:
+                if future.exception() is None:
+                    for loser in pending:
+                        aborts[loser].abort()
+
+                    if future is second:
+                        self.metrics["hedge_wins"] += 1
+                    return future.result()
+
+                error = future.exception()
+
+        raise error
+
+    def _other_replica(self, endpoint_name: str) -> Optional[EndpointClientConnection]:
+        """Connect to a replica of the endpoint other than the one its main connection goes to"""
+        replica = self._pick_replica(endpoint_name)
+
+        if replica is None:
+            return None
+
+        return self._open_connection(endpoint_name, replica)
+
+    def _pick_replica(self, endpoint_name: str) -> Optional[dict]:
+        """Find a replica other than the one the main connection goes to, skipping replicas whose breaker is open"""
+        target = self._targets.get(endpoint_name, None)
+        connections = self._replicas.get(endpoint_name, {})
+
+        def usable(addr):
+            return addr != target and (addr not in connections or connections[addr].breaker.available())
+
+        replica = None
+
+        if endpoint_name in self._watches:
+            replicas = [r for addr, r in self._watches[endpoint_name].replicas.items() if usable(addr)]
+            replica = random.choice(replicas) if replicas else None
+        else:
+            data = {"endpoint_name": endpoint_name, "node": self.node_uuid}
+
+            for _ in range(self.HEDGE_LOOKUPS):
+                response = self.vertex.send(ActionType("vertex", "lookup"), data)
+
+                if response and usable((response["host"], response["port"])):
+                    replica = response
+                    break
+
+            if replica is None:
+                # the vertex kept picking unusable replicas, fall back to a healthy one connected to before
+                known = [self._replica_info[addr] for addr, c in connections.items()
+                         if addr != target and c.breaker.state == CircuitBreaker.CLOSED]
+                replica = random.choice(known) if known else None
+
+        return replica
+
+    def _send_local(self, local: BasicEndpoint, action_type: ActionType, data, deadline: float=None) -> Any:
+        """Run a task on an endpoint in this interpreter, without serializing or touching a socket"""
+        if self.local_guard == "copy":
+            data = copy.deepcopy(data)
+
+        previous_deadline = _swap_deadline(deadline)
+
+        try:
+            result = local.run_task(action_type.get_task_str(), **data)
+        except Exception as e:
+            # raise the same exception a remote call would
+            se = RemoteException.from_exception(e)
+            se.push_network(local.name, data)
+            raise se from e
+        finally:
+            _swap_deadline(previous_deadline)
+
+        if self.local_guard == "copy":
+            result = copy.deepcopy(result)
+
+        return result
+
+    def submit(self, action_type: Union[str, ActionType], data) -> str:
+        """
+        Queue a call at the vertex, for a worker of the endpoint to pull when it has capacity. Workers are endpoints
+        that run serve_queue(), a call runs at least once
+
+        :param action_type: the endpoint and task to run
+        :param data: the arguments for the task
+        :return: the id of the call, pass it to collect() to get the result
+        """
+        action_type = ActionType.force_cast(action_type)
+
+        data = {"endpoint_name": action_type.endpoint, "task": action_type.get_task_str(), "args": data}
+        return self._broker_vertex().send("vertex/enqueue", data)
+
+    def collect(self, endpoint_name: str, call_id: str, timeout: float=None) -> Any:
+        """
+        Wait for the result of a call queued with submit()
+
+        :param endpoint_name: the endpoint the call was queued for
+        :param call_id: the id submit() returned
+        :param timeout: seconds to wait, forever if None
+        """
+        end = time.time() + timeout if timeout is not None else None
+
+        while True:
+            wait = self.BROKER_POLL if end is None else min(self.BROKER_POLL, end - time.time())
+            if wait <= 0:
+                raise DeadlineExceededError("{}/{}".format(endpoint_name, call_id))
+
+            start = time.time()
+            data = {"endpoint_name": endpoint_name.lower(), "id": call_id, "wait": wait}
+            response = self._broker_vertex().send("vertex/result", data)
+
+            if response["done"]:
+                break
+
+            if time.time() - start < wait / 2:
+                time.sleep(min(self.BROKER_BACKOFF, wait))
+
+        if response["error"] is not None:
+            raise RemoteException.create(**response["error"])
+
+        return response["result"]
+
+    def serve_queue(self, capacity: int, visibility: float=30.0) -> None:
+        """
+        Pull calls queued for this endpoint's name from the vertex, and run them. Calls are pulled in batches sized to
+        the free capacity, so a fast worker takes more of the queue than a slow one
+
+        :param capacity: how many pulled calls run at once
+        :param visibility: seconds a pulled call may take before the vertex delivers it again
+        """
+        if capacity <= 0:
+            raise ValueError("capacity for serve_queue must be > 0")
+
+        self._pulling = True
+        Thread(target=self._pull_calls, args=(capacity, visibility), name="{} Queue".format(self.name),
+               daemon=True).start()
+
+    def _pull_calls(self, capacity: int, visibility: float) -> None:
+        executor = ThreadPoolExecutor(capacity, thread_name_prefix="{} queue".format(self.name))
+        condition = threading.Condition()
+        running = [0]
+
+        # queues are kept under the lowercased name, like the action types submit() queues with
+        queue_name = self.name.lower()
+        worker = "{}@{}:{}".format(self.name, *self.address)
+
+        def run(call):
+            try:
+                self._run_pulled(call)
+            finally:
+                with condition:
+                    running[0] -= 1
+                    condition.notify()
+
+        while self._pulling:
+            with condition:
+                while running[0] >= capacity:
+                    condition.wait()
+                free = capacity - running[0]
+
+            data = {"endpoint_name": queue_name, "worker": worker, "max_items": free, "visibility": visibility,
+                    "wait": self.BROKER_POLL}
+
+            start = time.time()
+
+            try:
+                calls = self._broker_vertex().send("vertex/pull", data)
+            except (ConnectionError, OSError) as e:
+                log_warning("Could not pull from the vertex: {}", e)
+                time.sleep(self.BROKER_POLL)
+                continue
+
+            if not calls and time.time() - start < self.BROKER_POLL / 2:
+                time.sleep(self.BROKER_BACKOFF)
+
+            with condition:
+                running[0] += len(calls)
 
-    def setup(self, vertex_addr):
+            self.metrics["pulled"] += len(calls)
+
+            for call in calls:
+                executor.submit(run, call)
+
+        executor.shutdown(wait=False)
+
+    def _run_pulled(self, call: dict) -> None:
+        result = None
+        error = None
+
+        try:
+            result = self._run_served(call["task"], call["args"])
+        except Exception as e:
+            se = RemoteException.from_exception(e)
+            se.push_network(self.name, call["args"])
+            error = se.to_dict()
+
+        data = {"endpoint_name": self.name.lower(), "id": call["id"], "result": result, "error": error}
+        self._broker_vertex().send("vertex/ack", data)
+
+    def _run_served(self, task_name: str, args: dict):
+        """
+        Run a task the way a request for it would be: passed on to the processes the server forwards it to, like the
+        workers of an App, or run here
+        """
+        if self.server.forward is None or task_name not in self.server.forwarded:
+            return self._run_task(task_name, args)
+
+        action_type = ActionType(self.name, task_name)
+        response = Flow.from_bytes(self.server.forward(Flow(action_type, "ASK", args, current_deadline()).to_bytes()))
+
+        if response.status == "ERROR":
+            raise RemoteException.create(**response.get_content())
+        if response.status == "EXPIRED":
+            raise DeadlineExceededError(str(action_type))
+        if response.status == "DRAINING":
+            raise EndpointDrainingError(str(action_type))
+        if response.status == "BUSY":
+            raise EndpointBusyError(str(action_type))
+
+        return response.get_content()
+
+    def _broker_vertex(self) -> VertexConnection:
+        if not hasattr(self._broker_context, "vertex"):
+            self._broker_context.vertex = VertexConnection(self.client, self.vertex.addrs)
+        return self._broker_context.vertex
+
+    def put_object(self, value: Any) -> ObjectRef:
+        """
+        Keep a value in the node's object store, and get a reference to it. A task can return the reference instead of
+        the value, the value then only crosses the network when, and to where, it is dereferenced with get_object()
+
+        :param value: anything that can be sent as a task result
+        """
+        if self.objects is None:
+            self._open_node_objects()
+
+        if self.objects is None:
+            # not started by a node, this endpoint keeps and serves its own objects
+            self.serve_objects(ObjectStore.create("{}-{}-{}".format(self.name, *self.address)))
+            self._owns_objects = True
+
+        object_id, size = self.objects.put(value)
+        return ObjectRef(object_id, size, *self._object_owner)
+
+    def _open_node_objects(self) -> None:
+        """Open the store of the node that started this endpoint, every process on the node shares it"""
+        store = ObjectStore.from_environ()
+        node_addr = os.environ.get("CORVUS_NODE_ADDR", None)
+
+        if store is not None and node_addr is not None:
+            host, port = node_addr.split(":")
+            self.objects = store
+            self._object_owner = (host, int(port))
+
+    def serve_objects(self, store: ObjectStore) -> None:
+        """Serve the objects of a store to other endpoints, through the 'get_object' and 'delete_object' tasks"""
+        self.objects = store
+        self._object_owner = self.address
+
+        self.add_task(Task(self._get_object, name="get_object"))
+        self.add_task(Task(self._delete_object, name="delete_object"))
+
+    def get_object(self, ref: Union[ObjectRef, dict]) -> Any:
+        """
+        Get the value an ObjectRef refers to. When the object is in this node's store it is read from there directly,
+        otherwise it is fetched from the endpoint that serves it
+
+        :param ref: the ref, or the dict it was sent as
+        """
+        ref = ObjectRef.cast(ref)
+
+        if self.objects is None:
+            self._open_node_objects()
+
+        if self.objects is not None:
+            data = self.objects.get_bytes(ref.object_id)
+            if data is not None:
+                return formatting.deserialize(data, Flow.FORM)
+
+        action_type = ActionType("node", "get_object")
+        return self._direct_connection(ref.address).send(action_type, {"object_id": ref.object_id})
+
+    def delete_object(self, ref: Union[ObjectRef, dict]) -> bool:
+        """Remove an object from the store it is in, objects are kept until they are deleted"""
+        ref = ObjectRef.cast(ref)
+
+        if self.objects is not None and self.objects.delete(ref.object_id):
+            return True
+
+        action_type = ActionType("node", "delete_object")
+        return self._direct_connection(ref.address).send(action_type, {"object_id": ref.object_id})
+
+    def _direct_connection(self, addr: Tuple[str, int]) -> EndpointClientConnection:
+        addr = tuple(addr)
+        if addr not in self._direct_connections:
+            self._direct_connections[addr] = self.client.connect(addr)
+        return self._direct_connections[addr]
+
+    def _get_object(self, object_id: str) -> bytes:
+        """The serialized object, it is sent as the body of the response as is"""
+        data = self.objects.get_bytes(object_id)
+
+        if data is None:
+            raise KeyError("Object '{}' is not in the store of '{}'".format(object_id, self.name))
+
+        return data
+
+    def _delete_object(self, object_id: str) -> bool:
+        return self.objects.delete(object_id)
+
+    def serve_pipelines(self) -> 'PipelineServer':
+        """
+        Run the pipeline stages sent to this endpoint, and take the outputs of the pipelines it submits with
+        run_pipeline(). Has to be called before start(), see PipelineServer
+        """
+        from corvus.shared.pipeline import PipelineServer
+
+        if self.pipelines is None:
+            self.pipelines = PipelineServer(self)
+
+        return self.pipelines
+
+    def run_pipeline(self, pipeline: 'Pipeline', timeout: float=None) -> Dict[str, Any]:
+        """
+        Run every stage of a pipeline, each on a replica of its endpoint. Outputs are sent from stage to stage
+        directly, only the outputs of the last stages come back to this endpoint. This endpoint and the endpoints of
+        the stages have to serve pipelines, see serve_pipelines()
+
+        :param pipeline: the stages to run
+        :param timeout: seconds to wait for the pipeline, stages inherit the remaining time like any other send
+        :return: the output of every last stage, by stage name
+        """
+        if self.pipelines is None:
+            raise ValueError("'{}' does not serve pipelines, call serve_pipelines() before start()".format(self.name))
+
+        return self.pipelines.run(pipeline, timeout)
+
+    def stop(self):
+        self._pulling = False
+        super().stop()
+
+        for executor in (self._executor, self._async_executor):
+            if executor is not None:
+                executor.shutdown(wait=False)
+
+        self._executor = self._async_executor = None
+
+        if self.pipelines is not None:
+            self.pipelines.close()
+
+        if self._owns_objects:
+            self.objects.destroy()
+            self.objects = None
+            self._owns_objects = False
+
+    def setup(self, vertex_addr: Union[Tuple[str, int], List[Tuple[str, int]]]):
+        """Start the server and connect to the vertex, or to every vertex when the registry is sharded"""
         super().start()
-        self.vertex = self.client.connect(vertex_addr)
+        addrs = vertex_addr if isinstance(vertex_addr, list) else [vertex_addr]
+        self.vertex = VertexConnection(self.client, addrs)
 
     def start(self):
-        for endpoint_name in self.connections.keys():
-            response = self.vertex.send(ActionType("vertex", "lookup"), {"endpoint_name": endpoint_name})
+        for endpoint_name in list(self.connections.keys()):
+            self._connect_endpoint(endpoint_name)
+
+    def _connect_endpoint(self, endpoint_name: str) -> EndpointClientConnection:
+        """Look up a replica of the endpoint through the vertex and connect to it"""
+        data = {"endpoint_name": endpoint_name, "node": self.node_uuid}
+        response = self.vertex.send(ActionType("vertex", "lookup"), data)
+
+        if not response:
+            raise NoEndpointError(endpoint_name)
+
+        return self._connect_to(endpoint_name, response)
+
+    def _connect_to(self, endpoint_name: str, replica: dict) -> EndpointClientConnection:
+        connection = self._open_connection(endpoint_name, replica)
+
+        self.connections[endpoint_name] = connection
+        self._targets[endpoint_name] = (replica["host"], replica["port"])
+        return connection
 
-            if not response:
-                raise NoEndpointError(endpoint_name)
+    def _open_connection(self, endpoint_name: str, replica: dict) -> EndpointClientConnection:
+        """Get the connection to a replica, reusing an open one so its breaker keeps the replica's history"""
+        host = replica["host"]
+        port = replica["port"]
+        endpoint_addr = (host, port)
 
-            host = response["host"]
-            port = response["port"]
-            endpoint_addr = (host, port)
+        connections = self._replicas.setdefault(endpoint_name, {})
+        if endpoint_addr in connections:
+            return connections[endpoint_addr]
 
+        local = self.node_uuid is not None and replica["node"] == self.node_uuid
+
+        if local and replica["socket"] is not None and unix.AVAILABLE:
+            # the target lives on this node, skip the TCP stack
+            connection = self.client.connect_unix(replica["socket"])
+        else:
             connection = self.client.connect(endpoint_addr)
-            self.connections[endpoint_name] = connection
+
+        connections[endpoint_addr] = connection
+        self._replica_info[endpoint_addr] = replica
+        return connection
+
+    def _close_replica(self, endpoint_name: str, addr: Tuple[str, int]) -> None:
+        """Forget the connection to a replica and close its sockets, requests still using it finish first"""
+        connection = self._replicas.get(endpoint_name, {}).pop(addr, None)
+        self._replica_info.pop(addr, None)
+
+        if connection is not None:
+            connection.close()
+
+    def watch(self, endpoint_name: str, callback: Callable[[str, dict], Any]=None) -> WatchTrigger:
+        """
+        Subscribe to changes to the replicas of an endpoint, the vertex pushes every change instead of being polled.
+        If the replica this endpoint is connected to is removed, the connection moves to another replica.
+
+        :param endpoint_name: the endpoint to watch
+        :param callback: optional, called with the kind of change ("add" or "remove") and the replica that changed
+        :return: the trigger that is invoked on every change
+        """
+        if endpoint_name not in self._watches:
+            if self.get_task("registry_event") is None:
+                self.add_task(Task(self._registry_event, name="registry_event"))
+
+            trigger = WatchTrigger(endpoint_name)
+            trigger.subscribe(lambda kind, replica: self._replica_changed(endpoint_name, kind, replica))
+            self._watches[endpoint_name] = trigger
+
+            self._load_watch(endpoint_name)
+            trigger.prime()
+
+        trigger = self._watches[endpoint_name]
+
+        if callback is not None:
+            trigger.subscribe(callback)
+
+        return trigger
+
+    def _load_watch(self, endpoint_name: str) -> None:
+        """Subscribe to the endpoint at the vertex, and load the replicas it has now"""
+        data = {"endpoint_name": endpoint_name, "name": self.name, "host": self.address[0], "port": self.address[1]}
+        response = self.vertex_send("vertex/watch", data)
+        self._watches[endpoint_name].load(response["version"], response["endpoints"], response.get("epoch", None))
+
+    def _registry_event(self, kind: str, name: str, version: int, endpoint: dict, epoch: str=None):
+        """Receives changes to watched endpoints from the vertex"""
+        trigger = self._watches.get(name, None)
+
+        if trigger is not None and not trigger.apply(kind, version, endpoint, epoch):
+            # the vertex restarted or failed over and counts versions from 0 again, start over from what it has
+            self._load_watch(name)
+
+    def _replica_changed(self, endpoint_name: str, kind: str, replica: dict):
+        addr = (replica["host"], replica["port"])
+
+        if kind == "remove":
+            self._replicas.get(endpoint_name, {}).pop(addr, None)
+            self._replica_info.pop(addr, None)
+
+        if kind != "remove" or self._targets.get(endpoint_name) != addr:
+            return
+
+        replicas = list(self._watches[endpoint_name].replicas.values())
+        if replicas:
+            self._connect_to(endpoint_name, random.choice(replicas))
+        else:
+            self.connections[endpoint_name] = None
+            self._targets.pop(endpoint_name, None)
 
     def vertex_send(self, action_type: Union[str, ActionType], data):
         return self.vertex.send(action_type, data)
 
 
+class EndpointBusyError(Exception):
+    def __init__(self, action_type: str, message: str="'{}' is busy and did not accept the request after retrying"):
+        super().__init__(message.format(action_type))
+
+
+class EndpointDrainingError(EndpointBusyError):
+    def __init__(self, action_type: str):
+        super().__init__(action_type, "'{}' is shutting down and did not accept the request")
+
+
+class DeadlineExceededError(Exception):
+    def __init__(self, action_type: str):
+        super().__init__("The deadline for '{}' passed before it could be completed".format(action_type))
+
+
+class SendAbortedError(Exception):
+    def __init__(self, action_type: str):
+        super().__init__("The wait for the response to '{}' was given up".format(action_type))
+
+
+class CircuitOpenError(ConnectionError):
+    def __init__(self, action_type: str):
+        super().__init__("The circuit to '{}' is open after repeated failures, the request was not sent"
+                         .format(action_type))
+
+
 class NoEndpointError(Exception):
     def __init__(self, endpoint_name: str):
         super().__init__("There are no '{}' endpoints in the network to connect to".format(endpoint_name))
@@ -262,3 +1568,47 @@ class TaskNotFoundException(ResolutionError):
     def __init__(self, type, task_name, available_task_names):
         message = self.not_found_message(type.__name__, "task", task_name, available_task_names)
         super().__init__(message)
+
+
+def benchmark(runs: int=200000) -> None:
+    """
+        Time the per-request overhead of dispatching a no-op task, without the network. "Task.run" checks the
+        arguments the generic way, "compiled dispatch" is the function from Task.compile() that endpoints run tasks
+        with. This module imports parseltongue, which has to be installed, corvus.shared.alpha.benchmark() times the
+        parsing on its own
+    """
+    import timeit
+    from corvus.shared import logging
+
+    log_level, logging.LOG_LEVEL = logging.LOG_LEVEL, 0
+
+    def noop(a, b):
+        pass
+
+    task = Task(noop)
+    compiled = task.compile()
+
+    endpoint = BasicEndpoint("bench", lambda flow: None)
+    endpoint.add_task(task)
+
+    data = Flow(ActionType.from_str("bench/noop"), "ASK", {"a": 1, "b": 2}).to_bytes()
+    flow = Flow.from_bytes(data)
+
+    cases = [
+        ("ActionType.from_str", lambda: ActionType.from_str("bench/noop")),
+        ("Task.run", lambda: task.run({"a": 1, "b": 2})),
+        ("compiled dispatch", lambda: compiled({"a": 1, "b": 2})),
+        ("run_task", lambda: endpoint.run_task("noop", a=1, b=2)),
+        ("run_task_from_flow", lambda: endpoint.run_task_from_flow(flow)),
+        ("bytes to result", lambda: endpoint.run_task_from_flow(Flow.from_bytes(data)))
+    ]
+
+    for name, case in cases:
+        seconds = min(timeit.repeat(case, number=runs, repeat=3))
+        print("{:<22}{:8.3f}us".format(name, seconds / runs * 1e6))
+
+    logging.LOG_LEVEL = log_level
+
+
+if __name__ == '__main__':
+    benchmark()
@@ -1,9 +1,22 @@
+import logging
+
 LOG_LEVEL = 1
 
+# problems that were handled go through the standard logging module, so an application can route or silence them.
+# Without any logging configured they are printed to stderr
+logger = logging.getLogger("corvus")
+
 
-def log_debug(msg):
+def log_debug(msg, *args):
+    """Print a debug message, args are only formatted into msg when debug logging is on"""
     if LOG_LEVEL > 0:
-        print(str(msg))
+        print(str(msg).format(*args) if args else str(msg))
+
+
+def log_warning(msg, *args):
+    """Log a problem that was handled, args are only formatted into msg when warnings are logged"""
+    if logger.isEnabledFor(logging.WARNING):
+        logger.warning(str(msg).format(*args) if args else str(msg))
 
 
 def log(msg):
@@ -0,0 +1,263 @@
+import mmap
+import os
+import shutil
+import tempfile
+import threading
+from typing import Any, Optional, Tuple, Union
+from uuid import uuid4
+
+from corvus.shared.com import formatting
+
+FORM = "json"
+
+# memory backed on linux, so objects written there are shared memory between the processes of a node
+SHARED_MEMORY_DIR = "/dev/shm"
+
+
+class ObjectRef:
+    """
+        A reference to a task result that stays in the object store of the node that produced it. Tasks can return a
+        ref instead of the value, it travels as a small dict and any endpoint can dereference it with
+        Endpoint.get_object(), reading from the store directly when it is on the same node
+
+    :param object_id: the id of the object in its store
+    :param size: the size of the serialized object in bytes
+    :param host: the host of the endpoint that serves the store
+    :param port: the port of the endpoint that serves the store
+    """
+
+    TYPE = "ObjectRef"
+
+    def __init__(self, object_id: str, size: int, host: str, port: int):
+        self.type = ObjectRef.TYPE
+        self.object_id = object_id
+        self.size = size
+        self.host = host
+        self.port = port
+
+    @staticmethod
+    def is_ref(value: Any) -> bool:
+        return isinstance(value, ObjectRef) or (isinstance(value, dict) and value.get("type") == ObjectRef.TYPE)
+
+    @staticmethod
+    def cast(value: Union['ObjectRef', dict]) -> 'ObjectRef':
+        if isinstance(value, ObjectRef):
+            return value
+        return ObjectRef(value["object_id"], value["size"], value["host"], value["port"])
+
+    @property
+    def address(self) -> Tuple[str, int]:
+        return self.host, self.port
+
+    def __repr__(self) -> str:
+        return "ObjectRef({}, {} bytes at {}:{})".format(self.object_id, self.size, self.host, self.port)
+
+
+class ObjectStore:
+    """
+        Node-local store of serialized objects, kept as one file per object. Objects are written to a memory backed
+        directory, and read back through mmap. When the objects in memory take more than memory_limit bytes, the least
+        recently used ones are spilled to a directory on disk, and are still read from there.
+
+        Every process of a node opens the store on the same directories, so the store has no state of its own beyond
+        the files. Files are written under a temporary name and renamed, so readers never see a partial object
+
+        The bytes in memory are counted by each process from its own puts and deletes, on top of the last time it
+        scanned the directory. The directory is only scanned again when that count is over memory_limit, so objects
+        put by other processes are noticed at the next scan
+
+    :param directory: memory backed directory for objects
+    :param spill_directory: directory on disk that objects are spilled to
+    :param memory_limit: bytes of objects kept in directory before spilling
+    """
+
+    def __init__(self, directory: str, spill_directory: str, memory_limit: int=256 * 1024 * 1024):
+        self.directory = directory
+        self.spill_directory = spill_directory
+        self.memory_limit = memory_limit
+
+        os.makedirs(self.directory, exist_ok=True)
+        os.makedirs(self.spill_directory, exist_ok=True)
+
+        self.stats = {"puts": 0, "reads": 0, "spilled": 0, "spill_reads": 0}
+
+        self._used = None  # bytes of objects in directory as far as this process knows, None until the first scan
+        self._used_lock = threading.Lock()
+
+    @staticmethod
+    def create(name: str, memory_limit: int=256 * 1024 * 1024) -> 'ObjectStore':
+        """Make a store in shared memory when it is available, with its spill directory in the temp directory"""
+        base = SHARED_MEMORY_DIR if os.access(SHARED_MEMORY_DIR, os.W_OK) else tempfile.gettempdir()
+        directory = os.path.join(base, "corvus-objects-" + name)
+        spill_directory = os.path.join(tempfile.gettempdir(), "corvus-spill-" + name)
+
+        return ObjectStore(directory, spill_directory, memory_limit)
+
+    @staticmethod
+    def from_environ() -> Optional['ObjectStore']:
+        """Open the store of the node this process was started by, None if there is no node"""
+        directory = os.environ.get("CORVUS_OBJECT_DIR", None)
+
+        if directory is None:
+            return None
+
+        return ObjectStore(directory, os.environ["CORVUS_OBJECT_SPILL"], int(os.environ["CORVUS_OBJECT_MEMORY"]))
+
+    def environ(self) -> dict:
+        """The environment variables that let a child process open this store with from_environ()"""
+        return {
+            "CORVUS_OBJECT_DIR": self.directory,
+            "CORVUS_OBJECT_SPILL": self.spill_directory,
+            "CORVUS_OBJECT_MEMORY": str(self.memory_limit)
+        }
+
+    def put(self, value: Any) -> Tuple[str, int]:
+        """
+            Store a value
+
+        :param value: anything that can be sent in a Flow
+        :return: the id of the object and its serialized size
+        """
+        data = formatting.serialize(value, FORM)
+        return self.put_bytes(data), len(data)
+
+    def put_bytes(self, data: bytes) -> str:
+        """
+            Store an object that is already serialized
+
+        :param data: the serialized object
+        :return: the id of the object
+        """
+        object_id = str(uuid4())
+
+        path = os.path.join(self.directory, object_id)
+        with open(path + ".tmp", "wb") as file:
+            file.write(data)
+        os.rename(path + ".tmp", path)
+
+        self.stats["puts"] += 1
+
+        with self._used_lock:
+            if self._used is not None:
+                self._used += len(data)
+            spill = self._used is None or self._used > self.memory_limit
+
+        if spill:
+            self._spill()
+
+        return object_id
+
+    def get_bytes(self, object_id: str) -> Optional[bytes]:
+        """
+            Read the serialized object, None if it is not in this store
+
+        :param object_id: the id put() returned
+        """
+        for directory in (self.directory, self.spill_directory):
+            path = os.path.join(directory, object_id)
+
+            try:
+                data = self._read(path)
+            except FileNotFoundError:
+                continue  # not there, or spilled while it was looked up
+
+            if directory == self.directory:
+                try:
+                    os.utime(path)  # the modification time is the last use, for spilling
+                except FileNotFoundError:
+                    pass
+                self.stats["reads"] += 1
+            else:
+                self.stats["spill_reads"] += 1
+
+            return data
+
+        return None
+
+    def get(self, object_id: str) -> Any:
+        data = self.get_bytes(object_id)
+
+        if data is None:
+            raise KeyError("Object '{}' is not in the store at {}".format(object_id, self.directory))
+
+        return formatting.deserialize(data, FORM)
+
+    def contains(self, object_id: str) -> bool:
+        return any(os.path.exists(os.path.join(d, object_id)) for d in (self.directory, self.spill_directory))
+
+    def delete(self, object_id: str) -> bool:
+        for directory in (self.directory, self.spill_directory):
+            path = os.path.join(directory, object_id)
+
+            try:
+                size = os.stat(path).st_size
+                os.remove(path)
+            except FileNotFoundError:
+                continue
+
+            if directory == self.directory:
+                with self._used_lock:
+                    if self._used is not None:
+                        self._used = max(self._used - size, 0)
+
+            return True
+
+        return False
+
+    @staticmethod
+    def _read(path: str) -> bytes:
+        with open(path, "rb") as file:
+            if os.fstat(file.fileno()).st_size == 0:
+                return b""
+
+            with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                return mapped[:]
+
+    def _spill(self) -> None:
+        """Move the least recently used objects to disk until the ones in memory fit in memory_limit"""
+        entries = []
+        used = 0
+
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(".tmp"):
+                continue
+
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue  # removed by another process
+
+            entries.append((stat.st_mtime, stat.st_size, entry.name))
+            used += stat.st_size
+
+        if used <= self.memory_limit:
+            entries = []  # nothing to spill, the scan only brought the count up to date
+
+        for _, size, name in sorted(entries):
+            source = os.path.join(self.directory, name)
+            target = os.path.join(self.spill_directory, name)
+
+            try:
+                # the spill directory is usually on another file system, so the object is copied, then renamed
+                shutil.copyfile(source, target + ".tmp")
+                os.rename(target + ".tmp", target)
+                os.remove(source)
+            except FileNotFoundError:
+                continue  # deleted, or spilled by another process
+
+            self.stats["spilled"] += 1
+            used -= size
+
+            if used <= self.memory_limit:
+                break
+
+        with self._used_lock:
+            self._used = used
+
+    def info(self) -> dict:
+        return dict(self.stats, directory=self.directory, memory_limit=self.memory_limit)
+
+    def destroy(self) -> None:
+        """Delete every object, and the store's directories"""
+        shutil.rmtree(self.directory, ignore_errors=True)
+        shutil.rmtree(self.spill_directory, ignore_errors=True)
@@ -0,0 +1,370 @@
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Union, Callable, Tuple
+from uuid import uuid4
+
+from corvus.shared.alpha import ActionType
+from corvus.shared.alpha.errors import RemoteException
+from corvus.shared.endpoint import Task, DeadlineExceededError, NoEndpointError, current_deadline, _swap_deadline
+from corvus.shared.logging import log_warning
+from corvus.tools.triggers import default_scheduler
+
+
+class Stage:
+    """
+        One task call in a Pipeline
+
+    :param name: unique name of the stage in its pipeline
+    :param action_type: the endpoint and task to run
+    :param args: arguments for the task, besides the outputs of the stages before it
+    :param after: the stages whose outputs this stage takes
+    :param input: the argument the outputs are passed as. With one stage before it the output is passed as is, with
+                  several it is a list of their outputs in the order of after
+    """
+
+    def __init__(self, name: str, action_type: ActionType, args: dict, after: List['Stage'], input: str):
+        self.name = name
+        self.action_type = action_type
+        self.args = args
+        self.after = after
+        self.input = input
+
+
+class Pipeline:
+    """
+        A DAG of task calls that is submitted with one call to Endpoint.run_pipeline(). Every stage is run on its own
+        endpoint, which sends the output straight on to the endpoints of the stages after it, so intermediate outputs
+        never go back through the submitter. Stages that do not depend on each other run in parallel. The submitter and
+        the endpoints of the stages have to serve pipelines, see Endpoint.serve_pipelines()
+
+        Stages are added in order, a stage can only come after stages that were added before it, so a Pipeline can not
+        have cycles
+    """
+
+    ARROW = "->"
+
+    def __init__(self) -> None:
+        self.stages = {}  # type: Dict[str, Stage]
+
+    @staticmethod
+    def parse(text: str, args: Dict[str, dict]=None, input: str="data") -> 'Pipeline':
+        """
+            Make a chain of stages from text like "a/load -> b/transform -> c/store"
+
+        :param text: the action types of the stages, separated by ->
+        :param args: optional, the arguments of each stage by action type
+        :param input: the argument every stage after the first takes the previous output as
+        """
+        args = args if args is not None else {}
+
+        pipeline = Pipeline()
+        previous = None
+
+        for part in text.split(Pipeline.ARROW):
+            action_type = part.strip()
+            previous = pipeline.add(action_type, args.get(action_type, None), previous, input)
+
+        return pipeline
+
+    def add(self,
+            action_type: Union[str, ActionType],
+            args: dict=None,
+            after: Union[Stage, List[Stage]]=None,
+            input: str="data",
+            name: str=None) -> Stage:
+        """
+            Add a stage
+
+        :param action_type: the endpoint and task to run
+        :param args: arguments for the task
+        :param after: the stage, or stages, whose output the task takes
+        :param input: the argument the outputs are passed as
+        :param name: unique name of the stage, the action type by default
+        :return: the stage, to pass as after to the stages that take its output
+        """
+        action_type = ActionType.force_cast(action_type)
+
+        if after is None:
+            after = []
+        elif isinstance(after, Stage):
+            after = [after]
+
+        for stage in after:
+            if self.stages.get(stage.name) is not stage:
+                message = "Stage '{}' must be added to the pipeline before the stages after it"
+                raise ValueError(message.format(stage.name))
+
+        if name is None:
+            name = str(action_type)
+            if name in self.stages:
+                name = "{}#{}".format(name, len(self.stages))
+
+        if name in self.stages:
+            raise ValueError("Pipeline already has a stage named '{}'".format(name))
+
+        stage = Stage(name, action_type, args if args is not None else {}, after, input)
+        self.stages[name] = stage
+        return stage
+
+    def roots(self) -> List[str]:
+        return [name for name, stage in self.stages.items() if not stage.after]
+
+    def sinks(self) -> List[str]:
+        used = {before.name for stage in self.stages.values() for before in stage.after}
+        return [name for name in self.stages if name not in used]
+
+    def to_plan(self, reply: Tuple[str, int], deadline: Optional[float],
+                resolve: Callable[[str], Tuple[str, int]]) -> dict:
+        """
+            Make the plan that is sent along with every stage, each stage is pinned to one replica so the outputs of
+            the stages before it all arrive at the same place
+
+        :param reply: address of the endpoint the outputs of the last stages are sent to
+        :param deadline: unix time by which the pipeline has to be done, None if there is none
+        :param resolve: gives the address of a replica of an endpoint name
+        """
+        replicas = {}
+        stages = {}
+
+        for name, stage in self.stages.items():
+            endpoint = stage.action_type.endpoint
+            if endpoint not in replicas:
+                replicas[endpoint] = resolve(endpoint)
+
+            stages[name] = {
+                "action_type": str(stage.action_type),
+                "args": stage.args,
+                "after": [before.name for before in stage.after],
+                "input": stage.input,
+                "next": [],
+                "host": replicas[endpoint][0],
+                "port": replicas[endpoint][1]
+            }
+
+        for name, stage in self.stages.items():
+            for before in stage.after:
+                stages[before.name]["next"].append(name)
+
+        return {"id": str(uuid4()), "reply": list(reply), "deadline": deadline, "stages": stages}
+
+
+class PipelineRun:
+    """
+        The outputs of the last stages of a submitted pipeline, as they are reported back
+    """
+
+    def __init__(self, sinks: List[str]) -> None:
+        self.outputs = {}  # type: Dict[str, Any]
+        self.error = None  # type: Optional[dict]
+
+        self._sinks = set(sinks)
+        self._condition = threading.Condition()
+
+    def complete(self, stage: str, output: Any, error: Optional[dict]) -> None:
+        with self._condition:
+            if error is not None:
+                if self.error is None:
+                    self.error = error
+            else:
+                self.outputs[stage] = output
+
+            self._condition.notify_all()
+
+    def wait(self, timeout: float=None) -> bool:
+        """
+            Wait for the outputs of every last stage, raises the error of the first stage that failed
+
+        :return: False if the timeout passed first
+        """
+        with self._condition:
+            done = self._condition.wait_for(lambda: self.error is not None or self._sinks <= self.outputs.keys(),
+                                            timeout)
+
+        if self.error is not None:
+            raise RemoteException.create(**self.error)
+
+        return done
+
+
+class PipelineServer:
+    """
+        Runs the pipeline stages of an endpoint, and collects the outputs of the pipelines it submits, through the
+        'pipeline_stage', 'pipeline_result' and 'pipeline_abandon' tasks. Made by Endpoint.serve_pipelines()
+    """
+
+    # seconds the inputs of a stage without a deadline are kept while it waits for the rest of them
+    STAGE_INPUT_TTL = 300.0
+
+    def __init__(self, endpoint) -> None:
+        self.endpoint = endpoint
+
+        self._runs = {}  # type: Dict[str, PipelineRun]
+        self._inputs = {}  # pipeline id -> stage -> {stage before it: output}, until every output arrived
+        self._timers = {}  # pipeline id -> the timer that drops its inputs once the pipeline can't finish anymore
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(thread_name_prefix="{} pipeline".format(endpoint.name))
+
+        endpoint.add_task(Task(self._stage, name="pipeline_stage"))
+        endpoint.add_task(Task(self._result, name="pipeline_result"))
+        endpoint.add_task(Task(self._abandon, name="pipeline_abandon"))
+
+    def run(self, pipeline: Pipeline, timeout: float=None) -> Dict[str, Any]:
+        """See Endpoint.run_pipeline()"""
+        deadline = current_deadline()
+        if timeout is not None:
+            deadline = time.time() + timeout if deadline is None else min(deadline, time.time() + timeout)
+
+        plan = pipeline.to_plan(self.endpoint.address, deadline, self._resolve)
+
+        run = PipelineRun(pipeline.sinks())
+        self._runs[plan["id"]] = run
+
+        try:
+            for name in pipeline.roots():
+                self._forward(plan, name, None, None)
+
+            if not run.wait(deadline - time.time() if deadline is not None else None):
+                raise DeadlineExceededError("pipeline {}".format(plan["id"]))
+
+            return run.outputs
+        except Exception:
+            # stages that wait for several inputs will never get the rest of them
+            self._executor.submit(self._abandon_pipeline, plan)
+            raise
+        finally:
+            del self._runs[plan["id"]]
+
+    def close(self) -> None:
+        with self._lock:
+            for timer in self._timers.values():
+                default_scheduler.cancel(timer)
+
+            self._timers = {}
+            self._inputs = {}
+
+        self._executor.shutdown(wait=False)
+
+    def _resolve(self, endpoint_name: str) -> Tuple[str, int]:
+        """The address of a replica of the endpoint"""
+        endpoint = self.endpoint
+
+        if endpoint_name.lower() == endpoint.name.lower():
+            return endpoint.address
+
+        target = endpoint._targets.get(endpoint_name, None)
+        if target is not None:
+            return target
+
+        data = {"endpoint_name": endpoint_name, "node": endpoint.node_uuid}
+        response = endpoint.vertex.send(ActionType("vertex", "lookup"), data)
+
+        if not response:
+            raise NoEndpointError(endpoint_name)
+
+        return response["host"], response["port"]
+
+    def _forward(self, plan: dict, stage: str, source: Optional[str], value) -> None:
+        spec = plan["stages"][stage]
+        action_type = ActionType(ActionType.from_str(spec["action_type"]).endpoint, "pipeline_stage")
+
+        data = {"plan": plan, "stage": stage, "source": source, "value": value}
+        self.endpoint._direct_connection((spec["host"], spec["port"])).send(action_type, data, plan["deadline"])
+
+    def _stage(self, plan: dict, stage: str, source: str, value):
+        """Receives the output of a stage before one of this endpoint's stages, the stage runs once it has them all"""
+        after = plan["stages"][stage]["after"]
+
+        if len(after) > 1:
+            pipeline_id = plan["id"]
+
+            with self._lock:
+                if pipeline_id not in self._inputs:
+                    self._inputs[pipeline_id] = {}
+
+                    # inputs of a pipeline that failed or timed out elsewhere are dropped even if nobody says so
+                    expires = plan["deadline"] - time.time() if plan["deadline"] is not None else self.STAGE_INPUT_TTL
+                    self._timers[pipeline_id] = default_scheduler.schedule(expires,
+                                                                           lambda _: self._abandon(pipeline_id))
+
+                inputs = self._inputs[pipeline_id].setdefault(stage, {})
+                inputs[source] = value
+
+                if len(inputs) < len(after):
+                    return True
+
+                del self._inputs[pipeline_id][stage]
+                if not self._inputs[pipeline_id]:
+                    self._drop_inputs(pipeline_id)
+
+            value = [inputs[name] for name in after]
+
+        # the sender only waits for the hand off, not for the rest of the pipeline
+        self._executor.submit(self._run_stage, plan, stage, value)
+
+        return True
+
+    def _abandon(self, pipeline_id: str) -> bool:
+        """Drop the inputs this endpoint holds for stages of a pipeline that failed or timed out"""
+        with self._lock:
+            return self._drop_inputs(pipeline_id)
+
+    def _drop_inputs(self, pipeline_id: str) -> bool:
+        timer = self._timers.pop(pipeline_id, None)
+        if timer is not None:
+            default_scheduler.cancel(timer)
+
+        return self._inputs.pop(pipeline_id, None) is not None
+
+    def _abandon_pipeline(self, plan: dict) -> None:
+        """Tell every endpoint with a stage that waits for several inputs to drop the ones it has"""
+        addrs = {(spec["host"], spec["port"]) for spec in plan["stages"].values() if len(spec["after"]) > 1}
+
+        for addr in addrs:
+            action_type = ActionType("pipeline", "pipeline_abandon")
+
+            try:
+                self.endpoint._direct_connection(addr).send(action_type, {"pipeline_id": plan["id"]})
+            except Exception as e:
+                # the endpoint still drops them once the pipeline's deadline or STAGE_INPUT_TTL passes
+                log_warning("Could not abandon pipeline {} at {}:{}: {}", plan["id"], *addr, e)
+
+    def _run_stage(self, plan: dict, stage: str, value) -> None:
+        spec = plan["stages"][stage]
+        reply = ActionType("pipeline", "pipeline_result")
+        result = {"pipeline_id": plan["id"], "stage": stage, "output": None, "error": None}
+
+        args = dict(spec["args"])
+        if spec["after"]:
+            args[spec["input"]] = value
+
+        previous_deadline = _swap_deadline(plan["deadline"])
+
+        try:
+            output = self.endpoint._run_served(ActionType.from_str(spec["action_type"]).get_task_str(), args)
+
+            for name in spec["next"]:
+                self._forward(plan, name, stage, output)
+
+            if not spec["next"]:
+                result["output"] = output
+                self.endpoint._direct_connection(plan["reply"]).send(reply, result, plan["deadline"])
+        except Exception as e:
+            se = RemoteException.from_exception(e)
+            se.push_network(self.endpoint.name, args)
+            result["error"] = se.to_dict()
+
+            try:
+                self.endpoint._direct_connection(plan["reply"]).send(reply, result, plan["deadline"])
+            except Exception:
+                traceback.print_exc()  # nobody is left to report to
+        finally:
+            _swap_deadline(previous_deadline)
+
+    def _result(self, pipeline_id: str, stage: str, output, error: dict):
+        """Receives the output of a last stage, or the error of any stage, of a pipeline this endpoint submitted"""
+        run = self._runs.get(pipeline_id, None)
+
+        if run is not None:
+            run.complete(stage, output, error)
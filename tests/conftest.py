@@ -0,0 +1,5 @@
+import os
+import sys
+
+# the checkout is the corvus package itself, so the directory holding it has to be importable
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
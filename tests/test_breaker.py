@@ -0,0 +1,68 @@
+import time
+
+import pytest
+
+from corvus.tools.breaker import CircuitBreaker
+
+
+def test_breaker_opens_after_consecutive_failures():
+    breaker = CircuitBreaker(failure_threshold=3, reset_timeout=60)
+
+    for _ in range(2):
+        assert breaker.allow()
+        breaker.failure()
+    breaker.success(0.01)  # a success resets the count
+
+    for _ in range(3):
+        assert breaker.allow()
+        breaker.failure()
+
+    assert breaker.state == CircuitBreaker.OPEN
+    assert not breaker.allow()
+    assert not breaker.available()
+    assert breaker.trips == 1
+
+
+def test_half_open_breaker_lets_one_trial_through():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=60)
+    breaker.trip(0.0)
+
+    assert breaker.available()
+    assert breaker.allow()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert not breaker.allow()
+
+    breaker.failure()
+    assert breaker.state == CircuitBreaker.OPEN
+
+    breaker.trip(0.0)
+    assert breaker.allow()
+    breaker.success(0.01)
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert breaker.allow() and breaker.allow()
+
+
+def test_breaker_averages_latency_and_errors():
+    breaker = CircuitBreaker(alpha=0.5)
+
+    breaker.success(1.0)
+    breaker.success(3.0)
+    breaker.failure()
+
+    assert breaker.latency == 2.0
+    assert breaker.error_rate == 0.5
+    assert breaker.stats()["calls"] == 3
+
+
+def test_failure_threshold_must_be_positive():
+    with pytest.raises(ValueError):
+        CircuitBreaker(failure_threshold=0)
+
+
+def test_trip_duration():
+    breaker = CircuitBreaker(reset_timeout=60)
+    breaker.trip(0.05)
+
+    assert not breaker.allow()
+    time.sleep(0.06)
+    assert breaker.allow()
@@ -0,0 +1,64 @@
+import threading
+import time
+
+from corvus.vertex.broker import Broker, WorkQueue
+
+
+def test_pulled_item_is_acked_and_collected():
+    queue = WorkQueue("decoder")
+    item_id = queue.enqueue("decode", {"text": "a"})
+
+    assert queue.result(item_id, 0) == {"done": False}
+
+    items = queue.pull("worker", 10, 30, 0)
+    assert items == [{"id": item_id, "task": "decode", "args": {"text": "a"}, "attempts": 1}]
+    assert queue.info()["in_flight"] == {"worker": 1}
+
+    assert queue.ack(item_id, "a", None)
+    assert not queue.ack(item_id, "b", None)
+
+    assert queue.result(item_id, 0) == {"done": True, "result": "a", "error": None}
+    assert queue.result(item_id, 0) == {"done": False}  # a collected result is forgotten
+
+
+def test_pull_takes_at_most_max_items():
+    queue = WorkQueue("decoder")
+    ids = [queue.enqueue("decode", {"n": n}) for n in range(5)]
+
+    assert [item["id"] for item in queue.pull("worker", 3, 30, 0)] == ids[:3]
+    assert [item["id"] for item in queue.pull("worker", 3, 30, 0)] == ids[3:]
+    assert queue.pull("worker", 3, 30, 0) == []
+
+
+def test_pull_waits_for_an_item():
+    queue = WorkQueue("decoder")
+    threading.Timer(0.05, queue.enqueue, args=("decode", {})).start()
+
+    start = time.monotonic()
+    assert len(queue.pull("worker", 1, 30, 10)) == 1
+    assert time.monotonic() - start < 5
+
+
+def test_unacked_item_is_delivered_again_then_fails():
+    queue = WorkQueue("decoder")
+    item_id = queue.enqueue("decode", {})
+
+    for attempt in range(1, WorkQueue.MAX_ATTEMPTS + 1):
+        items = queue.pull("worker-{}".format(attempt), 1, 0.01, 1)
+        assert [(item["id"], item["attempts"]) for item in items] == [(item_id, attempt)]
+
+    # the last delivery was not acked either, the caller waiting for the result is told as soon as it times out
+    start = time.monotonic()
+    result = queue.result(item_id, 10)
+    assert time.monotonic() - start < 5
+    assert result["done"] and result["error"]["err_type"] == "TimeoutError"
+    assert not queue.ack(item_id, "late", None)
+    assert queue.info()["redelivered"] == WorkQueue.MAX_ATTEMPTS - 1
+    assert queue.info()["failed"] == 1
+
+
+def test_queue_names_are_not_case_sensitive():
+    broker = Broker()
+
+    assert broker.get_queue("Decoder") is broker.get_queue("decoder")
+    assert list(broker.info()) == ["decoder"]
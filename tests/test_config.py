@@ -0,0 +1,105 @@
+import json
+import os
+
+import pytest
+
+from corvus.tools.config import Config, ReloadingConfig
+
+DATA = {"server": {"port": 9000, "hosts": ["a", "b"], "limits": {"pending": 10}}, "name": "corvus"}
+
+
+def test_frozen_config_looks_up_paths():
+    frozen = Config(data=DATA).freeze()
+
+    assert frozen["server/limits/pending"] == 10
+    assert frozen.get("server/missing", 1) == 1
+    assert "server/port" in frozen
+    assert frozen.select("server")["limits/pending"] == 10
+    assert frozen.accessor("name")() == "corvus"
+
+    with pytest.raises(IndexError):
+        frozen["server/missing"]
+
+
+def test_frozen_config_can_not_be_changed():
+    data = json.loads(json.dumps(DATA))
+    frozen = Config(data=data).freeze()
+
+    with pytest.raises(TypeError):
+        frozen["server"]["port"] = 1
+
+    assert frozen["server/hosts"] == ("a", "b")
+
+    # neither the data it was made from nor the dict it gives out are shared with it
+    data["server"]["port"] = 1
+    frozen.as_dict()["server"]["port"] = 2
+    assert frozen["server/port"] == 9000
+    assert frozen.as_dict() == DATA
+
+
+def write(path, data, mtime):
+    with open(path, "w") as file:
+        json.dump(data, file)
+    os.utime(path, ns=(mtime, mtime))
+
+
+def test_reloading_config_swaps_in_changed_files(tmp_path):
+    path = str(tmp_path / "config.json")
+    write(path, DATA, 1000000000)
+
+    config = ReloadingConfig(path)
+    port = config.accessor("server/port")
+    reloads = []
+    config.on_reload.subscribe(reloads.append)
+
+    assert not config.reload()
+
+    write(path, {"server": {"port": 9001}}, 2000000000)
+    assert config.reload()
+    assert port() == 9001
+    assert reloads == [config.snapshot]
+
+    # half written, the last good snapshot is kept
+    with open(path, "w") as file:
+        file.write("{\"server\": ")
+    os.utime(path, ns=(3000000000, 3000000000))
+    assert not config.reload()
+    assert port() == 9001
+
+    config.close()
+
+
+LAYERED = {
+    "base": {"server": {"port": 9000, "limits": {"pending": 10}}, "name": "corvus"},
+    "prod": {"server": {"port": 80, "limits": {"busy": 5}}},
+    "broken": {"server": {"limits": 1}}
+}
+
+
+def test_overlay_matches_merging_the_layers():
+    config = Config(data=LAYERED)
+    layered = config.overlay(["base", "prod"])
+    merged = Config.merge(LAYERED["base"], LAYERED["prod"])
+
+    assert layered["server/port"] == 80
+    assert layered["server/limits"] == {"pending": 10, "busy": 5}
+    assert layered.get("server/missing", 1) == 1
+    assert layered.select("server")["limits/pending"] == 10
+    assert layered.as_dict() == merged
+    assert config.multi_select(["base", "prod"]).as_dict() == merged
+
+    # merging copies, the layers are left as they were
+    layered.as_dict()["server"]["limits"]["pending"] = 0
+    assert LAYERED["base"]["server"]["limits"] == {"pending": 10}
+
+
+def test_overlay_raises_on_conflicts_it_runs_into():
+    layered = Config(data=LAYERED).overlay(["base", "broken"])
+
+    assert layered["name"] == "corvus"
+
+    with pytest.raises(Exception, match="Cannot Merge"):
+        layered["server/limits"]
+
+    with pytest.raises(Exception, match="Cannot Merge"):
+        layered.flatten()
@@ -0,0 +1,491 @@
+import socket
+import threading
+import time
+
+import pytest
+
+pytest.importorskip("parseltongue")
+
+from corvus.shared.alpha import ActionType, Flow  # noqa: E402
+from corvus.shared.alpha.errors import RemoteException  # noqa: E402
+from corvus.shared.endpoint import BasicEndpoint, DeadlineExceededError, Endpoint, EndpointBusyError, EndpointClient, \
+    EndpointClientConnection, Task, VertexConnection, WatchTrigger, _swap_deadline, current_deadline, \
+    local_endpoints  # noqa: E402
+from corvus.tools.breaker import CircuitBreaker  # noqa: E402
+from corvus.tools.ring import HashRing  # noqa: E402
+
+
+class Decoder(BasicEndpoint):
+    def __init__(self):
+        super().__init__("decoder", self.run_task_from_flow)
+
+        self.add_task(Task(self.decode))
+
+    def decode(self, text):
+        return text.encode("latin-1").decode("utf-8")
+
+
+@pytest.fixture
+def decoder():
+    endpoint = Decoder()
+    endpoint.server.unix_server.open()
+
+    yield endpoint
+
+    endpoint.server.unix_server.close()
+    endpoint.client.close()
+
+
+def test_unicode_decode_error_is_replied(decoder):
+    client = EndpointClient()
+
+    try:
+        connection = client.connect_unix(decoder.server.get_socket_path())
+
+        with pytest.raises(RemoteException) as info:
+            connection.send("decoder/decode", {"text": "\xff"})
+
+        assert info.value.err_type == "UnicodeDecodeError"
+        assert connection.send("decoder/decode", {"text": "ok"}) == "ok"
+    finally:
+        client.close()
+
+
+@pytest.fixture
+def silent_server():
+    """A TCP server that accepts connections and never answers, returns its address and the accepted sockets"""
+    listener = socket.socket()
+    listener.bind(("127.0.0.1", 0))
+    listener.listen()
+    accepted = []
+
+    def accept():
+        while True:
+            try:
+                accepted.append(listener.accept()[0])
+            except OSError:
+                return
+
+    threading.Thread(target=accept, daemon=True).start()
+
+    yield listener.getsockname(), accepted
+
+    listener.close()
+    for conn in accepted:
+        conn.close()
+
+
+def test_timed_out_sends_release_their_sockets(silent_server):
+    addr, accepted = silent_server
+    client = EndpointClient()
+
+    try:
+        connection = client.connect(addr)
+
+        # more than the pool holds, each has to give its socket back when it times out
+        for _ in range(EndpointClientConnection.MAX_CONNECTIONS * 2):
+            with pytest.raises(DeadlineExceededError):
+                connection.send_bytes(Flow(ActionType("silent", "wait"), "ASK", {}).to_bytes(), time.time() + 0.05)
+
+            assert connection._opened == 0
+    finally:
+        client.close()
+
+
+def test_compiled_task_checks_arguments_like_run():
+    def exact(a, b):
+        return a + b
+
+    def defaulted(a, b=1):
+        return a + b
+
+    def keywords(a, **rest):
+        return a + len(rest)
+
+    def coerced(a: int):
+        return a
+
+    cases = [
+        (Task(exact), [{"a": 1, "b": 2}], [{"a": 1}, {"a": 1, "b": 2, "c": 3}, [1, 2]]),
+        (Task(defaulted), [{"a": 1, "b": 2}], [{"a": 1}, {"b": 1}, {"a": 1, "c": 3}]),
+        (Task(defaulted, optional=("b",)), [{"a": 1}, {"a": 1, "b": 2}], [{"b": 1}, {"a": 1, "c": 3}]),
+        (Task(keywords), [{"a": 1}, {"a": 1, "c": 3}], [{"c": 3}]),
+        (Task(coerced, coerce=True), [{"a": "1"}], [{}])
+    ]
+
+    for task, valid, invalid in cases:
+        run = task.compile()
+
+        for kwargs in valid:
+            assert run(dict(kwargs)) == task.run(dict(kwargs))
+
+        for kwargs in invalid:
+            with pytest.raises(Exception, match="Invalid arguments"):
+                run(kwargs)
+            with pytest.raises(Exception, match="Invalid arguments"):
+                task.run(kwargs)
+
+
+def test_optional_arguments_need_a_default():
+    def task(a, b=1):
+        pass
+
+    with pytest.raises(ValueError):
+        Task(task, optional=("a",))
+
+    with pytest.raises(ValueError):
+        Task(task, optional=("c",))
+
+
+class Counter(BasicEndpoint):
+    """Stands in for the worker processes of an App"""
+
+    def __init__(self):
+        super().__init__("counted", self.run_task_from_flow)
+
+        self.calls = []
+        self.add_task(Task(self.count))
+
+    def count(self, n: int):
+        self.calls.append(n)
+        return n + 1
+
+
+def test_forwarded_tasks_run_where_requests_for_them_do():
+    worker = Counter()
+
+    endpoint = Endpoint("counted", lambda flow: None)
+    endpoint.add_task(Task(lambda n: pytest.fail("ran in the App"), name="count"))
+    endpoint.server.forwarded.add("count")
+    endpoint.server.forward = worker.server.handle_binary
+
+    try:
+        assert endpoint._run_served("count", {"n": 1}) == 2
+        assert worker.calls == [1]
+
+        with pytest.raises(RemoteException, match="Invalid arguments"):
+            endpoint._run_served("count", {"m": 1})
+    finally:
+        endpoint.client.close()
+        worker.client.close()
+
+
+class Sleeper(BasicEndpoint):
+    def __init__(self, name: str, delay: float):
+        super().__init__(name, self.run_task_from_flow)
+
+        self.delay = delay
+        self.add_task(Task(self.nap))
+
+    def nap(self):
+        time.sleep(self.delay)
+        return self.delay
+
+
+def test_hedged_send_takes_the_faster_replica_and_aborts_the_other():
+    slow, fast = Sleeper("replica", 5.0), Sleeper("replica", 0.0)
+    endpoint = Endpoint("caller", lambda flow: None)
+
+    for replica in (slow, fast):
+        replica.server.unix_server.open()
+
+    try:
+        slow_connection = endpoint.client.connect_unix(slow.server.get_socket_path())
+        fast_connection = endpoint.client.connect_unix(fast.server.get_socket_path())
+        endpoint._other_replica = lambda name: fast_connection
+
+        action_type = ActionType("replica", "nap")
+        for _ in range(Endpoint.HEDGE_MIN_SAMPLES):
+            endpoint._timed_send(fast_connection, action_type, {}, None)
+
+        assert endpoint._send_hedged(slow_connection, action_type, {}, None, 0.5) == 0.0
+        assert endpoint.metrics["hedged"] == endpoint.metrics["hedge_wins"] == 1
+
+        # the slower send gave its socket up instead of waiting for the answer
+        give_up = time.time() + 1
+        while slow_connection._opened and time.time() < give_up:
+            time.sleep(0.01)
+        assert slow_connection._opened == 0
+    finally:
+        endpoint.client.close()
+        endpoint._executor.shutdown(wait=False)
+        for replica in (slow, fast):
+            replica.server.unix_server.close()
+
+
+class Keeper(BasicEndpoint):
+    def __init__(self):
+        super().__init__("keeper", self.run_task_from_flow)
+
+        self.add_task(Task(self.keep))
+        self.add_task(Task(self.reject))
+
+    def keep(self, items: list):
+        items.append("kept")
+        return items
+
+    def reject(self, items: list):
+        raise ValueError("rejected")
+
+
+@pytest.fixture
+def keeper():
+    endpoint = Keeper()
+    local_endpoints["keeper"] = endpoint
+
+    yield endpoint
+
+    del local_endpoints["keeper"]
+    endpoint.client.close()
+
+
+@pytest.mark.parametrize("local_guard", Endpoint.LOCAL_GUARDS)
+def test_local_endpoint_is_called_in_process(keeper, local_guard):
+    caller = Endpoint("caller", lambda flow: None, local_guard=local_guard)
+    items = []
+
+    try:
+        result = caller.send("keeper/keep", {"items": items})
+
+        assert result == ["kept"]
+        # "copy" keeps the caller and the task from sharing arguments and results, like a remote call
+        assert (result is items) == (local_guard == "share")
+
+        with pytest.raises(ValueError, match="rejected"):
+            caller.send("keeper/reject", {"items": items})
+    finally:
+        caller.client.close()
+
+
+class Gate(BasicEndpoint):
+    def __init__(self, max_pending: int=None, task_max_pending: int=None):
+        super().__init__("gate", self.run_task_from_flow, max_pending=max_pending)
+
+        self.entered = threading.Event()
+        self.opened = threading.Event()
+        self.add_task(Task(self.hold, max_pending=task_max_pending))
+        self.add_task(Task(self.ping))
+
+    def hold(self):
+        self.entered.set()
+        self.opened.wait(10)
+        return "held"
+
+    def ping(self):
+        return "pong"
+
+
+@pytest.mark.parametrize("limits", [{"max_pending": 1}, {"task_max_pending": 1}])
+def test_full_endpoint_answers_busy(limits):
+    gate = Gate(**limits)
+    gate.server.unix_server.open()
+    client = EndpointClient()
+
+    try:
+        connection = client.connect_unix(gate.server.get_socket_path())
+        held = threading.Thread(target=connection.send, args=("gate/hold", {}))
+        held.start()
+        assert gate.entered.wait(10)
+
+        with pytest.raises(EndpointBusyError):
+            connection.send("gate/hold", {})
+
+        # a limit on the task leaves the endpoint's other tasks alone
+        if "task_max_pending" in limits:
+            assert connection.send("gate/ping", {}) == "pong"
+
+        gate.opened.set()
+        held.join(10)
+        assert connection.send("gate/hold", {}) == "held"
+    finally:
+        gate.opened.set()
+        client.close()
+        gate.server.unix_server.close()
+
+
+class Clock(BasicEndpoint):
+    def __init__(self):
+        super().__init__("clock", self.run_task_from_flow)
+
+        self.deadlines = []
+        self.add_task(Task(self.tick))
+
+    def tick(self):
+        self.deadlines.append(current_deadline())
+        return "tock"
+
+
+def test_expired_requests_are_shed_and_deadlines_are_propagated():
+    clock = Clock()
+    action_type = ActionType("clock", "tick")
+
+    try:
+        expired = Flow(action_type, "ASK", {}, time.time() - 1).to_bytes()
+        assert Flow.from_bytes(clock.server.handle_binary(expired)).status == "EXPIRED"
+        assert clock.deadlines == []
+
+        deadline = time.time() + 60
+        response = Flow.from_bytes(clock.server.handle_binary(Flow(action_type, "ASK", {}, deadline).to_bytes()))
+        assert response.status == "OKAY"
+        assert clock.deadlines == [pytest.approx(deadline)]
+        assert current_deadline() is None
+    finally:
+        clock.client.close()
+
+
+def test_send_past_its_deadline_raises():
+    caller = Endpoint("caller", lambda flow: None)
+
+    try:
+        with pytest.raises(DeadlineExceededError):
+            caller._send_with_deadline(time.time() - 1, "clock/tick", {})
+    finally:
+        caller.client.close()
+
+
+class DownShard:
+    def send(self, action_type, data, deadline=None):
+        raise ConnectionError("shard is down")
+
+
+class UpShard:
+    def __init__(self, shard, sent):
+        self.shard = shard
+        self.sent = sent
+
+    def send(self, action_type, data, deadline=None):
+        self.sent.append((self.shard, action_type.get_task_str()))
+        return self.shard
+
+
+class Cluster:
+    """Stands in for the EndpointClient of a VertexConnection, the shards in down refuse every request"""
+
+    def __init__(self, addrs, down=()):
+        self.addrs = addrs
+        self.down = set(down)
+        self.sent = []
+
+    def connect(self, addr):
+        shard = self.addrs.index(addr)
+        return DownShard() if shard in self.down else UpShard(shard, self.sent)
+
+
+def test_vertex_requests_go_to_the_owner_or_its_replica():
+    addrs = [("127.0.0.1", 9000 + i) for i in range(3)]
+    ring = HashRing(list(range(3)))
+    owner, replica = ring.get_replicas("decoder", VertexConnection.REPLICAS)
+
+    vertex = VertexConnection(Cluster(addrs), addrs)
+    assert vertex.send("vertex/lookup", {"endpoint_name": "decoder"}) == owner
+    assert vertex.send("vertex/status", {}) == 0
+
+    vertex = VertexConnection(Cluster(addrs, down=[owner]), addrs)
+    assert vertex.send("vertex/lookup", {"endpoint_name": "decoder"}) == replica
+
+
+def replica_at(port: int) -> dict:
+    return {"name": "decoder", "host": "127.0.0.1", "port": port}
+
+
+def test_watch_applies_events_in_version_order():
+    trigger = WatchTrigger("decoder")
+    changes = []
+    trigger.subscribe(lambda kind, replica: changes.append((kind, replica["port"])))
+
+    # pushed before the initial replicas were loaded, applied once they are
+    assert trigger.apply("add", 2, replica_at(2), "a")
+    trigger.load(1, [replica_at(1)], "a")
+    trigger.prime()
+
+    assert sorted(trigger.replicas) == [("127.0.0.1", 1), ("127.0.0.1", 2)]
+
+    assert trigger.apply("remove", 3, replica_at(1), "a")
+    assert trigger.apply("remove", 2, replica_at(2), "a")  # repeated or reordered, already seen
+    assert sorted(trigger.replicas) == [("127.0.0.1", 2)]
+    assert changes == [("remove", 1)]
+
+
+def test_watch_from_another_epoch_is_loaded_again():
+    trigger = WatchTrigger("decoder")
+    trigger.load(5, [replica_at(1), replica_at(2)], "a")
+    trigger.prime()
+    changes = []
+    trigger.subscribe(lambda kind, replica: changes.append((kind, replica["port"])))
+
+    assert not trigger.apply("add", 0, replica_at(3), "b")
+    assert ("127.0.0.1", 3) not in trigger.replicas
+
+    trigger.load(1, [replica_at(2), replica_at(3)], "b")
+    assert sorted(changes) == [("add", 3), ("remove", 1)]
+    assert trigger.apply("add", 2, replica_at(4), "b")
+
+
+class Replica:
+    def __init__(self, calls: int, latency: float, errors: int=0):
+        self.breaker = CircuitBreaker()
+
+        for _ in range(calls - errors):
+            self.breaker.success(latency)
+        for _ in range(errors):
+            self.breaker._record(1.0)  # an error answer, it does not count towards opening the breaker
+
+
+def test_slow_or_failing_replicas_are_ejected():
+    endpoint = Endpoint("caller", lambda flow: None)
+    replicas = {"fast": Replica(20, 0.01), "also fast": Replica(20, 0.012), "slow": Replica(20, 0.1),
+                "failing": Replica(20, 0.01, errors=20), "new": Replica(2, 1.0)}
+    endpoint._replicas["replica"] = replicas
+
+    try:
+        endpoint._eject_outliers("replica")
+
+        ejected = sorted(name for name, r in replicas.items() if r.breaker.state == CircuitBreaker.OPEN)
+        assert ejected == ["failing", "slow"]
+        assert endpoint.metrics["ejections"] == 2
+    finally:
+        endpoint.client.close()
+
+
+def test_last_replica_is_not_ejected():
+    endpoint = Endpoint("caller", lambda flow: None)
+    replicas = {"failing": Replica(20, 0.01, errors=20)}
+    endpoint._replicas["replica"] = replicas
+
+    try:
+        endpoint._eject_outliers("replica")
+        assert replicas["failing"].breaker.state == CircuitBreaker.CLOSED
+    finally:
+        endpoint.client.close()
+
+
+@pytest.fixture
+def clock():
+    endpoint = Clock()
+    local_endpoints["clock"] = endpoint
+
+    yield endpoint
+
+    del local_endpoints["clock"]
+    endpoint.client.close()
+
+
+def test_async_sends_inherit_the_deadline(clock):
+    caller = Endpoint("caller", lambda flow: None)
+    deadline = time.time() + 60
+
+    try:
+        previous = _swap_deadline(deadline)
+        try:
+            future = caller.send_async("clock/tick", {})
+        finally:
+            _swap_deadline(previous)
+
+        assert future.result(10) == "tock"
+        assert clock.deadlines == [deadline]
+
+        assert caller.send_many("clock/tick", [{}] * 5, limit=2) == ["tock"] * 5
+        assert clock.deadlines[1:] == [None] * 5
+    finally:
+        caller.client.close()
+        caller._async_executor.shutdown(wait=False)
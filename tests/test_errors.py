@@ -0,0 +1,32 @@
+import pytest
+
+from corvus.shared.alpha.errors import RemoteException
+
+
+def test_create_builtin_is_typed():
+    e = RemoteException.create("ValueError", "bad value")
+
+    assert isinstance(e, RemoteException)
+    assert isinstance(e, ValueError)
+    assert e.message == "bad value"
+
+
+def test_create_unbuildable_builtin_falls_back():
+    # UnicodeDecodeError's constructor takes five typed arguments, so it can't be made from a message
+    for _ in range(2):
+        e = RemoteException.create("UnicodeDecodeError", "'utf-8' codec can't decode byte 0xff")
+
+        assert type(e) is RemoteException
+        assert e.err_type == "UnicodeDecodeError"
+
+    assert RemoteException._typed["UnicodeDecodeError"] is RemoteException
+
+
+def test_from_unicode_decode_error():
+    with pytest.raises(UnicodeDecodeError) as info:
+        b"\xff".decode("utf-8")
+
+    e = RemoteException.from_exception(info.value)
+
+    assert e.err_type == "UnicodeDecodeError"
+    assert RemoteException.create(**e.to_dict()).err_type == "UnicodeDecodeError"
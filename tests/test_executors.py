@@ -0,0 +1,74 @@
+import os
+
+import pytest
+
+pytest.importorskip("parseltongue")
+
+from corvus.app import executors  # noqa: E402
+from corvus.app.executors import ProcessExecutor  # noqa: E402
+from corvus.shared.objects import ObjectStore  # noqa: E402
+
+pytestmark = pytest.mark.skipif(not hasattr(os, "fork"), reason="needs os.fork()")
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    store = ObjectStore(str(tmp_path / "memory"), str(tmp_path / "disk"))
+
+    for key, value in store.environ().items():
+        monkeypatch.setenv(key, value)
+
+    return store
+
+
+def run_in(executor: ProcessExecutor, **kwargs):
+    try:
+        return executor(**kwargs)
+    finally:
+        executor.shutdown()
+
+
+def test_task_runs_in_another_process(store):
+    def task(values: list):
+        return {"pid": os.getpid(), "total": sum(values)}
+
+    result = run_in(ProcessExecutor(task, 1, "test"), values=[1, 2, 3])
+
+    assert result["total"] == 6
+    assert result["pid"] != os.getpid()
+
+
+def test_big_values_go_through_the_store(store):
+    def task(text: str):
+        return text.upper()
+
+    text = "a" * executors.SHARED_MIN_SIZE
+    executor = ProcessExecutor(task, 1, "test")
+
+    try:
+        assert executor(text=text) == text.upper()
+        assert executor._store.directory == store.directory
+        assert executor._store.stats["puts"] == 1  # the argument, the result was put by the child
+        assert os.listdir(store.directory) == []
+    finally:
+        executor.shutdown()
+
+
+def test_values_that_are_not_json_are_pickled(store):
+    def task(data: bytes):
+        return {1: data[::-1]}
+
+    assert run_in(ProcessExecutor(task, 1, "test"), data=b"abc") == {1: b"cba"}
+
+
+def test_task_errors_are_raised_in_the_app(store):
+    def task():
+        raise ValueError("failed in the pool")
+
+    with pytest.raises(ValueError, match="failed in the pool"):
+        run_in(ProcessExecutor(task, 1, "test"))
+
+
+def test_workers_must_be_positive():
+    with pytest.raises(ValueError):
+        ProcessExecutor(lambda: None, 0, "test")
@@ -0,0 +1,47 @@
+import json
+import os
+
+import pytest
+
+pytest.importorskip("parseltongue")
+
+from corvus.node.forkserver import ForkServer  # noqa: E402
+from corvus.shared.com import unix  # noqa: E402
+
+SCRIPT = """
+import json
+import os
+import sys
+
+from corvus.shared.com import unix
+
+listener = unix.inherited_listener()
+
+with open("result.json", "w") as file:
+    json.dump({"name": __name__, "argv": sys.argv, "value": os.environ["CORVUS_TEST_VALUE"],
+               "listener": listener.getsockname() if listener is not None else None}, file)
+"""
+
+
+@pytest.mark.skipif(not unix.AVAILABLE, reason="needs Unix domain sockets")
+def test_script_is_run_from_the_template(tmp_path):
+    script = tmp_path / "app.py"
+    script.write_text(SCRIPT)
+    listener = unix.listen()
+
+    try:
+        server = ForkServer(paths=[str(tmp_path)])
+        server.open()
+
+        process = server.spawn(str(script), str(tmp_path), {"CORVUS_TEST_VALUE": "forked"}, listener)
+        assert process.wait(30) == 0
+
+        with open(str(tmp_path / "result.json")) as file:
+            result = json.load(file)
+
+        assert result == {"name": "__main__", "argv": [str(script)], "value": "forked",
+                          "listener": listener.getsockname()}
+        assert "CORVUS_TEST_VALUE" not in os.environ
+    finally:
+        os.unlink(listener.getsockname())
+        listener.close()
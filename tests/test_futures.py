@@ -0,0 +1,61 @@
+import threading
+import time
+from concurrent import futures
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from corvus.tools.futures import gather, submit_bounded
+
+
+@pytest.fixture
+def executor():
+    executor = ThreadPoolExecutor(8)
+
+    yield executor
+
+    executor.shutdown(wait=True)
+
+
+def test_gather_keeps_the_order_of_the_futures(executor):
+    fs = [executor.submit(time.sleep, delay) for delay in (0.05, 0.0)]
+    fs.append(executor.submit(lambda: "last"))
+
+    assert gather(fs) == [None, None, "last"]
+
+
+def test_gather_raises_or_returns_exceptions(executor):
+    def fail():
+        raise ValueError("failed")
+
+    with pytest.raises(ValueError):
+        gather([executor.submit(fail), executor.submit(time.sleep, 0.01)])
+
+    results = gather([executor.submit(fail), executor.submit(lambda: 1)], return_exceptions=True)
+    assert isinstance(results[0], ValueError) and results[1] == 1
+
+    with pytest.raises(futures.TimeoutError):
+        gather([executor.submit(time.sleep, 1)], timeout=0.01)
+
+
+def test_submit_bounded_limits_calls_in_flight(executor):
+    running = []
+    most = []
+    lock = threading.Lock()
+
+    def call(item):
+        with lock:
+            running.append(item)
+            most.append(len(running))
+        time.sleep(0.01)
+        with lock:
+            running.remove(item)
+        return item
+
+    submitted = submit_bounded(lambda item: executor.submit(call, item), range(20), 3)
+
+    assert gather(submitted) == list(range(20))
+    assert max(most) <= 3
+
+    with pytest.raises(ValueError):
+        submit_bounded(executor.submit, [], 0)
@@ -0,0 +1,85 @@
+import threading
+import time
+
+from corvus.tools.locks import Limiter, ReadWriteLock
+
+
+def start_waiting(lock: ReadWriteLock, kind: str, order: list) -> threading.Thread:
+    """Start a thread that takes the lock, notes kind in order and lets it go again, once it is waiting for it"""
+    waiting = {"read": "_waiting_readers", "write": "_waiting_writers"}[kind]
+    before = getattr(lock, waiting)
+
+    def run():
+        with getattr(lock, kind)():
+            order.append(kind)
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+
+    give_up = time.time() + 10
+    while getattr(lock, waiting) == before and time.time() < give_up:
+        time.sleep(0.001)
+    assert getattr(lock, waiting) == before + 1
+
+    return thread
+
+
+def test_readers_share_the_lock():
+    lock = ReadWriteLock()
+
+    with lock.read():
+        with lock.read():
+            assert lock._readers == 2
+
+    assert lock.stats["reads"] == 2
+    assert lock.stats["contended_reads"] == 0
+
+
+def test_waiting_writer_goes_before_new_readers():
+    lock = ReadWriteLock()
+    order = []
+
+    lock.acquire_read()
+    writer = start_waiting(lock, "write", order)
+    reader = start_waiting(lock, "read", order)
+    lock.release_read()
+
+    for thread in (writer, reader):
+        thread.join(10)
+
+    assert order == ["write", "read"]
+    assert lock.stats["contended_reads"] == lock.stats["contended_writes"] == 1
+
+
+def test_waiting_readers_go_before_the_next_writer():
+    lock = ReadWriteLock()
+    order = []
+
+    lock.acquire_write()
+    reader = start_waiting(lock, "read", order)
+    writer = start_waiting(lock, "write", order)
+    lock.release_write()
+
+    for thread in (reader, writer):
+        thread.join(10)
+
+    assert order == ["read", "write"]
+
+
+def test_limiter_rejects_when_full():
+    limiter = Limiter(2)
+
+    assert limiter.try_acquire()
+    assert limiter.try_acquire()
+    assert not limiter.try_acquire()
+    assert limiter.rejected == 1
+
+    limiter.release()
+    assert limiter.try_acquire()
+
+
+def test_limiter_without_limit_admits_everything():
+    limiter = Limiter()
+
+    assert all(limiter.try_acquire() for _ in range(1000))
+    assert limiter.rejected == 0
@@ -0,0 +1,66 @@
+import os
+
+import pytest
+
+from corvus.shared.objects import ObjectRef, ObjectStore
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = ObjectStore(str(tmp_path / "memory"), str(tmp_path / "disk"), memory_limit=100)
+
+    yield store
+
+    store.destroy()
+
+
+def test_put_get_and_delete(store):
+    object_id, size = store.put({"values": [1, 2, 3]})
+
+    assert size == len(store.get_bytes(object_id))
+    assert store.get(object_id) == {"values": [1, 2, 3]}
+    assert store.contains(object_id)
+
+    assert store.delete(object_id)
+    assert not store.delete(object_id)
+    assert store.get_bytes(object_id) is None
+
+    with pytest.raises(KeyError):
+        store.get(object_id)
+
+
+def test_least_recently_used_objects_are_spilled(store):
+    ids = []
+    for i in range(2):
+        ids.append(store.put_bytes(b"x" * 40))
+        os.utime(os.path.join(store.directory, ids[-1]), (1000 + i, 1000 + i))
+
+    # the older object is read, so the other one is the least recently used by now
+    assert store.get_bytes(ids[0]) == b"x" * 40
+    ids.append(store.put_bytes(b"y" * 40))
+
+    assert os.listdir(store.spill_directory) == [ids[1]]
+    assert sorted(os.listdir(store.directory)) == sorted([ids[0], ids[2]])
+    assert store.stats["spilled"] == 1
+
+    # spilled objects are still read, from the disk
+    assert store.get_bytes(ids[1]) == b"x" * 40
+    assert store.stats["spill_reads"] == 1
+    assert store.delete(ids[1])
+
+
+def test_child_processes_open_the_same_store(store, monkeypatch):
+    object_id, _ = store.put("shared")
+
+    for key, value in store.environ().items():
+        monkeypatch.setenv(key, value)
+
+    assert ObjectStore.from_environ().get(object_id) == "shared"
+
+
+def test_refs_travel_as_dicts():
+    ref = ObjectRef("id", 10, "127.0.0.1", 9000)
+    sent = dict(vars(ref))
+
+    assert ObjectRef.is_ref(sent) and not ObjectRef.is_ref({"object_id": "id"})
+    assert ObjectRef.cast(sent).address == ("127.0.0.1", 9000)
@@ -0,0 +1,101 @@
+import threading
+import time
+
+import pytest
+
+pytest.importorskip("parseltongue")
+
+from corvus.shared.alpha.errors import RemoteException  # noqa: E402
+from corvus.shared.endpoint import Endpoint, Task  # noqa: E402
+from corvus.shared.pipeline import Pipeline  # noqa: E402
+
+
+class Stages(Endpoint):
+    def __init__(self, name: str, pipelines: bool=True):
+        super().__init__(name, self.run_task_from_flow)
+
+        self.add_task(Task(self.inc))
+        self.add_task(Task(self.add))
+        self.add_task(Task(self.fail))
+
+        self.failing = threading.Event()
+
+        if pipelines:
+            self.serve_pipelines()
+
+    def inc(self, data: int):
+        return data + 1
+
+    def add(self, data: list):
+        return sum(data)
+
+    def fail(self, data):
+        self.failing.wait(10)
+        raise ValueError("stage failed")
+
+
+@pytest.fixture
+def endpoints():
+    started = []
+
+    def start(name: str, pipelines: bool=True) -> Stages:
+        endpoint = Stages(name, pipelines)
+        endpoint.setup(("127.0.0.1", 1))  # no vertex, every endpoint is addressed directly
+        started.append(endpoint)
+
+        for other in started:
+            for endpoint in started:
+                other._targets[endpoint.name] = endpoint.address
+
+        return endpoint
+
+    yield start
+
+    for endpoint in started:
+        endpoint.stop()
+
+
+def test_pipeline_tasks_are_opt_in(endpoints):
+    plain = endpoints("plain", pipelines=False)
+
+    assert plain.get_task("pipeline_stage") is None
+    with pytest.raises(ValueError):
+        plain.run_pipeline(Pipeline.parse("plain/inc"))
+
+
+def test_pipeline_runs_stages_on_their_endpoints(endpoints):
+    a = endpoints("a")
+    endpoints("b")
+
+    pipeline = Pipeline()
+    first = pipeline.add("a/inc", {"data": 1})
+    left = pipeline.add("b/inc", after=first, name="left")
+    right = pipeline.add("a/inc", after=first, name="right")
+    pipeline.add("b/add", after=[left, right], name="sum")
+
+    assert a.run_pipeline(pipeline, timeout=10) == {"sum": 6}
+
+
+def test_failed_pipeline_drops_partial_inputs(endpoints):
+    a = endpoints("a")
+    b = endpoints("b")
+
+    pipeline = Pipeline()
+    first = pipeline.add("a/inc", {"data": 1})
+    left = pipeline.add("a/inc", after=first, name="left")
+    right = pipeline.add("a/fail", after=first, name="right")
+    pipeline.add("b/add", after=[left, right], name="sum")
+
+    def fail_once_sum_waits():
+        while not b.pipelines._inputs:
+            time.sleep(0.01)
+        a.failing.set()
+
+    threading.Thread(target=fail_once_sum_waits, daemon=True).start()
+
+    with pytest.raises(RemoteException, match="stage failed"):
+        a.run_pipeline(pipeline, timeout=10)
+
+    # the abandon is sent after run_pipeline raised
+    a.pipelines._executor.shutdown(wait=True)
+    assert b.pipelines._inputs == {}
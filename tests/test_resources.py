@@ -0,0 +1,59 @@
+import os
+import signal
+import subprocess
+import sys
+import time
+
+import pytest
+
+from corvus.node import resources
+from corvus.node.resources import ResourceSampler, changes
+
+
+@pytest.mark.skipif(not resources.AVAILABLE, reason="needs /proc")
+def test_app_run_by_a_shell_is_sampled():
+    # like an app started in exec mode, the shell stays the parent because it has more to run after the app
+    command = "{} -c 'while True: pass'; true".format(sys.executable)
+    shell = subprocess.Popen(command, shell=True)
+
+    try:
+        sampler = ResourceSampler()
+        sampler.sample({"app": shell.pid})
+        time.sleep(0.5)
+        sample = sampler.sample({"app": shell.pid})
+
+        assert sample["app/app/cpu"] > 0.5
+        assert sample["app/app/rss"] > 0
+    finally:
+        for pid in resources._tree(shell.pid, resources._children())[1:]:
+            os.kill(pid, signal.SIGTERM)
+        shell.wait()
+
+
+def test_only_changes_are_reported():
+    reported = {"cpu": 0.5, "memory": 1000.0, "app/gone/rss": 10.0}
+    sample = {"cpu": 0.505, "memory": 1100.0, "app/new/rss": 5.0}
+
+    assert changes(reported, sample) == {"memory": 1100.0, "app/new/rss": 5.0, "app/gone/rss": None}
+    assert changes(sample, sample) == {}
+
+
+@pytest.mark.skipif(not resources.AVAILABLE, reason="needs /proc")
+def test_child_pids_finds_the_app_under_its_shell():
+    shell = subprocess.Popen("{} -c 'import time; time.sleep(60)'; true".format(sys.executable), shell=True)
+
+    try:
+        give_up = time.time() + 10
+        while not resources.child_pids(shell.pid) and time.time() < give_up:
+            time.sleep(0.01)
+
+        app_pids = resources.child_pids(shell.pid)
+        assert len(app_pids) == 1
+
+        # signalling the app, not the shell, lets the shell finish once the app has exited
+        os.kill(app_pids[0], signal.SIGTERM)
+        assert shell.wait(10) == 0
+    finally:
+        if shell.poll() is None:
+            shell.kill()
+            shell.wait()
@@ -0,0 +1,32 @@
+import pytest
+
+from corvus.tools.ring import HashRing
+
+
+def test_replicas_are_distinct_and_start_with_the_owner():
+    ring = HashRing(["a", "b", "c"])
+
+    for i in range(100):
+        key = "endpoint-{}".format(i)
+        replicas = ring.get_replicas(key, 2)
+
+        assert replicas[0] == ring.get(key)
+        assert len(set(replicas)) == 2
+
+    assert sorted(ring.get_replicas("endpoint", 5)) == ["a", "b", "c"]
+
+
+def test_adding_a_shard_only_moves_keys_to_it():
+    keys = ["endpoint-{}".format(i) for i in range(1000)]
+    before = HashRing(["a", "b", "c"])
+    after = HashRing(["a", "b", "c", "d"])
+
+    moved = [key for key in keys if before.get(key) != after.get(key)]
+
+    assert all(after.get(key) == "d" for key in moved)
+    assert 0 < len(moved) < len(keys) / 2
+
+
+def test_ring_needs_a_shard():
+    with pytest.raises(ValueError):
+        HashRing([])
@@ -0,0 +1,25 @@
+from corvus.tools.stats import LatencyWindow
+
+
+def test_percentile_of_the_samples():
+    window = LatencyWindow()
+    assert window.percentile(0.95) is None
+
+    for ms in range(100, 0, -1):
+        window.add(ms / 1000)
+
+    assert window.percentile(0.0) == 0.001
+    assert window.percentile(0.5) == 0.051
+    assert window.percentile(0.95) == 0.096
+    assert window.percentile(1.0) == 0.1
+
+
+def test_old_samples_leave_the_window():
+    window = LatencyWindow(size=3)
+
+    for seconds in (5.0, 1.0, 2.0, 3.0, 4.0):
+        window.add(seconds)
+
+    assert len(window) == 3
+    assert window._sorted == [2.0, 3.0, 4.0]
+    assert window.percentile(1.0) == 4.0
@@ -0,0 +1,28 @@
+from corvus.vertex.model import VertexModel
+from corvus.vertex.store import RegistryStore
+
+
+def restart(directory) -> VertexModel:
+    model = VertexModel()
+    model.attach_store(RegistryStore(str(directory)))
+    return model
+
+
+def test_restart_after_partial_record(tmp_path):
+    model = restart(tmp_path)
+    node = model.add_node({}, ("10.0.0.1", 8000)).uuid
+    model.add_endpoint("first", {}, ("10.0.0.1", 9000), node)
+    model.close()
+
+    # the vertex died while writing a record
+    with open(str(tmp_path / "registry.log"), "ab") as log:
+        log.write(b'{"op": "endpoint", "na')
+
+    model = restart(tmp_path)
+    model.add_endpoint("second", {}, ("10.0.0.1", 9001), node)
+    model.close()
+
+    model = restart(tmp_path)
+    assert [e.address for e in model.get_endpoints("first")] == [("10.0.0.1", 9000)]
+    assert [e.address for e in model.get_endpoints("second")] == [("10.0.0.1", 9001)]
+    model.close()
@@ -0,0 +1,103 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from corvus.tools.triggers import Event, ScheduledTimer
+
+
+def due_after(catch_up: str, *times: float) -> list:
+    timer = ScheduledTimer(lambda index: None, 0.0, 1.0, catch_up)
+    return [timer.due(now) for now in times]
+
+
+def test_catch_up_on_time():
+    for catch_up in ("skip", "coalesce", "burst"):
+        assert due_after(catch_up, 0.0, 1.0, 2.1) == [[0], [1], [2]]
+
+
+def test_catch_up_behind():
+    # ticks 1 to 3 are due at once, then the timer is on time again
+    assert due_after("skip", 0.0, 3.5, 4.0) == [[0], [3], [4]]
+    assert due_after("coalesce", 0.0, 3.5, 4.0) == [[0], [1], [4]]
+    assert due_after("burst", 0.0, 3.5, 4.0) == [[0], [1, 2, 3], [4]]
+
+
+@pytest.fixture
+def executor():
+    executor = ThreadPoolExecutor(4)
+
+    yield executor
+
+    executor.shutdown(wait=True)
+
+
+def test_async_event_isolates_subscribers(executor):
+    event = Event(executor)
+    release = threading.Event()
+    seen = []
+    done = threading.Event()
+
+    def slow(n):
+        release.wait(10)
+
+    def failing(n):
+        raise ValueError("subscriber failed")
+
+    def fast(n):
+        seen.append(n)
+        if n == 9:
+            done.set()
+
+    for func in (slow, failing, fast):
+        event.subscribe(func)
+
+    try:
+        for n in range(10):
+            event.invoke(n)
+
+        # the slow subscriber is still stuck on its first delivery, and the failures did not stop the others
+        assert done.wait(10)
+        assert seen == list(range(10))
+
+        give_up = time.time() + 10
+        while event.stats["failed"] < 10 and time.time() < give_up:
+            time.sleep(0.01)
+        assert event.stats["failed"] == 10
+        assert event.stats["delivered"] == 10
+    finally:
+        release.set()
+
+
+def test_async_event_drops_the_oldest_delivery_when_full(executor):
+    event = Event(executor, max_pending=2)
+    release = threading.Event()
+    seen = []
+
+    def subscriber(n):
+        release.wait(10)
+        seen.append(n)
+
+    event.subscribe(subscriber)
+    event.invoke(0)  # taken by the drain right away, or still queued
+
+    give_up = time.time() + 10
+    while seen == [] and event._queues[subscriber]._pending and time.time() < give_up:
+        time.sleep(0.01)
+
+    for n in range(1, 5):
+        event.invoke(n)
+
+    release.set()
+    give_up = time.time() + 10
+    while len(seen) < 3 and time.time() < give_up:
+        time.sleep(0.01)
+
+    assert seen == [0, 3, 4]
+    assert event.stats["dropped"] == 2
+
+
+def test_event_window_needs_an_executor():
+    with pytest.raises(ValueError):
+        Event(window=1.0)
@@ -0,0 +1,74 @@
+import os
+import socket
+import time
+
+from corvus.shared.com import unix
+from corvus.shared.com.unix import UnixClient, UnixServer
+
+
+def test_closed_connections_are_forgotten():
+    server = UnixServer(lambda data: data)
+    server.open()
+    client = UnixClient()
+
+    try:
+        connections = [client.connect(server.address) for _ in range(3)]
+        assert connections[0].send(b"echo") == b"echo"
+
+        connections[0].close()
+        assert client.connections == set(connections[1:])
+
+        client.close()
+        assert client.connections == set()
+    finally:
+        server.close()
+
+
+def copy_of(listener: socket.socket) -> socket.socket:
+    """What a child process that inherited the listener has"""
+    return socket.socket(fileno=os.dup(listener.fileno()))
+
+
+def test_listener_is_handed_over_without_refusing_connections():
+    listener = unix.listen()
+    path = listener.getsockname()
+    old, new = UnixServer(lambda data: b"old", listener=copy_of(listener)), None
+    old.ACCEPT_POLL = 0.01
+    old.open()
+    client = UnixClient()
+
+    try:
+        kept = client.connect(path)
+        assert kept.send(b"") == b"old"
+
+        new = UnixServer(lambda data: b"new", listener=copy_of(listener))
+        new.open()
+        old.stop_accepting()
+        time.sleep(0.1)  # the old accept thread notices
+
+        # the open connection stays with the old server, new ones go to the new server only
+        assert kept.send(b"") == b"old"
+        assert [client.connect(path).send(b"") for _ in range(5)] == [b"new"] * 5
+        assert os.path.exists(path)
+    finally:
+        client.close()
+        old.close()
+        if new is not None:
+            new.close()
+        listener.close()
+        os.unlink(path)
+
+
+def test_inherited_listener_is_taken_once(monkeypatch):
+    listener = unix.listen()
+
+    try:
+        monkeypatch.setenv("CORVUS_LISTEN_FD", str(os.dup(listener.fileno())))
+
+        inherited = unix.inherited_listener()
+        assert inherited.getsockname() == listener.getsockname()
+        assert unix.inherited_listener() is None
+        inherited.close()
+    finally:
+        os.unlink(listener.getsockname())
+        listener.close()
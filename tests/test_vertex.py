@@ -0,0 +1,62 @@
+import pytest
+
+pytest.importorskip("parseltongue")
+
+from corvus.vertex.main import Vertex  # noqa: E402
+
+
+@pytest.fixture
+def replica():
+    """Shard 1 of a cluster of two, the owner at shard 0 is down"""
+    vertex = Vertex(0, [("127.0.0.1", 1), ("127.0.0.1", 2)], 1)
+
+    yield vertex
+
+    vertex.client.close()
+    vertex.model.close()
+
+
+def owned_by(vertex: Vertex, shard: int) -> str:
+    return next(name for name in ("endpoint{}".format(i) for i in range(100)) if vertex.ring.get(name) == shard)
+
+
+def test_replica_does_not_push_replicated_events(replica):
+    name = owned_by(replica, 0)
+    replica.replicate_watch(name, "watcher", "127.0.0.1", 3)
+
+    for port in range(5):
+        replica.replicate_endpoint(name, {}, "127.0.0.1", 4000 + port)
+
+    assert not replica._pushes_events(name)
+    assert replica._pushes_events(owned_by(replica, 1))
+
+
+def test_replica_pushes_events_once_taken_over(replica):
+    name = owned_by(replica, 0)
+
+    # the owner is down, so the registration comes to the replica directly
+    replica.connect_endpoint(name, {}, "127.0.0.1", 4000)
+    assert replica._pushes_events(name)
+
+    # the owner is back
+    replica.replicate_endpoint(name, {}, "127.0.0.1", 4001)
+    assert not replica._pushes_events(name)
+
+
+def test_old_payloads_are_taken(replica):
+    name = owned_by(replica, 1)
+
+    # sent by endpoints from before nodes and Unix domain sockets were registered
+    replica.run_task("connect_endpoint", name=name, resources={}, host="127.0.0.1", port=4000)
+    assert replica.run_task("lookup", endpoint_name=name)["port"] == 4000
+
+    with pytest.raises(Exception, match="Invalid arguments"):
+        replica.run_task("connect_endpoint", name=name, resources={}, host="127.0.0.1", port=4000, extra=1)
+
+
+def test_unreachable_shard_is_logged(replica, caplog):
+    name = owned_by(replica, 0)
+    replica.connect_endpoint(name, {}, "127.0.0.1", 4000)
+
+    assert [r.levelname for r in caplog.records if r.name == "corvus"] == ["WARNING"]
+    assert "Could not replicate to vertex shard 0" in caplog.text
@@ -0,0 +1,122 @@
+import threading
+import time
+from typing import Optional
+
+
+class CircuitBreaker:
+    """
+        Tracks the health of one remote replica, and decides whether requests to it go through.
+
+        "closed": requests go through. After failure_threshold consecutive failures the breaker opens.
+        "open": requests fail fast without touching the network. After reset_timeout the breaker is half-open.
+        "half-open": a single trial request goes through, success closes the breaker and failure opens it again.
+
+        Latency and error rate are kept as exponentially weighted averages, so the replicas of an endpoint can be
+        compared and an outlier can be tripped open with trip() even while it is still answering.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half-open"
+
+    def __init__(self, failure_threshold: int=5, reset_timeout: float=5.0, alpha: float=0.2) -> None:
+        if failure_threshold <= 0:
+            raise ValueError("failure_threshold for CircuitBreaker must be > 0")
+
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.alpha = alpha
+
+        self.state = CircuitBreaker.CLOSED
+        self.failures = 0  # consecutive failures
+        self.latency = None  # type: Optional[float]
+        self.error_rate = 0.0
+        self.calls = 0
+        self.trips = 0
+
+        self._opened_at = 0.0
+        self._open_for = reset_timeout
+        self._trial = False  # a half-open trial request is in flight
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        """
+            Check if a request may go through. In half-open, this takes the single trial slot, so every allowed
+            request must be followed by success() or failure()
+        """
+        with self._lock:
+            if self.state == CircuitBreaker.OPEN:
+                if time.monotonic() - self._opened_at < self._open_for:
+                    return False
+                self.state = CircuitBreaker.HALF_OPEN
+
+            if self.state == CircuitBreaker.HALF_OPEN:
+                if self._trial:
+                    return False
+                self._trial = True
+
+            return True
+
+    def available(self) -> bool:
+        """ Check if a request would be allowed, without taking the half-open trial slot. """
+        with self._lock:
+            if self.state == CircuitBreaker.OPEN:
+                return time.monotonic() - self._opened_at >= self._open_for
+            return not (self.state == CircuitBreaker.HALF_OPEN and self._trial)
+
+    def success(self, latency: float) -> None:
+        """
+            Record a request that was answered
+
+        :param latency: seconds the request took
+        """
+        with self._lock:
+            self._record(0.0)
+            self.latency = latency if self.latency is None else self.latency + self.alpha * (latency - self.latency)
+            self.failures = 0
+
+            if self.state == CircuitBreaker.HALF_OPEN:
+                self.state = CircuitBreaker.CLOSED
+                self._trial = False
+
+    def failure(self) -> None:
+        """ Record a request that could not be answered. """
+        with self._lock:
+            self._record(1.0)
+            self.failures += 1
+
+            if self.state == CircuitBreaker.HALF_OPEN or self.failures >= self.failure_threshold:
+                self._open(self.reset_timeout)
+
+    def trip(self, duration: float=None) -> None:
+        """
+            Open the breaker now, regardless of its failures
+
+        :param duration: seconds to stay open before the half-open trial, reset_timeout by default
+        """
+        with self._lock:
+            self._open(duration if duration is not None else self.reset_timeout)
+
+    def _record(self, error: float) -> None:
+        self.calls += 1
+        self.error_rate += self.alpha * (error - self.error_rate)
+
+    def _open(self, duration: float) -> None:
+        if self.state != CircuitBreaker.OPEN:
+            self.trips += 1
+
+        self.state = CircuitBreaker.OPEN
+        self._opened_at = time.monotonic()
+        self._open_for = duration
+        self._trial = False
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "state": self.state,
+                "calls": self.calls,
+                "trips": self.trips,
+                "failures": self.failures,
+                "error_rate": self.error_rate,
+                "latency": self.latency
+            }
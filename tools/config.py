@@ -1,7 +1,10 @@
 import json
-from typing import Tuple, Dict, Any, List
+import os
+from types import MappingProxyType
+from typing import Tuple, Dict, Any, List, Mapping, Callable
 
 from corvus.tools.printing import tree
+from corvus.tools.triggers import Event, TimerScheduler, default_scheduler
 
 
 class Config:
@@ -52,15 +55,17 @@ class Config:
         :param keys: The keys that will be merged in the resulting config
         :return: The merged config
         """
-        
-        new_data = {}
-        
-        for key in keys:
-            new_data = Config.merge(new_data, self.select(key).as_dict())
-        
-        config = Config()
-        config.load_dict(new_data)
-        return config
+        return self.overlay(keys).flatten()
+
+    def overlay(self, keys: List[str]) -> 'LayeredConfig':
+        """
+            Similar to multi_select(), but nothing is merged up front. The selected configs are layered, and each
+            lookup goes through the layers, later keys shadowing earlier ones
+
+        :param keys: The keys of the layers, from bottom to top
+        :return: The layered view
+        """
+        return LayeredConfig([self[key] for key in keys])
 
     def load_json(self, path: str) -> 'Config':
         """
@@ -213,3 +218,294 @@ class Config:
             return False
 
         return self._data == other.as_dict()
+
+    def freeze(self) -> 'FrozenConfig':
+        """
+            Create an immutable snapshot of the Config, with precomputed paths for fast lookups
+
+        :return: the frozen snapshot
+        """
+        return FrozenConfig(self._data)
+
+
+def _freeze(value: Any) -> Any:
+    if isinstance(value, Mapping):
+        return MappingProxyType({k: _freeze(v) for k, v in value.items()})
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(v) for v in value)
+    return value
+
+
+def _thaw(value: Any) -> Any:
+    if isinstance(value, Mapping):
+        return {k: _thaw(v) for k, v in value.items()}
+    if isinstance(value, tuple):
+        return [_thaw(v) for v in value]
+    return value
+
+
+class FrozenConfig:
+    """
+        An immutable snapshot of a Config. Every "/" separated path is flattened into an index when the snapshot is
+        built, so a lookup is a single dict access, and values are returned without copying. Nested dictionaries are
+        returned as read-only mappings and lists as tuples
+    """
+
+    def __init__(self, data: Mapping):
+        self._data = _freeze(data)
+        self._index = {}
+        self._flatten(self._data, "")
+
+    def _flatten(self, d: Mapping, prefix: str) -> None:
+        for k, v in d.items():
+            path = prefix + k
+            self._index[path] = v
+
+            if isinstance(v, Mapping):
+                self._flatten(v, path + "/")
+
+    def get(self, key: str, default: Any = None) -> Any:
+        """
+            Get a value from the config, with an optional default if the key is not found
+
+        :param key: The "/" separated key of the data
+        :param default: The value returned if the key does not exist
+        :return: The value associated with the given key
+        """
+        return self._index.get(key, default)
+
+    def __getitem__(self, key: str) -> Any:
+        try:
+            return self._index[key]
+        except KeyError:
+            raise Config.not_found(key, self.as_dict()) from None
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._index
+
+    def accessor(self, key: str) -> Callable[[], Any]:
+        """
+            Resolve a key once, and get a handle that returns its value
+
+        :param key: The "/" separated key of the data
+        :return: A function that returns the value
+        """
+        value = self[key]
+        return lambda: value
+
+    def select(self, key: str) -> 'FrozenConfig':
+        """
+            Select a subconfig
+
+        :param key: The name of the key for the subconfig
+        :return: The subconfig
+        """
+        return FrozenConfig(self[key])
+
+    def as_dict(self) -> dict:
+        """
+            Return a mutable copy of the snapshot as a dictionary
+
+        :return: the dictionary version of the snapshot
+        """
+        return _thaw(self._data)
+
+    def __str__(self) -> str:
+        return tree("Config", self.as_dict())
+
+    def __eq__(self, other) -> bool:
+        if type(other) is not FrozenConfig:
+            return False
+
+        return self._index == other._index
+
+
+def _merge_into(merged: dict, d: dict) -> None:
+    # same rules as Config.merge, but merges in place so that stacking many layers stays linear
+    for k, v in d.items():
+        if k not in merged:
+            merged[k] = _copy_dicts(v)
+            continue
+
+        d1 = isinstance(v, dict)
+        d2 = isinstance(merged[k], dict)
+
+        if d1 and d2:
+            _merge_into(merged[k], v)
+        elif not d1 and not d2:
+            merged[k] = v  # override existing value
+        else:
+            raise Exception("Cannot Merge")
+
+
+def _copy_dicts(value: Any) -> Any:
+    # copies only the dictionaries, _merge_into must never modify a layer's own dicts
+    if isinstance(value, dict):
+        return {k: _copy_dicts(v) for k, v in value.items()}
+    return value
+
+
+class LayeredConfig:
+    """
+        A read-only view over a stack of config layers. Nothing is merged when the view is made, a lookup walks the
+        layers and later layers shadow earlier ones, exactly as if they had been merged with Config.merge. Conflicts
+        that merge would reject (a dictionary in one layer, a value in another) raise when a lookup runs into them.
+        flatten() merges everything once, in time linear in the size of the layers
+    """
+
+    def __init__(self, layers: List[dict]):
+        self._layers = list(layers)
+        self._flat = None
+
+    def _lookup(self, key: str) -> List[Any]:
+        """
+            Find the values at key in every layer that has one
+
+        :param key: The "/" separated key
+        :return: The values, bottom layer first. Empty if no layer has the key
+        """
+        nodes = self._layers
+
+        for k in key.split("/"):
+            if not all(isinstance(n, dict) for n in nodes):
+                return []  # traversing into a value
+
+            nodes = [n[k] for n in nodes if k in n]
+
+            dicts = sum(1 for n in nodes if isinstance(n, dict))
+            if 0 < dicts < len(nodes):
+                raise Exception("Cannot Merge")  # If this error comes up often, give a nicer error message
+
+        return nodes
+
+    def _resolve(self, values: List[Any]) -> Any:
+        if isinstance(values[-1], dict):
+            merged = {}
+            for value in values:
+                _merge_into(merged, value)
+            return merged
+
+        return values[-1]
+
+    def get(self, key: str, default: Any = None) -> Any:
+        """
+            Get a value from the top-most layer that has it, with an optional default if no layer does
+
+        :param key: The "/" separated key of the data
+        :param default: The value returned if the key does not exist
+        :return: The value associated with the given key, dictionaries are merged over all layers
+        """
+        values = self._lookup(key)
+        return self._resolve(values) if values else default
+
+    def __getitem__(self, key: str) -> Any:
+        values = self._lookup(key)
+
+        if not values:
+            raise Config.not_found(key, self.flatten().as_dict())
+
+        return self._resolve(values)
+
+    def select(self, key: str) -> 'LayeredConfig':
+        """
+            Select a subconfig, still layered
+
+        :param key: The name of the key for the subconfig
+        :return: The layered subconfig
+        """
+        values = self._lookup(key)
+
+        if not values or not isinstance(values[-1], dict):
+            raise Config.not_found(key, self.flatten().as_dict(), "Can only select a dictionary")
+
+        return LayeredConfig(values)
+
+    def flatten(self) -> Config:
+        """
+            Merge all layers into a single Config, only done once per view
+
+        :return: The merged config
+        """
+        if self._flat is None:
+            merged = {}
+            for layer in self._layers:
+                _merge_into(merged, layer)
+            self._flat = Config(data=merged)
+
+        return self._flat
+
+    def as_dict(self) -> dict:
+        return self.flatten().as_dict()
+
+    def __str__(self) -> str:
+        return str(self.flatten())
+
+
+class ReloadingConfig:
+    """
+        Keeps a FrozenConfig of a .json file up to date. The file's modification time is checked every interval seconds,
+        and when it changes a new snapshot is built and swapped in whole, so readers always see a complete snapshot.
+        on_reload is invoked with each new snapshot
+    """
+
+    def __init__(self, json_path: str, interval: float=None, scheduler: TimerScheduler=None):
+        self.path = json_path
+        self.snapshot = None  # type: FrozenConfig
+        self.on_reload = Event()
+
+        self._mtime = None
+        self.reload()
+
+        self._scheduler = scheduler if scheduler is not None else default_scheduler
+        self._timer = None
+
+        if interval is not None:
+            self._timer = self._scheduler.schedule(interval, lambda _: self.reload(), interval, "skip")
+
+    def reload(self) -> bool:
+        """
+            Load the file again if it changed since it was last loaded
+
+        :return: True if a new snapshot was swapped in
+        """
+        mtime = os.stat(self.path).st_mtime_ns
+        if mtime == self._mtime:
+            return False
+
+        try:
+            with open(self.path) as file:
+                data = json.load(file)
+        except ValueError as e:
+            if self.snapshot is None:
+                raise
+
+            # probably caught the file halfway through being written, keep the current snapshot and try again later
+            print("Could not reload config {}: {}".format(self.path, e))
+            return False
+
+        self.snapshot = FrozenConfig(data)
+        self._mtime = mtime
+        self.on_reload.invoke(self.snapshot)
+
+        return True
+
+    def get(self, key: str, default: Any = None) -> Any:
+        return self.snapshot.get(key, default)
+
+    def __getitem__(self, key: str) -> Any:
+        return self.snapshot[key]
+
+    def accessor(self, key: str) -> Callable[[], Any]:
+        """
+            Resolve a key once, and get a handle that returns its value in the current snapshot
+
+        :param key: The "/" separated key of the data
+        :return: A function that returns the value
+        """
+        self.snapshot[key]  # fail now if the key doesn't exist
+        return lambda: self.snapshot._index[key]
+
+    def close(self) -> None:
+        if self._timer is not None:
+            self._scheduler.cancel(self._timer)
+            self._timer = None
@@ -0,0 +1,68 @@
+import threading
+from concurrent import futures
+from concurrent.futures import Future
+from typing import Any, Callable, Iterable, Iterator, List
+
+
+def gather(fs: Iterable[Future], timeout: float=None, return_exceptions: bool=False) -> List[Any]:
+    """
+        Wait for every future, and get their results in the order the futures were given
+
+    :param fs: the futures to wait for
+    :param timeout: seconds to wait for all of them, raises concurrent.futures.TimeoutError when it passes
+    :param return_exceptions: put the exception of a failed future in the results instead of raising it
+    """
+    fs = list(fs)
+    return_when = futures.ALL_COMPLETED if return_exceptions else futures.FIRST_EXCEPTION
+    done, pending = futures.wait(fs, timeout, return_when=return_when)
+
+    if not return_exceptions:
+        for future in fs:
+            if future in done and future.exception() is not None:
+                raise future.exception()
+
+    if pending:
+        raise futures.TimeoutError("{} of {} futures did not complete in time".format(len(pending), len(fs)))
+
+    return [f.result() if f.exception() is None else f.exception() for f in fs]
+
+
+def as_completed(fs: Iterable[Future], timeout: float=None) -> Iterator[Future]:
+    """
+        Yield the futures as they complete, fastest first
+
+    :param fs: the futures to wait for
+    :param timeout: seconds to wait for all of them, raises concurrent.futures.TimeoutError when it passes
+    """
+    return futures.as_completed(list(fs), timeout)
+
+
+def submit_bounded(submit: Callable[[Any], Future], items: Iterable[Any], limit: int) -> List[Future]:
+    """
+        Submit a call for every item, with at most limit of them running at once. Blocks while the limit is reached,
+        and returns once the last item is submitted
+
+    :param submit: starts the call for an item and returns its future
+    :param items: the items to submit
+    :param limit: how many calls can be running at once
+    :return: the futures of every item, in the order of items
+    """
+    if limit <= 0:
+        raise ValueError("limit for submit_bounded must be > 0")
+
+    slots = threading.BoundedSemaphore(limit)
+    submitted = []
+
+    for item in items:
+        slots.acquire()
+
+        try:
+            future = submit(item)
+        except BaseException:
+            slots.release()
+            raise
+
+        future.add_done_callback(lambda _: slots.release())
+        submitted.append(future)
+
+    return submitted
@@ -1,38 +1,141 @@
 import threading
+import time
+from contextlib import contextmanager
 from threading import Lock
 
 
 class ReadWriteLock:
+    """
+    A fair reader-writer lock. Writers are preferred: once a writer is waiting, new readers queue behind it. When a
+    writer releases the lock, every reader that was already waiting gets in before the next writer, so a steady stream
+    of writers can not starve readers either.
+
+    stats counts acquisitions, how many of them had to wait, and the total and longest wait in seconds.
+    """
+
     def __init__(self) -> None:
-        self._read_ready = threading.Condition(Lock())
+        self._condition = threading.Condition(Lock())
         self._readers = 0
+        self._writer = False
+
+        self._waiting_readers = 0
+        self._waiting_writers = 0
+        self._admitted = 0  # waiting readers let in by the last writer, writers wait for them to enter first
+        self._phase = 0  # incremented every time a writer lets waiting readers in
+
+        self.stats = {
+            "reads": 0,
+            "writes": 0,
+            "contended_reads": 0,
+            "contended_writes": 0,
+            "read_wait": 0.0,
+            "write_wait": 0.0,
+            "max_wait": 0.0
+        }
 
     def acquire_read(self) -> None:
-        """ Acquire a read lock. Blocks only if a thread has
-        acquired the write lock. """
-        self._read_ready.acquire()
-        try:
+        """ Acquire a read lock. Blocks if a thread holds, or is waiting for, the write lock. """
+        with self._condition:
+            if self._writer or self._waiting_writers:
+                start = time.perf_counter()
+                phase = self._phase
+                self._waiting_readers += 1
+
+                while self._writer or (self._waiting_writers and self._phase == phase):
+                    self._condition.wait()
+
+                self._waiting_readers -= 1
+                if self._phase != phase:
+                    self._admitted -= 1
+
+                self._record_wait("read", time.perf_counter() - start)
+
             self._readers += 1
-        finally:
-            self._read_ready.release()
+            self.stats["reads"] += 1
 
     def release_read(self) -> None:
         """ Release a read lock. """
-        self._read_ready.acquire()
-        try:
+        with self._condition:
             self._readers -= 1
             if not self._readers:
-                self._read_ready.notifyAll()
-        finally:
-            self._read_ready.release()
+                self._condition.notify_all()
 
     def acquire_write(self) -> None:
-        """ Acquire a write lock. Blocks until there are no
-        acquired read or write locks. """
-        self._read_ready.acquire()
-        while self._readers > 0:
-            self._read_ready.wait()
+        """ Acquire a write lock. Blocks until there are no acquired read or write locks. """
+        with self._condition:
+            if self._writer or self._readers or self._admitted:
+                start = time.perf_counter()
+                self._waiting_writers += 1
+
+                while self._writer or self._readers or self._admitted:
+                    self._condition.wait()
+
+                self._waiting_writers -= 1
+                self._record_wait("write", time.perf_counter() - start)
+
+            self._writer = True
+            self.stats["writes"] += 1
 
     def release_write(self) -> None:
         """ Release a write lock. """
-        self._read_ready.release()
+        with self._condition:
+            self._writer = False
+
+            if self._waiting_readers:
+                self._phase += 1
+                self._admitted = self._waiting_readers
+
+            self._condition.notify_all()
+
+    @contextmanager
+    def read(self):
+        """ Hold a read lock for the duration of a with block. """
+        self.acquire_read()
+        try:
+            yield
+        finally:
+            self.release_read()
+
+    @contextmanager
+    def write(self):
+        """ Hold the write lock for the duration of a with block. """
+        self.acquire_write()
+        try:
+            yield
+        finally:
+            self.release_write()
+
+    def _record_wait(self, kind: str, wait: float) -> None:
+        self.stats["contended_" + kind + "s"] += 1
+        self.stats[kind + "_wait"] += wait
+        self.stats["max_wait"] = max(self.stats["max_wait"], wait)
+
+
+class Limiter:
+    """
+    Non-blocking counter that admits at most 'limit' holders at once. A limit of None admits everything
+    """
+
+    def __init__(self, limit: int=None) -> None:
+        if limit is not None and limit <= 0:
+            raise ValueError("limit for Limiter must be > 0")
+
+        self.limit = limit
+        self.count = 0
+        self.rejected = 0
+        self._lock = Lock()
+
+    def try_acquire(self) -> bool:
+        """ Take a slot if one is free, returns False instead of blocking when full. """
+        with self._lock:
+            if self.limit is not None and self.count >= self.limit:
+                self.rejected += 1
+                return False
+
+            self.count += 1
+            return True
+
+    def release(self) -> None:
+        """ Free a slot taken by try_acquire. """
+        with self._lock:
+            self.count -= 1
@@ -0,0 +1,55 @@
+import bisect
+import hashlib
+from typing import Any, List
+
+
+def _hash(key: str) -> int:
+    # hash() is randomized per process, every process in the cluster has to agree on where a key lives
+    return int(hashlib.md5(key.encode()).hexdigest()[:16], 16)
+
+
+class HashRing:
+    """
+        Consistent hash ring that maps keys onto shards. Adding or removing a shard only moves the keys of that shard
+    """
+
+    def __init__(self, shards: List[Any], vnodes: int=64) -> None:
+        if not shards:
+            raise ValueError("HashRing needs at least one shard")
+
+        self.shards = list(shards)
+
+        points = sorted((_hash("{}#{}".format(shard, i)), n) for n, shard in enumerate(self.shards)
+                        for i in range(vnodes))
+        self._hashes = [h for h, _ in points]
+        self._owners = [n for _, n in points]
+
+    def get(self, key: str) -> Any:
+        """
+            Get the shard that owns the key
+
+        :param key: the key to look up
+        :return: the owning shard
+        """
+        return self.get_replicas(key, 1)[0]
+
+    def get_replicas(self, key: str, count: int) -> List[Any]:
+        """
+            Get the distinct shards that hold the key, the owner first followed by its replicas
+
+        :param key: the key to look up
+        :param count: how many shards to return, at most the number of shards in the ring
+        :return: the shards, in order of preference
+        """
+        count = min(count, len(self.shards))
+        start = bisect.bisect(self._hashes, _hash(key))
+
+        found = []
+        for i in range(len(self._owners)):
+            n = self._owners[(start + i) % len(self._owners)]
+            if n not in found:
+                found.append(n)
+                if len(found) == count:
+                    break
+
+        return [self.shards[n] for n in found]
@@ -0,0 +1,41 @@
+import bisect
+import threading
+from collections import deque
+from typing import Optional
+
+
+class LatencyWindow:
+    """
+        Keeps the most recent latency samples, and answers percentile queries over them
+
+        The samples are also kept in sorted order as they come and go, so a query is a single index instead of a sort
+    """
+
+    def __init__(self, size: int=1000) -> None:
+        self._samples = deque(maxlen=size)
+        self._sorted = []
+        self._lock = threading.Lock()
+
+    def add(self, seconds: float) -> None:
+        with self._lock:
+            if len(self._samples) == self._samples.maxlen:
+                del self._sorted[bisect.bisect_left(self._sorted, self._samples[0])]
+
+            self._samples.append(seconds)
+            bisect.insort(self._sorted, seconds)
+
+    def percentile(self, p: float) -> Optional[float]:
+        """
+            Get the latency that p of the samples are at or below
+
+        :param p: the percentile, between 0 and 1
+        :return: the latency in seconds, None if there are no samples yet
+        """
+        with self._lock:
+            if not self._sorted:
+                return None
+
+            return self._sorted[min(int(p * len(self._sorted)), len(self._sorted) - 1)]
+
+    def __len__(self) -> int:
+        return len(self._samples)
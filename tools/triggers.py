@@ -1,7 +1,12 @@
+import heapq
+import itertools
+import time
+import traceback
+from collections import deque
+from concurrent.futures import Executor
 from datetime import timedelta, datetime
-from threading import Thread
 import threading
-from typing import Any
+from typing import Any, List, Optional, Dict
 import inspect
 
 from abc import ABC, abstractmethod
@@ -15,9 +20,29 @@ from typing import Callable
 class Event:
     """
         Events are used to create a publish subscriber pattern
+
+        By default subscribers are called synchronously and in order by Event.invoke(). If an executor is given,
+        invoke() only queues a delivery for each subscriber and returns. Every subscriber has its own queue that is
+        drained on the executor, so a subscriber sees its deliveries in order, but a slow or failing subscriber does
+        not hold up or break the others.
+
+        With an executor, a window (seconds) coalesces high frequency events: a subscriber is called at most once per
+        window, with the latest args. max_pending bounds each subscriber's queue, the oldest delivery is dropped when
+        it is full. stats counts delivered, dropped, delayed (queued behind another delivery) and failed deliveries
     """
-    def __init__(self) -> None:
+    def __init__(self, executor: Executor=None, window: float=None, max_pending: int=None) -> None:
+        if window is not None and executor is None:
+            raise ValueError("Event window requires an executor")
+
         self.subs = []
+        self.executor = executor
+        self.window = window
+        self.max_pending = max_pending
+
+        self.stats = {"delivered": 0, "dropped": 0, "delayed": 0, "failed": 0}  # type: Dict[str, int]
+
+        self._queues = {}  # type: Dict[Callable, _SubscriberQueue]
+        self._stats_lock = threading.Lock()
 
     def subscribe(self, func: Callable) -> None:
         """
@@ -27,6 +52,9 @@ class Event:
         """
         self.subs.append(func)
 
+        if self.executor is not None:
+            self._queues[func] = _SubscriberQueue(self, func)
+
     def unsubscribe(self, func: Callable) -> None:
         """
             Unsubscribe from the event
@@ -34,6 +62,7 @@ class Event:
         :param func: the function to unsubscribe
         """
         self.subs.remove(func)
+        self._queues.pop(func, None)
 
     def invoke(self, *args) -> None:
         """
@@ -41,13 +70,93 @@ class Event:
 
         :param args: the args to back to subscribers
         """
-        for func in self.subs:
-            func(*args)
+        if self.executor is None:
+            for func in self.subs:
+                func(*args)
+            return
+
+        for func in list(self.subs):
+            queue = self._queues.get(func)
+            if queue is not None:
+                queue.push(args)
+
+    def _count(self, stat: str, amount: int=1) -> None:
+        with self._stats_lock:
+            self.stats[stat] += amount
+
+
+class _SubscriberQueue:
+    """
+        The pending deliveries of one subscriber of an asynchronous Event, at most one drain runs at a time
+    """
+
+    def __init__(self, event: Event, func: Callable) -> None:
+        self.event = event
+        self.func = func
+
+        self._pending = deque()
+        self._draining = False
+        self._lock = threading.Lock()
+
+    def push(self, args: tuple) -> None:
+        event = self.event
+
+        with self._lock:
+            if self._pending or self._draining:
+                event._count("delayed")
+
+            if event.window is not None and self._pending:
+                # only the latest args are delivered once the window is over
+                event._count("dropped", len(self._pending))
+                self._pending.clear()
+            elif event.max_pending is not None and len(self._pending) >= event.max_pending:
+                self._pending.popleft()
+                event._count("dropped")
+
+            self._pending.append(args)
+
+            if self._draining:
+                return
+            self._draining = True
+
+        self._schedule()
+
+    def _schedule(self) -> None:
+        if self.event.window is None:
+            self.event.executor.submit(self._drain)
+        else:
+            default_scheduler.schedule(self.event.window, lambda _: self.event.executor.submit(self._drain))
+
+    def _drain(self) -> None:
+        while True:
+            with self._lock:
+                if not self._pending:
+                    self._draining = False
+                    return
+
+                args = self._pending.popleft()
+
+            try:
+                self.func(*args)
+                self.event._count("delivered")
+            except Exception:
+                self.event._count("failed")
+                traceback.print_exc()
+
+            if self.event.window is not None:
+                with self._lock:
+                    if not self._pending:
+                        self._draining = False
+                        return
+
+                # wait out the next window before delivering what arrived in the meantime
+                self._schedule()
+                return
 
 
 class Trigger(ABC):
-    def __init__(self) -> None:
-        self.on_trigger = Event()
+    def __init__(self, event: Event=None) -> None:
+        self.on_trigger = event if event is not None else Event()
         self.primed = False
 
         self._invoke = self.on_trigger.invoke
@@ -93,54 +202,184 @@ class FunctionTrigger(Trigger):
         self.locked = True
 
 
+class ScheduledTimer:
+    """
+        A timer in a TimerScheduler. The callback is given the index of the tick it is run for, tick n is due
+        n * interval after the first
+    """
+
+    def __init__(self, callback: Callable[[int], Any], start: float, interval: Optional[float], catch_up: str):
+        self.callback = callback
+        self.start = start
+        self.interval = interval
+        self.catch_up = catch_up
+
+        self.index = 0
+        self.cancelled = False
+
+    @property
+    def deadline(self) -> float:
+        if self.interval is None:
+            return self.start
+        return self.start + self.index * self.interval
+
+    def due(self, now: float) -> List[int]:
+        """
+            Advance past every tick that is due, and get the ticks that should run now according to catch_up
+
+        :param now: the current monotonic time
+        :return: the indices of the ticks to run
+        """
+        if self.interval is None:
+            return [0]
+
+        first = self.index
+        last = first + int((now - self.deadline) / self.interval)  # the latest tick that is due
+        self.index = last + 1
+
+        if self.catch_up == "burst":
+            return list(range(first, last + 1))
+        elif self.catch_up == "coalesce":
+            return [first]
+        else:  # skip, the latest tick runs and the ones before it are dropped
+            return [last]
+
+
+class TimerScheduler:
+    """
+        Runs any number of periodic and one-shot timers from a single thread. Timers are kept in a heap ordered by
+        their next deadline on the monotonic clock, so wall clock changes do not affect them.
+
+        When the scheduler falls behind, each timer's catch_up policy decides what happens to the ticks it missed:
+        "skip" runs only the latest of them, "coalesce" runs a single tick for all of them, "burst" runs every one of
+        them
+    """
+
+    CATCH_UP = ("skip", "coalesce", "burst")
+
+    def __init__(self) -> None:
+        self._heap = []
+        self._sequence = itertools.count()  # breaks ties between equal deadlines, first scheduled runs first
+        self._condition = threading.Condition()
+        self._thread = None
+
+    def schedule(self,
+                 delay: float,
+                 callback: Callable[[int], Any],
+                 interval: float=None,
+                 catch_up: str="coalesce") -> ScheduledTimer:
+        """
+            Schedule a callback on the scheduler's thread
+
+        :param delay: seconds until the first run
+        :param callback: called with the index of the tick it is run for
+        :param interval: seconds between runs, None to run only once
+        :param catch_up: what to do with missed ticks, one of TimerScheduler.CATCH_UP
+        :return: the timer, pass it to cancel() to stop it
+        """
+        if interval is not None and interval <= 0:
+            raise ValueError("interval for TimerScheduler must be > 0")
+
+        if catch_up not in TimerScheduler.CATCH_UP:
+            raise ValueError("catch_up must be one of {}".format(", ".join(TimerScheduler.CATCH_UP)))
+
+        timer = ScheduledTimer(callback, time.monotonic() + max(delay, 0), interval, catch_up)
+
+        with self._condition:
+            heapq.heappush(self._heap, (timer.deadline, next(self._sequence), timer))
+
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="TimerScheduler", daemon=True)
+                self._thread.start()
+
+            self._condition.notify()
+
+        return timer
+
+    def cancel(self, timer: ScheduledTimer) -> None:
+        """
+            Stop a timer, it is dropped from the heap the next time it comes up
+
+        :param timer: the timer returned by schedule()
+        """
+        with self._condition:
+            timer.cancelled = True
+            self._condition.notify()
+
+    def _run(self) -> None:
+        while True:
+            with self._condition:
+                if not self._heap:
+                    self._condition.wait()
+                    continue
+
+                deadline, _, timer = self._heap[0]
+                now = time.monotonic()
+
+                if timer.cancelled:
+                    heapq.heappop(self._heap)
+                    continue
+
+                if deadline > now:
+                    self._condition.wait(deadline - now)
+                    continue
+
+                heapq.heappop(self._heap)
+                ticks = timer.due(now)
+
+                if timer.interval is not None:
+                    heapq.heappush(self._heap, (timer.deadline, next(self._sequence), timer))
+
+            for index in ticks:
+                if timer.cancelled:
+                    break
+
+                try:
+                    timer.callback(index)
+                except Exception:
+                    # one broken timer must not stop every other timer on the thread
+                    traceback.print_exc()
+
+
+default_scheduler = TimerScheduler()
+
+
 class TimerTrigger(Trigger):
     def __init__(self,
                  duration: timedelta,
                  run_on_start: bool=True,
                  quantize: bool=True,
-                 offset: timedelta=timedelta(0)):
+                 offset: timedelta=timedelta(0),
+                 catch_up: str="coalesce",
+                 scheduler: TimerScheduler=None,
+                 event: Event=None):
 
-        super().__init__()
+        super().__init__(event)
 
         if duration <= timedelta(milliseconds=0):
             raise ValueError("duration for TimerTrigger must be > 0")
 
+        if catch_up not in TimerScheduler.CATCH_UP:
+            raise ValueError("catch_up must be one of {}".format(", ".join(TimerScheduler.CATCH_UP)))
+
         self.duration = duration
         self.offset = offset
         self.run_on_start = run_on_start
         self.quantized = quantize
+        self.catch_up = catch_up
 
-        self.timer = Thread(target=self.tick, name="TimerTrigger Timer")
+        self.scheduler = scheduler if scheduler is not None else default_scheduler
         self.next_trigger = None
 
         self.time_format = "%Y/%m/%d %H:%M:%S %f %Z%z"
 
-        self._closing = threading.Event()
-
-    def tick(self) -> None:
-        if self.quantized:
-            self.next_trigger = quantize_time(self.duration, self.offset, True)
-        else:
-            self.next_trigger = datetime.utcnow() + self.duration
+        self._first_trigger = None
+        self._timers = []
 
-        if self.run_on_start:
-            self._invoke(datetime.utcnow())
-
-        while True:
-            sleep_time = (self.next_trigger - datetime.utcnow()).total_seconds()
-            if sleep_time < 0:
-                raise Exception("Next trigger was set in past ({})".format(self.next_trigger))
-            self._closing.wait(sleep_time)
-
-            if self._closing.is_set():
-                break
-
-            # next_trigger is actually current_trigger at this point
-            self._invoke(self.next_trigger)
-
-            # while loop prevents things from getting backed up if there are problems
-            while self.next_trigger <= datetime.utcnow():
-                self.next_trigger += self.duration
+    def _tick(self, index: int) -> None:
+        current_trigger = self._first_trigger + index * self.duration
+        self.next_trigger = current_trigger + self.duration
+        self._invoke(current_trigger)
 
     def subscribe(self, func: Callable):
         sig = inspect.signature(func)
@@ -152,13 +391,25 @@ class TimerTrigger(Trigger):
         super().subscribe(func)
 
     def _prime(self) -> None:
-        self.timer.start()
+        if self.quantized:
+            self._first_trigger = quantize_time(self.duration, self.offset, True)
+        else:
+            self._first_trigger = datetime.utcnow() + self.duration
+
+        self.next_trigger = self._first_trigger
+
+        if self.run_on_start:
+            self._timers.append(self.scheduler.schedule(0, lambda _: self._invoke(datetime.utcnow())))
+
+        delay = (self._first_trigger - datetime.utcnow()).total_seconds()
+        interval = self.duration.total_seconds()
+        self._timers.append(self.scheduler.schedule(delay, self._tick, interval, self.catch_up))
 
     def _close(self, wait=True) -> None:
-        self._closing.set()
+        for timer in self._timers:
+            self.scheduler.cancel(timer)
 
-        if wait and self.timer.is_alive():
-            self.timer.join()
+        self._timers = []
 
     def __eq__(self, other: Any) -> bool:
         return isinstance(other, TimerTrigger) and \
@@ -0,0 +1,201 @@
+import heapq
+import threading
+import time
+from collections import deque
+from typing import Dict, List, Optional
+from uuid import uuid4
+
+
+class WorkItem:
+    def __init__(self, task: str, args: dict):
+        self.id = str(uuid4())
+        self.task = task
+        self.args = args
+        self.attempts = 0
+
+        self.worker = None
+        self.deadline = None
+
+    def describe(self) -> dict:
+        return {"id": self.id, "task": self.task, "args": self.args, "attempts": self.attempts}
+
+
+class WorkQueue:
+    """
+    The queued invocations of one endpoint name. Workers pull batches of items, an item is then in flight until the
+    worker acks it. An item that is not acked within its visibility timeout is put back at the front of the queue and
+    delivered again, so an item runs at least once. After MAX_ATTEMPTS deliveries it fails instead.
+
+    The first ack of an item is kept as its result until the caller collects it, later acks are ignored. Results that
+    are never collected are dropped after RESULT_TTL seconds
+    """
+
+    MAX_ATTEMPTS = 5
+    RESULT_TTL = 300.0
+
+    def __init__(self, name: str):
+        self.name = name
+
+        self._ready = deque()
+        self._in_flight = {}  # type: Dict[str, WorkItem]
+        self._timeouts = []  # heap of (deadline, id) for the items in flight, stale entries are skipped
+        self._results = {}  # id -> (time the result was stored, result record)
+
+        self._condition = threading.Condition()
+
+        self.stats = {"enqueued": 0, "delivered": 0, "redelivered": 0, "acked": 0, "failed": 0}
+
+    def enqueue(self, task: str, args: dict) -> str:
+        item = WorkItem(task, args)
+
+        with self._condition:
+            self._ready.append(item)
+            self.stats["enqueued"] += 1
+            self._condition.notify_all()
+
+        return item.id
+
+    def pull(self, worker: str, max_items: int, visibility: float, wait: float) -> List[dict]:
+        """
+            Take up to max_items items, waiting up to wait seconds for the first one
+
+        :param worker: who the items are delivered to, for status only
+        :param max_items: how many items the worker has capacity for
+        :param visibility: seconds the worker has to ack an item before it is delivered again
+        :param wait: seconds to wait when there are no items
+        """
+        end = time.monotonic() + wait
+
+        with self._condition:
+            self._expire()
+
+            while not self._ready:
+                remaining = end - time.monotonic()
+                if remaining <= 0:
+                    return []
+
+                self._condition.wait(min(remaining, self._next_timeout()))
+                self._expire()
+
+            items = []
+            deadline = time.monotonic() + visibility
+
+            while self._ready and len(items) < max_items:
+                item = self._ready.popleft()
+                item.attempts += 1
+                item.worker = worker
+                item.deadline = deadline
+
+                self._in_flight[item.id] = item
+                heapq.heappush(self._timeouts, (deadline, item.id))
+                items.append(item.describe())
+
+            self.stats["delivered"] += len(items)
+            return items
+
+    def ack(self, item_id: str, result, error: Optional[dict]) -> bool:
+        """
+            Complete an item in flight
+
+        :return: False if the item was not in flight, it timed out and was redelivered or was already acked
+        """
+        with self._condition:
+            if self._in_flight.pop(item_id, None) is None:
+                return False
+
+            self._store(item_id, {"done": True, "result": result, "error": error})
+            self.stats["acked"] += 1
+            return True
+
+    def result(self, item_id: str, wait: float) -> dict:
+        """
+            Collect the result of an item, waiting up to wait seconds for it. A collected result is forgotten
+
+        :return: {"done": False} if the item has not completed yet
+        """
+        end = time.monotonic() + wait
+
+        with self._condition:
+            while True:
+                # expiring may fail the item itself, check for its result after that
+                self._expire()
+
+                if item_id in self._results:
+                    return self._results.pop(item_id)[1]
+
+                remaining = end - time.monotonic()
+                if remaining <= 0:
+                    return {"done": False}
+
+                self._condition.wait(min(remaining, self._next_timeout()))
+
+    def _store(self, item_id: str, record: dict) -> None:
+        now = time.monotonic()
+        self._results[item_id] = (now, record)
+
+        # results are stored in time order, so the expired ones are at the start
+        while self._results:
+            old_id = next(iter(self._results))
+            if now - self._results[old_id][0] < self.RESULT_TTL:
+                break
+            del self._results[old_id]
+
+        self._condition.notify_all()
+
+    def _next_timeout(self) -> float:
+        return max(self._timeouts[0][0] - time.monotonic(), 0.0) if self._timeouts else self.RESULT_TTL
+
+    def _expire(self) -> None:
+        """Put every item whose visibility timeout passed back in the queue"""
+        now = time.monotonic()
+
+        while self._timeouts and self._timeouts[0][0] <= now:
+            deadline, item_id = heapq.heappop(self._timeouts)
+            item = self._in_flight.get(item_id)
+
+            if item is None or item.deadline != deadline:
+                continue  # acked, or delivered again since
+
+            del self._in_flight[item_id]
+
+            if item.attempts >= self.MAX_ATTEMPTS:
+                message = "'{}/{}' was not acked after {} deliveries".format(self.name, item.task, item.attempts)
+                self._store(item_id, {"done": True, "result": None,
+                                      "error": {"err_type": "TimeoutError", "message": message}})
+                self.stats["failed"] += 1
+            else:
+                self._ready.appendleft(item)
+                self.stats["redelivered"] += 1
+                self._condition.notify_all()
+
+    def info(self) -> dict:
+        with self._condition:
+            workers = {}
+            for item in self._in_flight.values():
+                workers[item.worker] = workers.get(item.worker, 0) + 1
+
+            return dict(self.stats, ready=len(self._ready), in_flight=workers, results=len(self._results))
+
+
+class Broker:
+    """
+    The work queues of every endpoint name, created when they are first used
+    """
+
+    def __init__(self):
+        self._queues = {}  # type: Dict[str, WorkQueue]
+        self._lock = threading.Lock()
+
+    def get_queue(self, name: str) -> WorkQueue:
+        # endpoint names are not case sensitive, the same as in action types
+        name = name.lower()
+        queue = self._queues.get(name)
+
+        if queue is None:
+            with self._lock:
+                queue = self._queues.setdefault(name, WorkQueue(name))
+
+        return queue
+
+    def info(self) -> dict:
+        return {name: queue.info() for name, queue in list(self._queues.items())}
@@ -1,33 +1,173 @@
 import atexit
+import os
+import queue
 import time
 import sys
-from typing import List
+from threading import Thread
+from typing import Any, Callable, List, Tuple
 from uuid import UUID
 
-from corvus.shared.endpoint import BasicEndpoint, Task
-from corvus.vertex.model import VertexModel
+from corvus.shared.alpha import ActionType
+from corvus.shared.alpha.errors import RemoteException
+from corvus.shared.endpoint import BasicEndpoint, Task, VertexConnection, parse_vertex_addrs
+from corvus.shared.logging import log_debug, log_warning
+from corvus.tools.locks import Limiter
+from corvus.tools.ring import HashRing
+from corvus.vertex.broker import Broker
+from corvus.vertex.model import VertexModel, EndpointInfo
+from corvus.vertex.store import RegistryStore
 
 
 class Vertex(BasicEndpoint):
-    def __init__(self, port: int=9000):
+    """
+    The registry of nodes and endpoints. The registry can be sharded over several Vertex processes, each is given the
+    same ordered list of every vertex in the cluster and its own index in it. Endpoint names are partitioned over the
+    shards with a consistent hash ring, and every shard replicates its endpoints to the next shard on the ring. Nodes
+    are replicated to every shard.
+
+    If a data_dir is given the registry is persisted there, and a restarted Vertex picks up where it left off.
+
+    The Vertex also brokers work queues: callers enqueue invocations under an endpoint name, and workers of that name
+    pull batches of them as they have capacity. Queues live on the shard that owns the name and are not replicated.
+    A pull or a result that waits for its queue holds a thread of the Vertex while it waits, so at most MAX_LONG_POLLS
+    of them wait at once, the others are answered at once with whatever is there.
+    """
+
+    MAX_LONG_POLLS = 64
+
+    def __init__(self, port: int=9000, cluster: List[Tuple[str, int]]=None, shard: int=0, data_dir: str=None):
         super().__init__("vertex", self.run_task_from_flow, port)
 
         self.model = VertexModel()
 
+        if data_dir is not None:
+            self.model.attach_store(RegistryStore(data_dir))
+
+        self.cluster = cluster if cluster is not None else []
+        self.shard = shard
+        self.ring = HashRing(list(range(len(self.cluster)))) if self.cluster else None
+        self._peers = {}
+
+        # names this shard holds as a replica but has been asked about directly because their owner is down, until the
+        # owner replicates to this shard again
+        self._taken_over = set()
+
+        # endpoint name -> {(host, port): name} of the endpoints watching it
+        self._watchers = {}
+        self._watcher_connections = {}
+        self._events = queue.Queue()
+        self.model.on_change.subscribe(self._queue_event)
+        Thread(target=self._push_events, name="Vertex Watch Events", daemon=True).start()
+
         self.add_task(Task(self.connect_node))
         self.add_task(Task(self.disconnect))
         self.add_task(Task(self.start))
         self.add_task(Task(self.status))
-        self.add_task(Task(self.lookup))
-        self.add_task(Task(self.connect_endpoint))
+        # node and socket_path were added later, callers that don't know them yet send the old payloads
+        self.add_task(Task(self.lookup, optional=("node",)))
+        self.add_task(Task(self.connect_endpoint, optional=("node", "socket_path")))
+        self.add_task(Task(self.replicate_node))
+        self.add_task(Task(self.replicate_endpoint, optional=("node", "socket_path")))
+        self.add_task(Task(self.disconnect_endpoint))
+        self.add_task(Task(self.replicate_disconnect_endpoint))
+        self.add_task(Task(self.watch))
+        self.add_task(Task(self.replicate_watch))
+        self.add_task(Task(self.report_load))
+        self.add_task(Task(self.replicate_load))
+
+        self.broker = Broker()
+        self._long_polls = Limiter(self.MAX_LONG_POLLS)
+        self.add_task(Task(self.enqueue))
+        self.add_task(Task(self.pull))
+        self.add_task(Task(self.ack))
+        self.add_task(Task(self.result))
 
     def connect_node(self, resources: dict, host: str, port: int):
         node = self.model.add_node(resources, (host, port))
-        print(node.uuid)
+        log_debug("NODE    {} at {}:{}", node.uuid, host, port)
+
+        # endpoints refer to their node, so every shard needs to know every node
+        data = {"uuid": node.uuid, "resources": resources, "host": host, "port": port}
+        for shard in range(len(self.cluster)):
+            self._replicate(shard, "vertex/replicate_node", data)
+
         return node.uuid
 
-    def connect_endpoint(self, name: str, resources: dict, host: str, port: int, node: UUID):
-        self.model.add_endpoint(name, resources, (host, port), node)
+    def connect_endpoint(self, name: str, resources: dict, host: str, port: int, node: UUID=None,
+                         socket_path: str=None):
+        self._serve(name)
+        self.model.add_endpoint(name, resources, (host, port), node, socket_path)
+
+        if self.ring is not None:
+            data = {"name": name, "resources": resources, "host": host, "port": port, "node": node,
+                    "socket_path": socket_path}
+            for shard in self.ring.get_replicas(name, VertexConnection.REPLICAS):
+                self._replicate(shard, "vertex/replicate_endpoint", data)
+
+    def replicate_node(self, uuid: str, resources: dict, host: str, port: int):
+        self.model.add_node(resources, (host, port), uuid)
+
+    def disconnect_endpoint(self, name: str, host: str, port: int) -> bool:
+        """Remove one replica of an endpoint, watchers are told and lookups stop returning it"""
+        self._serve(name)
+        removed = self.model.remove_endpoint(name, (host, port)) is not None
+
+        if self.ring is not None:
+            data = {"name": name, "host": host, "port": port}
+            for shard in self.ring.get_replicas(name, VertexConnection.REPLICAS):
+                self._replicate(shard, "vertex/replicate_disconnect_endpoint", data)
+
+        return removed
+
+    def replicate_disconnect_endpoint(self, name: str, host: str, port: int):
+        self._taken_over.discard(name)
+        self.model.remove_endpoint(name, (host, port))
+
+    def report_load(self, uuid: str, load: dict) -> bool:
+        """Receives the changes to a node's load, every shard keeps the load of every node"""
+        known = self.model.update_load(uuid, load)
+
+        for shard in range(len(self.cluster)):
+            self._replicate(shard, "vertex/replicate_load", {"uuid": uuid, "load": load})
+
+        return known
+
+    def replicate_load(self, uuid: str, load: dict):
+        self.model.update_load(uuid, load)
+
+    def replicate_endpoint(self, name: str, resources: dict, host: str, port: int, node: UUID=None,
+                           socket_path: str=None):
+        self._taken_over.discard(name)
+        self.model.add_endpoint(name, resources, (host, port), node, socket_path)
+
+    def _serve(self, name: str) -> None:
+        """Called for requests about name sent to this shard directly, a replica only gets them if the owner is down"""
+        if self.ring is not None and self.ring.get(name) != self.shard:
+            self._taken_over.add(name)
+
+    def _pushes_events(self, name: str) -> bool:
+        """
+        Only one shard pushes the events of a name, the owner, or the replica once it has taken over. The events of
+        the replica carry its own epoch, so the watchers load the watch again from it
+        """
+        return self.ring is None or self.ring.get(name) == self.shard or name in self._taken_over
+
+    def _replicate(self, shard: int, action_type: str, data: dict):
+        if shard == self.shard:
+            return
+
+        try:
+            if shard not in self._peers:
+                self._peers[shard] = self.client.connect(self.cluster[shard])
+            self._peers[shard].send(action_type, data)
+        except (ConnectionError, OSError) as e:
+            # the peer is down, it will be missing this entry until it is registered again
+            self._peers.pop(shard, None)
+            log_warning("Could not replicate to vertex shard {} at {}: {}", shard, self.cluster[shard], e)
+        except RemoteException as e:
+            # the peer refused the entry, for example a node it has not seen, the write here still stands
+            message = "Vertex shard {} at {} did not take {}: {}: {}"
+            log_warning(message, shard, self.cluster[shard], action_type, e.err_type, e.message)
 
     def disconnect(self, uuid: str):
         raise NotImplementedError()
@@ -36,24 +176,109 @@ class Vertex(BasicEndpoint):
     def start(self):
         super().start()
 
+    def stop(self):
+        super().stop()
+        self.model.close()
+
     def status(self):
-        return self.model.info()
+        info = self.model.info()
+        info["queues"] = self.broker.info()
+        return info
 
-    def lookup(self, endpoint_name):
+    def lookup(self, endpoint_name, node=None):
+        self._serve(endpoint_name)
         endpoint = self.model.get_available_endpoint(endpoint_name)
 
         if not endpoint:
             return None
 
-        addr = endpoint.address
-        return {"host": addr[0], "port": addr[1]}
+        response = endpoint.describe()
+        response["local"] = node is not None and node == response["node"]
+        return response
+
+    def watch(self, endpoint_name: str, name: str, host: str, port: int):
+        """
+        Subscribe the endpoint at (host, port) to changes to endpoint_name. The current replicas are returned, and every
+        following change is pushed to the subscriber's 'registry_event' task
+        """
+        self._serve(endpoint_name)
+        self._watchers.setdefault(endpoint_name, {})[(host, port)] = name
+
+        # the replicas push the events after a failover, their epoch tells the watcher to load the watch again
+        if self.ring is not None:
+            data = {"endpoint_name": endpoint_name, "name": name, "host": host, "port": port}
+            for shard in self.ring.get_replicas(endpoint_name, VertexConnection.REPLICAS):
+                self._replicate(shard, "vertex/replicate_watch", data)
+
+        return {
+            "epoch": self.model.epoch,
+            "version": self.model.version,
+            "endpoints": [e.describe() for e in self.model.get_endpoints(endpoint_name)]
+        }
+
+    def replicate_watch(self, endpoint_name: str, name: str, host: str, port: int):
+        self._taken_over.discard(endpoint_name)
+        self._watchers.setdefault(endpoint_name, {})[(host, port)] = name
+
+    def enqueue(self, endpoint_name: str, task: str, args: dict) -> str:
+        """Queue a call of endpoint_name's task for a worker to pull, returns the id to collect its result with"""
+        return self.broker.get_queue(endpoint_name).enqueue(task, args)
+
+    def pull(self, endpoint_name: str, worker: str, max_items: int, visibility: float, wait: float) -> List[dict]:
+        """Take up to max_items queued calls, each has to be acked within visibility seconds or it is redelivered"""
+        queue = self.broker.get_queue(endpoint_name)
+        return self._long_poll(lambda w: queue.pull(worker, max_items, visibility, w), wait)
+
+    def ack(self, endpoint_name: str, id: str, result, error: dict) -> bool:
+        """Complete a pulled call with its result, or with the error it raised"""
+        return self.broker.get_queue(endpoint_name).ack(id, result, error)
+
+    def result(self, endpoint_name: str, id: str, wait: float) -> dict:
+        """Collect the result of a queued call, waiting up to wait seconds for it to complete"""
+        queue = self.broker.get_queue(endpoint_name)
+        return self._long_poll(lambda w: queue.result(id, w), wait)
+
+    def _long_poll(self, poll: Callable[[float], Any], wait: float):
+        """Run a poll that waits up to wait seconds, or does not wait if MAX_LONG_POLLS polls are waiting already"""
+        if wait <= 0 or not self._long_polls.try_acquire():
+            return poll(0)
+
+        try:
+            return poll(wait)
+        finally:
+            self._long_polls.release()
+
+    def _queue_event(self, kind: str, version: int, endpoint: EndpointInfo):
+        if endpoint.name in self._watchers and self._pushes_events(endpoint.name):
+            self._events.put({"kind": kind, "name": endpoint.name, "version": version, "endpoint": endpoint.describe(),
+                              "epoch": self.model.epoch})
+
+    def _push_events(self):
+        while True:
+            event = self._events.get()
+
+            for addr, name in list(self._watchers.get(event["name"], {}).items()):
+                try:
+                    if addr not in self._watcher_connections:
+                        self._watcher_connections[addr] = self.client.connect(addr)
+                    self._watcher_connections[addr].send(ActionType(name, "registry_event"), event)
+                except Exception as e:
+                    # the watcher is gone or broken, it has to watch again to get more events
+                    self._watchers[event["name"]].pop(addr, None)
+                    self._watcher_connections.pop(addr, None)
+                    log_warning("Dropped watcher {} of '{}': {}", name, event["name"], e)
 
 
 if __name__ == '__main__':
-    if len(sys.argv) > 2:
-        vertex = Vertex(int(sys.argv[2]))
+    data_dir = os.environ.get("CORVUS_VERTEX_DATA", None)
+
+    if len(sys.argv) > 4:
+        # sharded registry: port, comma separated host:port of every vertex, index of this vertex in that list
+        vertex = Vertex(int(sys.argv[2]), parse_vertex_addrs(sys.argv[3]), int(sys.argv[4]), data_dir=data_dir)
+    elif len(sys.argv) > 2:
+        vertex = Vertex(int(sys.argv[2]), data_dir=data_dir)
     else:
-        vertex = Vertex()
+        vertex = Vertex(data_dir=data_dir)
 
     atexit.register(vertex.stop)
     vertex.start()
@@ -1,63 +1,312 @@
-import itertools
 import random
-from typing import Tuple
+import time
+from typing import Tuple, List, Optional
 from uuid import uuid4
 
 from corvus.dto import Resources
 from corvus.shared.alpha import RPC
+from corvus.tools.locks import ReadWriteLock
+from corvus.tools.triggers import Event
+from corvus.vertex.store import RegistryStore
 
 
 class NodeInfo:
-    def __init__(self, resources: Resources, address: Tuple[str, int]):
+    def __init__(self, resources: Resources, address: Tuple[str, int], uuid: str=None):
         self.resources = resources
         self.address = address
-        self.uuid = str(uuid4())
+        self.uuid = uuid if uuid is not None else str(uuid4())
 
         self.endpoints = {}
 
+        # the latest load the node reported, see corvus.node.resources. It is not persisted
+        self.load = {}
+        self.load_time = None
+
+    def to_record(self) -> dict:
+        return {"op": "node", "uuid": self.uuid, "resources": self.resources.as_dict(), "address": self.address}
+
+    def describe(self) -> dict:
+        return {
+            "uuid": self.uuid,
+            "address": self.address,
+            "resources": self.resources.as_dict(),
+            "endpoints": sorted(self.endpoints),
+            "load": dict(self.load),
+            "load_time": self.load_time
+        }
+
 
 class EndpointInfo:
-    def __init__(self, parent: NodeInfo, address: Tuple[str, int], name: str, resources: Resources):
+    def __init__(self, parent: NodeInfo, address: Tuple[str, int], name: str, resources: Resources,
+                 socket_path: str=None, uuid: str=None):
         self.parent = parent
         self.resources = resources
         self.address = address
-        self.uuid = str(uuid4())
+        self.socket_path = socket_path
+        self.uuid = uuid if uuid is not None else str(uuid4())
         self.name = name
 
+    def to_record(self) -> dict:
+        return {
+            "op": "endpoint",
+            "uuid": self.uuid,
+            "name": self.name,
+            "resources": self.resources.as_dict(),
+            "address": self.address,
+            "node": self.parent.uuid if self.parent else None,
+            "socket_path": self.socket_path
+        }
+
+    def describe(self) -> dict:
+        """How a client connects to this endpoint"""
+        return {
+            "uuid": self.uuid,
+            "host": self.address[0],
+            "port": self.address[1],
+            "node": self.parent.uuid if self.parent else None,
+            "socket": self.socket_path
+        }
+
 
 class VertexModel:
+    """
+    The registry of nodes and endpoints. When a RegistryStore is attached every mutation is logged to it, and the
+    registry is restored from it on startup. Endpoints in the store's snapshot are only loaded when their name is first
+    used, so a restarted Vertex can answer lookups before it has read the whole snapshot.
+
+    on_change is invoked with (kind, version, endpoint) whenever an endpoint is added or removed, kind is "add" or
+    "remove" and version increases with every change. Versions are only comparable within one epoch: every model
+    starts a new epoch at 0, so a restarted or failed over Vertex is told apart from the one before it.
+
+    The model is shared by every server thread of the Vertex. Lookups hold the read lock, so they run concurrently,
+    and mutations hold the write lock.
+    """
 
     def __init__(self):
         self._nodes = {}
-        self._global_endpoints = {}
+        self._endpoints = {}  # endpoint name -> every EndpointInfo with that name
+
+        self._store = None
+        self._snapshot = None
+
+        self.epoch = uuid4().hex
+        self.version = 0
+        self.on_change = Event()
+
+        self.lock = ReadWriteLock()
+
+    def attach_store(self, store: RegistryStore) -> None:
+        """Restore the registry from the store, then log every following mutation to it"""
+        with self.lock.write():
+            self._attach_store(store)
+
+    def _attach_store(self, store: RegistryStore) -> None:
+        self._snapshot = store.load_snapshot()
+
+        if self._snapshot is not None:
+            for record in self._snapshot.nodes:
+                self._apply(record)
+
+        for record in store.replay():
+            self._apply(record)
+
+        store.open()
+        self._store = store
+
+    def _apply(self, record: dict) -> None:
+        op = record["op"]
+
+        if op == "node":
+            self._add_node(record["resources"], tuple(record["address"]), record["uuid"])
+        elif op == "endpoint":
+            self._add_endpoint(record["name"], record["resources"], tuple(record["address"]), record["node"],
+                               record["socket_path"], record["uuid"])
+        elif op == "remove_node":
+            self._remove_node(record["uuid"])
+        elif op == "remove_endpoint":
+            self._remove_endpoint(record["name"], tuple(record["address"]))
+
+    def _record(self, record: dict) -> None:
+        if self._store is not None and self._store.append(record):
+            self._compact()
+
+    def add_node(self, resources, addr, uuid=None) -> NodeInfo:
+        with self.lock.write():
+            return self._add_node(resources, addr, uuid)
 
-    def add_node(self, resources, addr) -> NodeInfo:
-        node = NodeInfo(Resources(resources), addr)
-        self._nodes[node.uuid] = node
+    def _add_node(self, resources, addr, uuid) -> NodeInfo:
+        if uuid in self._nodes:
+            # a known node registering again keeps its endpoints
+            node = self._nodes[uuid]
+            node.resources = Resources(resources)
+            node.address = tuple(addr)
+        else:
+            node = NodeInfo(Resources(resources), tuple(addr), uuid)
+            self._nodes[node.uuid] = node
+
+        self._record(node.to_record())
         return node
 
-    def add_endpoint(self, name, resources, addr, node_uuid) -> EndpointInfo:
+    def add_endpoint(self, name, resources, addr, node_uuid, socket_path=None, uuid=None) -> EndpointInfo:
+        with self.lock.write():
+            return self._add_endpoint(name, resources, addr, node_uuid, socket_path, uuid)
+
+    def _add_endpoint(self, name, resources, addr, node_uuid, socket_path, uuid) -> EndpointInfo:
+        endpoint = self._insert_endpoint(name, resources, addr, node_uuid, socket_path, uuid)
+        self._record(endpoint.to_record())
+        self._notify("add", endpoint)
+        return endpoint
+
+    def _notify(self, kind: str, endpoint: EndpointInfo) -> None:
+        self.version += 1
+        self.on_change.invoke(kind, self.version, endpoint)
+
+    def _insert_endpoint(self, name, resources, addr, node_uuid, socket_path, uuid) -> EndpointInfo:
+        endpoints = self._get_endpoints(name)
+
         node = self._nodes[node_uuid] if node_uuid else None
-        endpoint = EndpointInfo(node, addr, name, Resources(resources))
+        endpoint = EndpointInfo(node, tuple(addr), name, Resources(resources), socket_path, uuid)
+
+        # registering again at the same address replaces the old registration
+        endpoints[:] = [e for e in endpoints if e.address != endpoint.address]
+        endpoints.append(endpoint)
 
         if node:
-            self._nodes[node_uuid].endpoints[name] = endpoint
-        else:
-            self._global_endpoints[name] = endpoint
+            node.endpoints[name] = endpoint
 
         return endpoint
 
+    def _get_endpoints(self, name: str) -> List[EndpointInfo]:
+        if name not in self._endpoints:
+            self._endpoints[name] = []
+
+            if self._snapshot is not None:
+                for record in self._snapshot.find(name):
+                    self._load_endpoint(record)
+
+        return self._endpoints[name]
+
+    def _load_endpoint(self, record: dict) -> None:
+        if record["node"] and record["node"] not in self._nodes:
+            return  # the node was removed after the snapshot was written
+
+        self._insert_endpoint(record["name"], record["resources"], record["address"], record["node"],
+                              record["socket_path"], record["uuid"])
+
+    def _load_all(self) -> None:
+        """Load every endpoint that is still only in the snapshot"""
+        if self._snapshot is None:
+            return
+
+        snapshot = self._snapshot
+        self._snapshot = None
+
+        loaded = set(self._endpoints)
+        for record in snapshot.records():
+            if record["name"] not in loaded:
+                self._endpoints.setdefault(record["name"], [])
+                self._load_endpoint(record)
+
+        snapshot.close()
+
     def remove_node(self, uuid: str) -> NodeInfo:
-        return self._nodes.pop(uuid)
+        with self.lock.write():
+            return self._remove_node(uuid)
+
+    def _remove_node(self, uuid: str) -> NodeInfo:
+        node = self._nodes.pop(uuid)
+
+        removed = []
+        for name in node.endpoints:
+            endpoints = self._endpoints.get(name, [])
+            removed.extend(e for e in endpoints if e.parent is node)
+            endpoints[:] = [e for e in endpoints if e.parent is not node]
+
+        self._record({"op": "remove_node", "uuid": uuid})
+
+        for endpoint in removed:
+            self._notify("remove", endpoint)
+
+        return node
+
+    def update_load(self, uuid: str, load: dict) -> bool:
+        """
+        Apply the changes to a node's load that it reported, a value of None removes the key
+
+        :return: False if the node is not known
+        """
+        with self.lock.write():
+            node = self._nodes.get(uuid, None)
+
+            if node is None:
+                return False
+
+            for key, value in load.items():
+                if value is None:
+                    node.load.pop(key, None)
+                else:
+                    node.load[key] = value
+
+            node.load_time = time.time()
+            return True
+
+    def remove_endpoint(self, name: str, addr: Tuple[str, int]) -> Optional[EndpointInfo]:
+        with self.lock.write():
+            return self._remove_endpoint(name, addr)
+
+    def _remove_endpoint(self, name: str, addr: Tuple[str, int]) -> Optional[EndpointInfo]:
+        endpoints = self._get_endpoints(name)
+        removed = [e for e in endpoints if e.address == addr]
+
+        if not removed:
+            return None
+
+        endpoint = removed[0]
+        endpoints.remove(endpoint)
+
+        if endpoint.parent is not None and endpoint.parent.endpoints.get(name) is endpoint:
+            del endpoint.parent.endpoints[name]
+
+        self._record({"op": "remove_endpoint", "name": name, "address": addr})
+        self._notify("remove", endpoint)
+        return endpoint
+
+    def compact(self) -> None:
+        """Write the whole registry to the store's snapshot, and start a new log"""
+        with self.lock.write():
+            self._compact()
+
+    def _compact(self) -> None:
+        self._load_all()
+
+        nodes = [node.to_record() for node in self._nodes.values()]
+        endpoints = [e.to_record() for endpoints in self._endpoints.values() for e in endpoints]
+        self._store.compact(nodes, endpoints)
+
+    def close(self) -> None:
+        with self.lock.write():
+            if self._snapshot is not None:
+                self._snapshot.close()
+                self._snapshot = None
+
+            if self._store is not None:
+                self._store.close()
 
     def run(self, rpc: RPC):
         next(iter(self._nodes)).start(rpc)
 
-    def get_available_endpoint(self, name):
-        all_endpoints = itertools.chain(*map(lambda n: list(n.endpoints.values()), self._nodes.values()))
-        all_endpoints = itertools.chain(all_endpoints, self._global_endpoints.values())
+    def get_endpoints(self, name) -> List[EndpointInfo]:
+        with self.lock.read():
+            endpoints = self._endpoints.get(name, None)
+            if endpoints is not None:
+                return list(endpoints)
+
+        # the name still has to be loaded from the snapshot, which changes the model
+        with self.lock.write():
+            return list(self._get_endpoints(name))
 
-        endpoints = list(filter(lambda e: e.name == name, all_endpoints))
+    def get_available_endpoint(self, name):
+        endpoints = self.get_endpoints(name)
 
         if not endpoints:
             return None
@@ -67,6 +316,113 @@ class VertexModel:
         return random.choice(endpoints)
 
     def info(self):
-        return {
-            "nodes": self._nodes
-        }
+        with self.lock.write():
+            self._load_all()
+
+        with self.lock.read():
+            return {
+                "nodes": {uuid: node.describe() for uuid, node in self._nodes.items()},
+                "lock": dict(self.lock.stats)
+            }
+
+
+def _serve_shard(shard: int, shards: int, endpoints: int, path: str, ready) -> None:
+    """One shard of the benchmark, holds the endpoint names the ring gives it and answers lookups on a Unix socket"""
+    from corvus.shared.alpha import Flow
+    from corvus.shared.com.unix import UnixServer
+    from corvus.tools.ring import HashRing
+
+    ring = HashRing(list(range(shards)))
+    model = VertexModel()
+    node = model.add_node({}, ("10.0.0.1", 8000))
+
+    for i in range(endpoints):
+        name = "endpoint-{}".format(i)
+        if ring.get(name) == shard:
+            model.add_endpoint(name, {}, ("10.0.0.1", 10000 + i), node.uuid)
+
+    def handle(data: bytes) -> bytes:
+        request = Flow.from_bytes(data)
+        endpoint = model.get_available_endpoint(request.get_content()["endpoint_name"])
+        return Flow(request.action_type, "OKAY", endpoint.describe()).to_bytes()
+
+    UnixServer(handle, path).open()
+    ready.set()
+
+    while True:
+        time.sleep(1)
+
+
+def _run_lookups(paths: List[str], endpoints: int, start, seconds: float, counts) -> None:
+    """One client of the benchmark, sends lookups for random names to the shard that owns each name"""
+    from corvus.shared.alpha import ActionType, Flow
+    from corvus.shared.com.unix import UnixClientConnection
+    from corvus.tools.ring import HashRing
+
+    ring = HashRing(list(range(len(paths))))
+    connections = [UnixClientConnection(path) for path in paths]
+    action_type = ActionType("vertex", "lookup")
+    names = ["endpoint-{}".format(i) for i in range(endpoints)]
+
+    start.wait()
+    end = time.perf_counter() + seconds
+    count = 0
+
+    while time.perf_counter() < end:
+        name = random.choice(names)
+        request = Flow(action_type, "ASK", {"endpoint_name": name, "node": None}).to_bytes()
+        Flow.from_bytes(connections[ring.get(name)].send(request)).get_content()
+        count += 1
+
+    counts.put(count)
+
+
+def benchmark(clients: int=4, endpoints: int=10000, seconds: float=2.0) -> None:
+    """
+        Measure lookup throughput over loopback as the registry is split over more shards. Every shard is a process
+        with its part of the registry behind a Unix domain socket, clients route each lookup with the hash ring like
+        VertexConnection does. The Alpha encoding and the model lookup are the ones the Vertex uses, only the transport
+        is the Unix socket endpoints on one node use instead of parseltongue
+    """
+    import multiprocessing
+    import os
+    import tempfile
+
+    context = multiprocessing.get_context("fork")
+    print("{} cpus, {} clients, {} endpoints".format(os.cpu_count(), clients, endpoints))
+
+    for shards in (1, 2, 4):
+        paths = [os.path.join(tempfile.gettempdir(), "corvus-bench-{}-{}.sock".format(os.getpid(), shard))
+                 for shard in range(shards)]
+        processes = []
+
+        for shard, path in enumerate(paths):
+            ready = context.Event()
+            process = context.Process(target=_serve_shard, args=(shard, shards, endpoints, path, ready), daemon=True)
+            process.start()
+            ready.wait()
+            processes.append(process)
+
+        start = context.Event()
+        counts = context.Queue()
+        for _ in range(clients):
+            process = context.Process(target=_run_lookups, args=(paths, endpoints, start, seconds, counts),
+                                      daemon=True)
+            process.start()
+            processes.append(process)
+
+        start.set()
+        total = sum(counts.get() for _ in range(clients))
+        print("{} shards {:12.0f} lookups/s".format(shards, total / seconds))
+
+        for process in processes:
+            process.terminate()
+            process.join()
+
+        for path in paths:
+            os.unlink(path)
+
+
+if __name__ == '__main__':
+    import sys
+    benchmark(*(int(arg) for arg in sys.argv[1:3]))
@@ -0,0 +1,220 @@
+import json
+import mmap
+import os
+import sys
+import tempfile
+import time
+from typing import Iterator, List, Optional
+
+
+class Snapshot:
+    """
+    A compacted registry, opened with mmap. Node lines are read when the snapshot is opened, endpoint lines are sorted
+    by name and found by binary search over the mapped file, so opening a snapshot does not depend on its size.
+
+    Each line is either "N <node json>" or "E <endpoint name>\t<endpoint json>", all node lines come first.
+    """
+
+    def __init__(self, path: str):
+        self._file = open(path, "rb")
+        self._size = os.fstat(self._file.fileno()).st_size
+        self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if self._size else b""
+
+        self.nodes = []
+
+        pos = 0
+        while pos < self._size and self._mm[pos:pos + 2] == b"N ":
+            end = self._mm.find(b"\n", pos)
+            self.nodes.append(json.loads(self._mm[pos + 2:end].decode()))
+            pos = end + 1
+
+        self._start = pos  # offset of the first endpoint line
+
+    def find(self, name: str) -> List[dict]:
+        """
+            Find the records of every endpoint with the given name
+
+        :param name: the endpoint name
+        :return: the endpoint records, in the order they were written
+        """
+        key = name.encode()
+        mm = self._mm
+
+        # binary search for the first line whose name is >= key, lo and hi are always line starts
+        lo, hi = self._start, self._size
+        while lo < hi:
+            mid = (lo + hi) // 2
+            line_start = max(mm.rfind(b"\n", 0, mid) + 1, lo)
+            line_end = mm.find(b"\n", line_start)
+
+            if mm[line_start + 2:mm.find(b"\t", line_start)] < key:
+                lo = line_end + 1
+            else:
+                hi = line_start
+
+        records = []
+        pos = lo
+        while pos < self._size:
+            tab = mm.find(b"\t", pos)
+            if mm[pos + 2:tab] != key:
+                break
+
+            end = mm.find(b"\n", tab)
+            records.append(json.loads(mm[tab + 1:end].decode()))
+            pos = end + 1
+
+        return records
+
+    def records(self) -> Iterator[dict]:
+        """Iterate over every endpoint record in the snapshot"""
+        pos = self._start
+        while pos < self._size:
+            tab = self._mm.find(b"\t", pos)
+            end = self._mm.find(b"\n", tab)
+            yield json.loads(self._mm[tab + 1:end].decode())
+            pos = end + 1
+
+    def close(self) -> None:
+        if self._size:
+            self._mm.close()
+        self._file.close()
+
+    @staticmethod
+    def write(path: str, nodes: List[dict], endpoints: List[dict]) -> None:
+        """
+            Atomically replace the snapshot at path
+
+        :param path: where the snapshot is stored
+        :param nodes: the node records
+        :param endpoints: the endpoint records, they must have a "name"
+        """
+        temp_path = path + ".tmp"
+
+        with open(temp_path, "wb") as file:
+            for node in nodes:
+                file.write(b"N " + json.dumps(node).encode() + b"\n")
+
+            for endpoint in sorted(endpoints, key=lambda e: e["name"].encode()):
+                file.write(b"E " + endpoint["name"].encode() + b"\t" + json.dumps(endpoint).encode() + b"\n")
+
+            file.flush()
+            os.fsync(file.fileno())
+
+        os.replace(temp_path, path)
+
+
+class RegistryStore:
+    """
+    Persists the Vertex registry in a directory as a snapshot, plus an append-only log of every mutation made since the
+    snapshot was written. Once the log has compact_every records the owner should call compact().
+    """
+
+    def __init__(self, directory: str, compact_every: int=10000, sync: bool=False):
+        os.makedirs(directory, exist_ok=True)
+
+        self.snapshot_path = os.path.join(directory, "registry.snapshot")
+        self.log_path = os.path.join(directory, "registry.log")
+        self.compact_every = compact_every
+        self.sync = sync
+
+        self._log = None
+        self._appended = 0
+        self._good_size = None  # bytes of the log up to the end of its last complete record, once replayed
+
+    def load_snapshot(self) -> Optional[Snapshot]:
+        if not os.path.exists(self.snapshot_path):
+            return None
+
+        return Snapshot(self.snapshot_path)
+
+    def replay(self) -> Iterator[dict]:
+        """Iterate over the logged records, in the order they were appended"""
+        if not os.path.exists(self.log_path):
+            return
+
+        self._good_size = 0
+
+        with open(self.log_path, "rb") as file:
+            for line in file:
+                if not line.endswith(b"\n"):
+                    break  # the vertex died while writing this record, it was never acknowledged
+
+                self._appended += 1
+                self._good_size += len(line)
+                yield json.loads(line.decode())
+
+    def open(self) -> None:
+        # cut off a partly written record, otherwise the next record is appended to it and both are lost on replay
+        if self._good_size is not None and os.path.getsize(self.log_path) > self._good_size:
+            os.truncate(self.log_path, self._good_size)
+
+        self._log = open(self.log_path, "ab")
+
+    def append(self, record: dict) -> bool:
+        """
+            Append a record to the log
+
+        :param record: the mutation to record
+        :return: True if the log has grown enough that it should be compacted
+        """
+        self._log.write(json.dumps(record).encode() + b"\n")
+        self._log.flush()
+
+        if self.sync:
+            os.fsync(self._log.fileno())
+
+        self._appended += 1
+        return self._appended >= self.compact_every
+
+    def compact(self, nodes: List[dict], endpoints: List[dict]) -> None:
+        """Write the full registry to the snapshot and empty the log"""
+        Snapshot.write(self.snapshot_path, nodes, endpoints)
+
+        if self._log is not None:
+            self._log.close()
+
+        self._log = open(self.log_path, "wb")
+        self._appended = 0
+
+    def close(self) -> None:
+        if self._log is not None:
+            self._log.close()
+            self._log = None
+
+
+def benchmark(entries: int=100000) -> None:
+    """Time how long a restarted VertexModel takes to answer its first lookup from a snapshot with many entries"""
+    from corvus.vertex.model import VertexModel
+
+    with tempfile.TemporaryDirectory() as directory:
+        model = VertexModel()
+        model.attach_store(RegistryStore(directory, compact_every=entries * 2))
+
+        node_uuids = [model.add_node({}, ("10.0.0.{}".format(i), 8000)).uuid for i in range(100)]
+
+        start = time.perf_counter()
+        for i in range(entries):
+            model.add_endpoint("endpoint-{}".format(i), {}, ("10.0.0.{}".format(i % 100), 10000 + i),
+                               node_uuids[i % 100])
+        print("log {} registrations       {:10.2f}ms".format(entries, 1000 * (time.perf_counter() - start)))
+
+        start = time.perf_counter()
+        model.compact()
+        print("compact to snapshot           {:10.2f}ms".format(1000 * (time.perf_counter() - start)))
+        model.close()
+
+        start = time.perf_counter()
+        restarted = VertexModel()
+        restarted.attach_store(RegistryStore(directory))
+        endpoint = restarted.get_available_endpoint("endpoint-{}".format(entries // 2))
+        print("restart to first lookup       {:10.2f}ms".format(1000 * (time.perf_counter() - start)))
+        assert endpoint is not None
+
+        start = time.perf_counter()
+        restarted.info()
+        print("restart to full registry      {:10.2f}ms".format(1000 * (time.perf_counter() - start)))
+        restarted.close()
+
+
+if __name__ == '__main__':
+    benchmark(int(sys.argv[1]) if len(sys.argv) > 1 else 100000)